@@ -0,0 +1,134 @@
+import os, time, threading, requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from instrumentation import span
+import governor
+load_dotenv()
+
+# ---------- CONFIG ----------
+AIRTABLE_TOKEN = os.environ.get("AIRTABLE_API_KEY")
+BASE_ID = os.environ.get("AIRTABLE_BASE_ID")
+API_URL = os.environ.get("AIRTABLE_API_URL", "https://api.airtable.com/v0")
+CACHE_TTL = int(os.environ.get("AIRTABLE_CACHE_TTL", 300))  # seconds, 0 disables caching
+PAGE_SIZE = 100
+BATCH_SIZE = 10  # Airtable accepts at most 10 records per write request
+
+# One keep-alive session shared by every module talking to Airtable
+session = requests.Session()
+session.headers.update({"Authorization": f"Bearer {AIRTABLE_TOKEN}"})
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def request(method, url, idempotent=None, **kwargs):
+    """Send through the shared session under the Airtable limits of the request governor"""
+    with span("airtable", method=method):
+        return governor.request("airtable", session, method, url, idempotent=idempotent, **kwargs)
+
+# (table, formula, fields, sort, max_records) -> {"fetched_at", "records"}
+_cache = {}
+_cache_lock = threading.Lock()
+
+# ---------- READS ----------
+
+def table_url(table):
+    return f"{API_URL}/{BASE_ID}/{table}"
+
+def _cache_key(table, formula, fields, sort, max_records):
+    return (table, formula or "", tuple(fields or ()), tuple(sort or ()), max_records or 0)
+
+def _fetch_pages(table, params):
+    """Follow offset pagination and return every record"""
+    params = {**params, "pageSize": PAGE_SIZE}
+    records = []
+    while True:
+        res = request("GET", table_url(table), params=params)
+        res.raise_for_status()
+        data = res.json()
+        records.extend(data.get("records", []))
+        if not data.get("offset"):
+            return records
+        params["offset"] = data["offset"]
+
+def fetch_records(table, formula=None, fields=None, sort=None, max_records=None, ttl=None):
+    """Fetch all matching records ({"id", "fields", ...}) with field projection and caching.
+
+    sort is a list of (field, "asc"|"desc") pairs. Results are cached per
+    (table, formula, fields, sort, max_records) for ttl seconds.
+    """
+    ttl = CACHE_TTL if ttl is None else ttl
+    key = _cache_key(table, formula, fields, sort, max_records)
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry and ttl and time.monotonic() - entry["fetched_at"] < ttl:
+        return entry["records"]
+
+    params = {}
+    if formula:
+        params["filterByFormula"] = formula
+    if fields:
+        params["fields[]"] = list(fields)
+    if max_records:
+        params["maxRecords"] = max_records
+    for i, (field, direction) in enumerate(sort or ()):
+        params[f"sort[{i}][field]"] = field
+        params[f"sort[{i}][direction]"] = direction
+
+    records = _fetch_pages(table, params)
+    if ttl:
+        with _cache_lock:
+            _cache[key] = {"fetched_at": time.monotonic(), "records": records}
+    return records
+
+def fetch_table(table, formula=None, fields=None, sort=None, max_records=None, ttl=None):
+    """Same as fetch_records but returns only the field dicts"""
+    records = fetch_records(table, formula, fields, sort, max_records, ttl)
+    return [r["fields"] for r in records]
+
+def invalidate(table=None):
+    """Drop cached reads for one table (or all tables)"""
+    with _cache_lock:
+        for key in [k for k in _cache if table is None or k[0] == table]:
+            del _cache[key]
+
+# ---------- WRITES ----------
+
+def _write_batches(method, table, records, extra=None):
+    """Send record payloads 10 at a time, returns the records Airtable echoes back"""
+    written = []
+    for i in range(0, len(records), BATCH_SIZE):
+        payload = {"records": records[i:i + BATCH_SIZE], **(extra or {})}
+        # PATCH updates and upserts land on the same records when repeated; POST creates do not
+        res = request(method, table_url(table), json=payload, idempotent=method != "POST")
+        res.raise_for_status()
+        written.extend(res.json().get("records", []))
+    invalidate(table)
+    return written
+
+def create_record(table, fields):
+    res = request("POST", table_url(table), json={"fields": fields})
+    res.raise_for_status()
+    invalidate(table)
+    return res.json()
+
+def create_records(table, rows, typecast=False):
+    """Create rows (field dicts) in batches of 10, returns created records"""
+    return _write_batches("POST", table, [{"fields": f} for f in rows], {"typecast": typecast})
+
+def update_records(table, records, typecast=False):
+    """Patch {"id", "fields"} records in batches of 10, returns updated records"""
+    payload = [{"id": r["id"], "fields": r["fields"]} for r in records]
+    return _write_batches("PATCH", table, payload, {"typecast": typecast})
+
+def upsert_records(table, rows, merge_on, typecast=False):
+    """Create-or-update rows matched on the merge_on fields, so reruns don't duplicate"""
+    extra = {"performUpsert": {"fieldsToMergeOn": list(merge_on)}, "typecast": typecast}
+    return _write_batches("PATCH", table, [{"fields": f} for f in rows], extra)
+
+def delete_records(table, record_ids):
+    """Delete records by id in batches of 10"""
+    for i in range(0, len(record_ids), BATCH_SIZE):
+        batch = record_ids[i:i + BATCH_SIZE]
+        res = request("DELETE", table_url(table), params={"records[]": batch})
+        res.raise_for_status()
+    invalidate(table)
@@ -0,0 +1,249 @@
+import os, json, time, sqlite3, logging, threading
+from datetime import datetime, timezone, timedelta
+import airtable_client
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+MIRROR_DB = os.environ.get("AIRTABLE_MIRROR_DB", ".cache/airtable_mirror.sqlite3")
+MAX_STALENESS = int(os.environ.get("AIRTABLE_MIRROR_MAX_STALENESS", 900))  # seconds a read may lag Airtable before it syncs inline
+SYNC_INTERVAL = int(os.environ.get("AIRTABLE_MIRROR_SYNC_INTERVAL", 120))  # seconds between background delta syncs
+SYNC_OVERLAP = timedelta(minutes=5)  # guards delta syncs against clock skew between us and Airtable
+
+# Mirrored tables: fields copied into their own columns for filtering and
+# sorting, and the indexes over them. The first column doubles as the small
+# field used to list live record ids when detecting deletes.
+TABLES = {
+    "products": (("line",), (("line",),)),
+    "trends": (("date", "country", "keyword", "score"), (("date",), ("country", "date"), ("score",))),
+    "content_backlog": (("title",), (("title",),)),
+    "faq_queries": (("Question",), ()),
+}
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    tbl TEXT PRIMARY KEY,
+    synced_at TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+# Sync bookkeeping per table: last successful sync (time.time()) seen by this process
+_checked = {}
+_sync_locks = {table: threading.Lock() for table in TABLES}
+_local = threading.local()
+
+# Started on first read so gunicorn's preloaded master never owns the sync thread
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def quote(column):
+    return f'"{column}"'
+
+def table_schema(table):
+    columns, indexes = TABLES[table]
+    cols = "".join(", " + quote(c) for c in columns)
+    statements = [
+        f'CREATE TABLE IF NOT EXISTS "{table}" (id TEXT PRIMARY KEY, fields TEXT NOT NULL, mirrored_at REAL NOT NULL{cols})',
+        f'CREATE INDEX IF NOT EXISTS "{table}_mirrored_at" ON "{table}" (mirrored_at)',
+    ]
+    for index in indexes:
+        name = "_".join((table, *index))
+        statements.append(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({", ".join(map(quote, index))})')
+    return ";\n".join(statements) + ";"
+
+def connect():
+    """One connection per thread, reused so a read costs a query and not a connect"""
+    db = getattr(_local, "db", None)
+    if db is None or _local.pid != os.getpid():
+        os.makedirs(os.path.dirname(MIRROR_DB) or ".", exist_ok=True)
+        db = sqlite3.connect(MIRROR_DB, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA + "".join(table_schema(t) for t in TABLES))
+        _local.db, _local.pid = db, os.getpid()
+    return db
+
+def _row(table, record, mirrored_at):
+    fields = record.get("fields", {})
+    columns, _ = TABLES[table]
+    return (record["id"], json.dumps(fields, ensure_ascii=False), mirrored_at, *(fields.get(c) for c in columns))
+
+def _apply(table, records=(), deletes=(), replace=False):
+    """Write Airtable records (and removals) into the mirror in one transaction"""
+    columns, _ = TABLES[table]
+    names = ", ".join(["id", "fields", "mirrored_at", *map(quote, columns)])
+    marks = ", ".join("?" * (len(columns) + 3))
+    now = time.time()
+    db = connect()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        if replace:
+            db.execute(f'DELETE FROM "{table}"')
+        db.executemany(f'INSERT OR REPLACE INTO "{table}" ({names}) VALUES ({marks})', [_row(table, r, now) for r in records])
+        db.executemany(f'DELETE FROM "{table}" WHERE id = ?', [(i,) for i in deletes])
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+
+# ---------- SYNC ----------
+
+def sync_state(table):
+    row = connect().execute("SELECT synced_at, checked_at FROM sync_state WHERE tbl = ?", (table,)).fetchone()
+    return row or (None, None)
+
+def sync(table, full=False, min_interval=0):
+    """Pull changes from Airtable into the mirror.
+
+    The first sync (or full=True) copies the whole table; later ones fetch
+    only records modified since the previous sync, plus the live id list to
+    drop deleted records. Skips the work when this or another process synced
+    within min_interval seconds. Returns the number of records written.
+    """
+    with _sync_locks[table]:
+        synced_at, checked_at = sync_state(table)
+        if checked_at and time.time() - checked_at < min_interval:
+            _checked[table] = checked_at
+            return 0
+        started = datetime.now(timezone.utc)
+        if full or not synced_at:
+            records = airtable_client.fetch_records(table, ttl=0)
+            _apply(table, records, replace=True)
+            deleted = 0
+        else:
+            since = (datetime.fromisoformat(synced_at) - SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            records = airtable_client.fetch_records(table, formula=f"IS_AFTER(LAST_MODIFIED_TIME(), '{since}')", ttl=0)
+            id_field = TABLES[table][0][0]
+            live = {r["id"] for r in airtable_client.fetch_records(table, fields=[id_field], ttl=0)}
+            mirrored = {i for (i,) in connect().execute(f'SELECT id FROM "{table}"')}
+            deletes = mirrored - live
+            _apply(table, records, deletes)
+            deleted = len(deletes)
+        checked_at = time.time()
+        connect().execute(
+            "INSERT OR REPLACE INTO sync_state (tbl, synced_at, checked_at) VALUES (?, ?, ?)",
+            (table, started.isoformat(), checked_at),
+        )
+        _checked[table] = checked_at
+        logger.info(f"Mirror sync {table}: {len(records)} written, {deleted} deleted")
+        return len(records)
+
+def ensure_fresh(table, max_staleness=None):
+    """Sync inline when the mirror is older than the staleness bound.
+
+    If Airtable is unreachable a mirror that has synced before keeps serving
+    its (stale) rows; one that never synced raises.
+    """
+    start_worker()
+    max_staleness = MAX_STALENESS if max_staleness is None else max_staleness
+    if time.time() - _checked.get(table, 0) <= max_staleness:
+        return
+    checked_at = sync_state(table)[1]
+    if checked_at and time.time() - checked_at <= max_staleness:
+        _checked[table] = checked_at  # another process synced it
+        return
+    try:
+        sync(table, min_interval=max_staleness)
+    except Exception as e:
+        if not checked_at:
+            raise
+        logger.warning(f"Mirror sync {table} failed, serving rows from {time.time() - checked_at:.0f}s ago: {e}")
+
+def _sync_forever():
+    while True:
+        for table in TABLES:
+            try:
+                # Several gunicorn workers share the file; whoever synced last wins the interval
+                sync(table, min_interval=SYNC_INTERVAL / 2)
+            except Exception as e:
+                logger.warning(f"Background mirror sync of {table} failed: {e}")
+        time.sleep(SYNC_INTERVAL)
+
+def start_worker():
+    """Start the background delta sync once per process"""
+    global _worker
+    if SYNC_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    with _worker_lock:
+        # is_alive() is False in a forked child, which restarts its own thread
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_sync_forever, name="airtable-mirror", daemon=True)
+            _worker.start()
+
+# ---------- READS ----------
+
+def _where(table, where):
+    """Translate {column: value | [values] | (operator, value)} into SQL"""
+    columns, _ = TABLES[table]
+    clauses, params = [], []
+    for column, value in (where or {}).items():
+        if column not in columns and column != "mirrored_at":
+            raise ValueError(f"{table}.{column} is not mirrored as a column; use one of {columns}")
+        if isinstance(value, (list, set)):
+            value = list(value)
+            clauses.append(f'"{column}" IN ({", ".join("?" * len(value))})')
+            params.extend(value)
+        elif isinstance(value, tuple):
+            op, value = value
+            if op not in OPERATORS:
+                raise ValueError(f"Unsupported operator {op!r}")
+            clauses.append(f'"{column}" {op} ?')
+            params.append(value)
+        else:
+            clauses.append(f'"{column}" = ?')
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def records(table, where=None, sort=None, max_records=None, max_staleness=None):
+    """Mirrored records ({"id", "fields"}) matching where, ordered like airtable_client's sort pairs"""
+    ensure_fresh(table, max_staleness)
+    columns, _ = TABLES[table]
+    sql, params = _where(table, where)
+    order = []
+    for column, direction in sort or ():
+        if column not in columns or direction.lower() not in ("asc", "desc"):
+            raise ValueError(f"Cannot sort {table} by {column} {direction}")
+        order.append(f'"{column}" {direction.upper()}')
+    if order:
+        sql += " ORDER BY " + ", ".join(order)
+    if max_records:
+        sql += f" LIMIT {int(max_records)}"
+    rows = connect().execute(f'SELECT id, fields FROM "{table}"{sql}', params)
+    return [{"id": i, "fields": json.loads(f)} for i, f in rows]
+
+def rows(table, where=None, sort=None, max_records=None, max_staleness=None):
+    """Same as records but returns only the field dicts"""
+    return [r["fields"] for r in records(table, where, sort, max_records, max_staleness)]
+
+def ids(table, max_staleness=None):
+    ensure_fresh(table, max_staleness)
+    return [i for (i,) in connect().execute(f'SELECT id FROM "{table}"')]
+
+# ---------- WRITE-THROUGH ----------
+# Writes go to Airtable first and land in the mirror only once Airtable has
+# accepted them, so the mirror never shows rows Airtable does not have.
+
+def _mirrored(table, written):
+    if table in TABLES and written:
+        _apply(table, written)
+    return written
+
+def create_record(table, fields):
+    return _mirrored(table, [airtable_client.create_record(table, fields)])[0]
+
+def create_records(table, rows, typecast=False):
+    return _mirrored(table, airtable_client.create_records(table, rows, typecast))
+
+def update_records(table, records, typecast=False):
+    return _mirrored(table, airtable_client.update_records(table, records, typecast))
+
+def upsert_records(table, rows, merge_on, typecast=False):
+    return _mirrored(table, airtable_client.upsert_records(table, rows, merge_on, typecast))
+
+def delete_records(table, record_ids):
+    airtable_client.delete_records(table, record_ids)
+    if table in TABLES and record_ids:
+        _apply(table, deletes=record_ids)
@@ -1,57 +1,159 @@
-from flask import Flask, request, jsonify
-import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
 from dotenv import load_dotenv
 import os
 import logging
+import importlib
 
 load_dotenv()
 
-import get_products
-import g_trends
-import article_generator
+import jobs
+import instrumentation
+import markets
+
+# The pipelines (Selenium, pytrends + pandas, OpenAI + NumPy) are imported on first
+# use, so a worker only pays for the routes it actually serves. List modules in
+# PRELOAD_MODULES to import them up front instead, e.g. with gunicorn preload_app
+# so forked workers share them copy-on-write.
+PRELOAD_MODULES = [m.strip() for m in os.environ.get("PRELOAD_MODULES", "").split(",") if m.strip()]
+MAX_BATCH_ARTICLES = int(os.environ.get("MAX_BATCH_ARTICLES", 10))  # articles one /generate_articles call may ask for
 
 app = Flask(__name__)
 
-logging.basicConfig(level=logging.INFO, 
-                    format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+# Same JSON lines as the scraper so stage spans are machine-readable in the Railway logs
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(instrumentation.CustomRailwayLogFormatter())
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
 
+for module in PRELOAD_MODULES:
+    importlib.import_module(module)
 
-# Wrap get_products main logic
-def run_get_products():
-    try:
-        get_products.main()
-    except Exception as e:
-        print("Error in get_products:", e)
+def pipeline(module, name):
+    """module.name as a callable that imports the module when first called"""
+    def run(*args, **kwargs):
+        return getattr(importlib.import_module(module), name)(*args, **kwargs)
+    return run
+
+
+def job_response(job, created, message):
+    body = {
+        "status": message if created else "Identical job already in progress",
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+    }
+    return jsonify(body), 202
 
-# Wrap g_trends main logic
-def run_g_trends():
+def start_job(kind, fn, message, params=None, dedup=False):
     try:
-        g_trends.main()
-    except Exception as e:
-        print("Error in g_trends:", e)
+        job, created = jobs.submit(kind, fn, params, dedup=dedup)
+    except jobs.QueueFull as e:
+        return jsonify({"error": f"Job queue is full: {e}"}), 429
+    return job_response(job, created, message)
 
 @app.route('/')
 def health_check():
     return jsonify({"status": "API is running"})
 
+def market_param():
+    """Market code from ?market= or the JSON body, None when absent; raises UnknownMarket"""
+    market = request.args.get("market") or (request.get_json(silent=True) or {}).get("market")
+    return markets.get(market)["code"] if market else None
+
+@app.errorhandler(markets.UnknownMarket)
+def unknown_market(e):
+    return jsonify({"error": str(e)}), 400
+
 @app.route('/scrape_products', methods=['POST'])
 def scrape_products():
     print("Starting product scraping...")
-    threading.Thread(target=run_get_products).start()
-    return jsonify({"status": "Product scraping started"}), 202
+    market = market_param()
+    params = {"market": market} if market else None
+    # Scrapes are idempotent: a second request joins the one already running
+    return start_job("scrape_products", pipeline("get_products", "main"), "Product scraping started", params, dedup=True)
 
 @app.route('/update_trends', methods=['POST'])
 def update_trends():
-    threading.Thread(target=run_g_trends).start()
-    return jsonify({"status": "Google Trends update started"}), 202
+    return start_job("update_trends", pipeline("g_trends", "main"), "Google Trends update started", dedup=True)
 
 @app.route('/generate_article', methods=['POST'])
 def generate_article():
+    market = market_param()
+    params = {"market": market} if market else None
+    return start_job("generate_article", pipeline("article_generator", "generate_article"), "Article generation started", params)
+
+@app.route('/generate_article/markets', methods=['POST'])
+def generate_market_articles():
+    # One article per market, concurrently; body {"markets": ["PL", "DE"]} limits which
+    codes = [markets.get(c)["code"] for c in (request.get_json(silent=True) or {}).get("markets") or markets.MARKETS]
+    return start_job("generate_market_articles", pipeline("article_generator", "generate_market_articles"),
+                     "Per-market article generation started", {"codes": codes})
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/generate_article/stream', methods=['GET'])
+def generate_article_stream():
+    market = market_param()
+    stream = pipeline("article_generator", "stream_article")(market=market)
     try:
-        article = article_generator.generate_article()
-        return jsonify(article)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        # The first event is the job doing the work; a full queue is refused before streaming starts
+        first = next(stream)
+    except jobs.QueueFull as e:
+        return jsonify({"error": f"Job queue is full: {e}"}), 429
+
+    def events():
+        try:
+            yield sse(*first)
+            for event, data in stream:
+                yield sse(event, data)
+            yield sse("done", {})
+        except Exception as e:
+            logging.exception("Streaming article generation failed")
+            yield sse("error", {"error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
+def whole_number(value, high):
+    """True for an int (or digit string) from 1 to high; bools are not numbers here"""
+    return not isinstance(value, bool) and str(value).isdigit() and 1 <= int(value) <= high
+
+@app.route('/generate_articles', methods=['POST'])
+def generate_articles():
+    body = request.get_json(silent=True) or {}
+    prompts = body.get("prompts")
+    if prompts is not None and not (isinstance(prompts, list) and all(isinstance(p, str) and p.strip() for p in prompts)):
+        return jsonify({"error": "prompts must be a list of non-empty strings"}), 400
+    n = body.get("n")
+    if n is None:
+        n = len(prompts) if prompts else 1
+    if not whole_number(n, MAX_BATCH_ARTICLES):
+        return jsonify({"error": f"n must be a whole number from 1 to {MAX_BATCH_ARTICLES}"}), 400
+    if prompts and len(prompts) != int(n):
+        return jsonify({"error": f"Expected {n} prompts, got {len(prompts)}"}), 400
+    concurrency = body.get("concurrency")
+    if concurrency is not None and not whole_number(concurrency, MAX_BATCH_ARTICLES):
+        return jsonify({"error": f"concurrency must be a whole number from 1 to {MAX_BATCH_ARTICLES}"}), 400
+    params = {"n": int(n), "prompts": prompts, "concurrency": concurrency and int(concurrency), "market": market_param()}
+    return start_job("generate_articles", pipeline("article_generator", "generate_articles"), "Batch article generation started", params)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Per worker process: Prometheus should scrape each gunicorn worker or accept partial counts
+    return Response(instrumentation.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/metrics/llm', methods=['GET'])
+def llm_metrics():
+    # Latency and tokens per LLM stage and model, for choosing the per-stage models
+    return jsonify(instrumentation.llm_stats())
 
 # if __name__ == '__main__':
 #     port = int(os.environ.get('PORT', 8000))
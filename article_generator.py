@@ -1,83 +1,181 @@
-import os, json, requests, numpy as np
-from datetime import datetime
+import os, json, queue, logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from openai import OpenAI
 from style_guide import MY_STYLE_GUIDE
+from vector_index import VectorIndex
+from llm_cache import CachedClient
+import embeddings
+import context_builder
+import backlog_index
+from embeddings import EMBEDDING_MODEL
+import airtable_mirror
+import markets
+import partial_json
+import jobs
+from instrumentation import incr
+from pipeline import run_graph
+
+logger = logging.getLogger(__name__)
 
 from dotenv import load_dotenv
 load_dotenv()
 
 # ---------- CONFIG ----------
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-AIRTABLE_TOKEN = os.environ.get("AIRTABLE_API_KEY")
-BASE_ID = os.environ.get("AIRTABLE_BASE_ID")
-
-client = OpenAI(api_key=OPENAI_API_KEY)
-headers = {"Authorization": f"Bearer {AIRTABLE_TOKEN}"}
+FAQ_INDEX_DIR = os.environ.get("FAQ_INDEX_DIR", ".cache/faq_index")
+FAQ_INDEX_TTL = int(os.environ.get("FAQ_INDEX_TTL", 600))  # seconds between index refreshes from the mirror
+ARTICLE_CONCURRENCY = int(os.environ.get("ARTICLE_CONCURRENCY", 3))  # parallel write_article calls in batch mode
+TOPIC_RETRIES = int(os.environ.get("BACKLOG_TOPIC_RETRIES", 2))  # re-selections when a topic duplicates the backlog
+TRENDS_LIMIT = int(os.environ.get("TRENDS_LIMIT", 50))  # top-scored trends passed to the LLM
+# Model per LLM stage. plan and select only return small JSON objects, so they
+# default to the faster model; compare stages and models at /metrics/llm.
+MODELS = {
+    "plan": os.environ.get("PLAN_MODEL", "gpt-4o-mini"),
+    "select": os.environ.get("SELECT_MODEL", "gpt-4o-mini"),
+    "write": os.environ.get("WRITE_MODEL", "gpt-4o"),
+    "repair": os.environ.get("REPAIR_MODEL", "gpt-4o-mini"),  # fills short fields missing from an article
+}
+# How the "do we need trends?" plan call relates to topic selection:
+#   speculative - selection starts with the trends right away, alongside the plan call;
+#                 it is redone without trends only if the plan says they are not needed (default)
+#   sequential  - selection waits for the plan call
+#   merged      - no plan call; the selection call also answers trends_needed
+PLAN_MODE = os.environ.get("PLAN_MODE", "speculative")
+PLAN_MODES = ("speculative", "sequential", "merged")
+ARTICLE_FIELDS = ("title", "target_audience", "linked_products", "content")  # content last, so truncation hits it
+# json_schema structured output; set to 0 for models that only support json_object
+STRUCTURED_OUTPUT = os.environ.get("ARTICLE_STRUCTURED_OUTPUT", "1") == "1"
+ARTICLE_CONTINUATIONS = int(os.environ.get("ARTICLE_CONTINUATIONS", 2))  # follow-up requests for a cut-off article body
+BACKLOG_FIELDS = ["title", "target_audience", "linked_products", "market"]
+TRENDS_FIELDS = ["date", "country", "keyword", "score"]
+
+def make_client():
+    # Retries and rate limits come from the request governor, not the SDK
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+# The OpenAI client is built on first use (llm.client), so importing this module
+# opens no connections and is safe in gunicorn's preloaded master
+llm = CachedClient(factory=make_client)
+faq_index = VectorIndex(FAQ_INDEX_DIR)
 
 # ---------- HELPERS ----------
 
-def fetch_table(table, filter_formula=None):
-    """Fetch up to 50 rows from any Airtable table"""
-    url = f"https://api.airtable.com/v0/{BASE_ID}/{table}"
-    params = {"maxRecords": 50}
-    if filter_formula:
-        params["filterByFormula"] = filter_formula
-    res = requests.get(url, headers=headers, params=params)
-    res.raise_for_status()
-    return [r["fields"] for r in res.json().get("records", [])]
-
-def fetch_product_lines():
-    rows = fetch_table("products")
+def fetch_table(table, where=None, sort=None, max_records=None):
+    """Rows of a mirrored Airtable table, read from the local SQLite mirror"""
+    return airtable_mirror.rows(table, where=where, sort=sort, max_records=max_records)
+
+def in_market(products, market):
+    """Products whose url belongs to market (see markets.market_of); all of them when market is None"""
+    if not market:
+        return products
+    code = markets.get(market)["code"]
+    return [p for p in products if markets.market_of(p.get("url")) == code]
+
+def fetch_product_lines(market=None):
+    rows = in_market(fetch_table("products"), market)
     return [r.get("line") for r in rows if r.get("line")]
 
-def fetch_backlog():
-    return fetch_table("content_backlog")
+def fetch_trends(market=None):
+    """Top-scored trends, only the market's own country when one is given"""
+    where = {"country": markets.get(market)["code"]} if market else None
+    rows = fetch_table("trends", where=where, sort=[("score", "desc")], max_records=TRENDS_LIMIT)
+    return [{k: r[k] for k in TRENDS_FIELDS if k in r} for r in rows]
 
 def get_backlog_summary(backlog):
-    """Return only title, target_audinece, and linked_products from backlog rows"""
+    """Return only title, target_audience, and linked_products from backlog rows"""
     return [
         {
             "title": item.get("title", ""),
-            "target_audinece": item.get("target_audinece", ""),
+            "target_audience": item.get("target_audience", ""),
             "linked_products": item.get("linked_products", "")
         }
         for item in backlog
     ]
 
-def fetch_selected_products(selected_lines):
+def fetch_selected_products(selected_lines, market=None):
     if not selected_lines:
         return []
-    # Build filterByFormula: OR({line}="A",{line}="B")
-    ors = ",".join([f'{{line}}="{line}"' for line in selected_lines])
-    formula = f'OR({ors})'
-    return fetch_table("products", filter_formula=formula)
+    return in_market(fetch_table("products", where={"line": list(selected_lines)}), market)
+
+def refresh_faq_index(force=False):
+    """Pull only FAQ rows changed in the Airtable mirror since the last sync into the local vector index"""
+    now = datetime.now(timezone.utc)
+    synced_at = faq_index.synced_at and datetime.fromisoformat(faq_index.synced_at)
+    if not force and synced_at and (now - synced_at).total_seconds() < FAQ_INDEX_TTL:
+        return faq_index
+
+    # mirrored_at is stamped with our own clock, so no skew overlap is needed
+    where = {"mirrored_at": (">=", synced_at.timestamp())} if synced_at and len(faq_index) else None
+    changed = airtable_mirror.records("faq_queries", where=where)
+    live_ids = set(airtable_mirror.ids("faq_queries"))
+
+    upserts, deletes = [], set(faq_index.ids) - live_ids
+    for r in changed:
+        f = dict(r["fields"])
+        if "Embedding" not in f:
+            deletes.add(r["id"])
+            continue
+        emb = embeddings.decode(f.pop("Embedding"))
+        upserts.append((r["id"], f, emb))
 
-def cosine(a, b):
-    a = np.array(a); b = np.array(b)
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    faq_index.update(upserts, deletes, synced_at=now.isoformat())
+    return faq_index
 
-def semantic_faq_search(keywords, top_k=5):
-    """Find closest FAQ rows using cosine similarity on stored embeddings"""
-    query = " ".join(keywords)
-    q_emb = client.embeddings.create(
-        model="text-embedding-3-small", input=query
-    ).data[0].embedding
-
-    res = requests.get(f"https://api.airtable.com/v0/{BASE_ID}/faq_queries", headers=headers)
-    res.raise_for_status()
-    records = res.json()["records"]
-
-    scored = []
-    for r in records:
-        f = r["fields"]
-        if "Embedding" not in f: 
-            continue
-        emb = json.loads(f["Embedding"])
-        sim = cosine(q_emb, emb)
-        scored.append((sim, f))
+def semantic_faq_search(keywords, top_k=5, market=None):
+    """Find closest FAQ rows using cosine similarity on the local embedding index.
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [s[1] for s in scored[:top_k]]
+    With a market, FAQ rows tagged with another market (an optional "market"
+    field) are skipped; untagged rows apply to every market.
+    """
+    query = " ".join(keywords)
+    q_emb = llm.embedding(EMBEDDING_MODEL, query)
+
+    index = refresh_faq_index()
+    code = market and markets.get(market)["code"]
+    keep = (lambda fields: fields.get("market") in (None, "", code)) if code else None
+    return [fields for _, fields in index.search(q_emb, top_k=top_k, keep=keep)]
+
+class DuplicateTopicError(Exception):
+    def __init__(self, rejected):
+        super().__init__(f"Every proposed topic repeats the backlog: {rejected}")
+        self.rejected = rejected
+
+def duplicate_topic_result(error, market=None):
+    """What a run whose every proposed topic repeated the backlog reports instead of an article"""
+    result = {"skipped": "duplicate_topic", "error": str(error), "rejected_topics": error.rejected}
+    if market:
+        result["market"] = markets.get(market)["code"]
+    return result
+
+def refresh_backlog_index():
+    records = [
+        {"id": r["id"], "fields": {k: r["fields"][k] for k in BACKLOG_FIELDS if k in r["fields"]}}
+        for r in airtable_mirror.records("content_backlog")
+    ]
+    return backlog_index.refresh(llm.client, records)
+
+def similar_backlog(text, market=None):
+    """Backlog summaries closest to text, from the market's shard when given; the prompt only needs these"""
+    return get_backlog_summary(backlog_index.similar(llm.embedding(EMBEDDING_MODEL, text), market=market_code(market)))
+
+def market_code(market):
+    return markets.get(market)["code"] if market else None
+
+def select_unique_topic(user_prompt, product_lines, trends, backlog, ask_trends=False, market=None):
+    """Run selection, re-asking when the proposed topic duplicates the (market's) backlog"""
+    rejected = []
+    for _ in range(TOPIC_RETRIES + 1):
+        selection = extract_keywords_and_products(user_prompt, product_lines, trends, backlog, avoid=rejected,
+                                                  ask_trends=ask_trends)
+        topic = selection.get("topic") or " ".join(selection["faq_keywords"])
+        _, matches = backlog_index.find_duplicates(
+            llm.client, [backlog_index.candidate_text({**selection, "topic": topic})], market=market_code(market))
+        if matches[0] is None:
+            return selection
+        logger.info(f"Topic {topic!r} duplicates backlog item {matches[0]!r}")
+        rejected.append(topic)
+    raise DuplicateTopicError(rejected)
 
 def plan_initial(user_prompt):
     prompt = f"""
@@ -87,61 +185,117 @@ You can use two data sources: products and trends.
 Return JSON like:
 {{"products_needed": true/false, "trends_needed": true/false}}
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o",
+    content = llm.chat(
+        "plan",
+        model=MODELS["plan"],
         messages=[{"role": "user", "content": prompt}],
         response_format={"type": "json_object"}
     )
-    return json.loads(resp.choices[0].message.content)
+    return json.loads(content)
+
+def extract_keywords_and_products(user_prompt, product_lines, trends, backlog, n=None, avoid=None, ask_trends=False,
+                                  requests=None):
+    """Pick a topic, product lines + FAQ keywords for one article, or n distinct topics when n is given.
+
+    With n, requests optionally lists one prompt per article; each topic then
+    carries the 1-based "request" number it was chosen for.
+    avoid lists topics already rejected as duplicates of the backlog.
+    ask_trends adds a top-level "trends_needed" answer, standing in for plan_initial.
+    """
+    if n:
+        numbered = ""
+        if requests:
+            numbered = "\nPropose exactly one topic for each numbered request, in any order:\n" + "\n".join(
+                f"{i}. {r}" for i, r in enumerate(requests, 1)) + "\n"
+        task = f"""{numbered}
+Propose {n} distinct article topics. The topics must not overlap each other
+or any backlog item. For each topic:
+1) Give the number of the request it is for (1–{n})
+2) Say who the article is for
+3) Select 1–3 product lines that fit this topic
+4) List 3–5 keywords for FAQ search
+
+Return JSON like:
+{{
+  "topics": [
+    {{"request": 1, "topic": "Short topic description", "target_audience": "Who it is for", "selected_product_lines": ["line1","line2"], "faq_keywords": ["keyword1","keyword2","keyword3"]}}
+  ]
+}}
+"""
+    else:
+        task = """
+1) Name the article topic in one short sentence
+2) Say who the article is for
+3) Select 1–3 product lines that fit this topic
+4) List 3–5 keywords for FAQ search
 
-def extract_keywords_and_products(user_prompt, product_lines, trends, backlog):
+Return JSON like:
+{
+  "topic": "Short topic description",
+  "target_audience": "Who it is for",
+  "selected_product_lines": ["line1","line2"],
+  "faq_keywords": ["keyword1","keyword2","keyword3"]
+}
+"""
+    if ask_trends:
+        task += '\nAlso add "trends_needed": true/false at the top level of the JSON: whether the current trends should shape the article.\n'
+    if avoid:
+        task = "\nThese topics were rejected because they repeat existing articles, pick something clearly different:\n" + "\n".join(f"- {t}" for t in avoid) + "\n" + task
+    # Backlog items closest to the request are the ones most at risk of repeating
+    ctx = context_builder.build_context(
+        llm.client, query_vector=llm.embedding(EMBEDDING_MODEL, user_prompt), trends=trends, backlog=backlog
+    )
     prompt = f"""
 User wants: "{user_prompt}".
 
 Here are available product lines:
-{json.dumps(product_lines)}
+{", ".join(dict.fromkeys(product_lines))}
 
 Here are recent content_backlog items:
-{json.dumps(backlog)}
+{ctx["backlog"]}
 UNDER NO CIRCUMSTANCES should you repeat any topic already present in backlog.
 
 Here are current trends:
-{json.dumps(trends)}
-
-1) Select 1–3 product lines that fit this topic
-2) List 3–5 keywords for FAQ search
-
-Return JSON like:
-{{
-  "selected_product_lines": ["line1","line2"],
-  "faq_keywords": ["keyword1","keyword2","keyword3"]
-}}
-"""
-    resp = client.chat.completions.create(
-        model="gpt-4o",
+{ctx["trends"]}
+{task}"""
+    context_builder.log_prompt_size("extract_keywords_and_products", prompt, ctx["tokens"])
+    content = llm.chat(
+        "select",
+        model=MODELS["select"],
         messages=[{"role": "user", "content": prompt}],
         response_format={"type": "json_object"}
     )
-    return json.loads(resp.choices[0].message.content)
+    return json.loads(content)
 
 
 
-def write_article(user_prompt, products, trends, faqs, backlog):
+def build_article_prompt(user_prompt, products, trends, faqs, backlog, query=None):
+    """Article prompt; query (e.g. the FAQ keywords) steers which context rows fit the budget"""
+    ctx = context_builder.build_context(
+        llm.client, query_vector=llm.embedding(EMBEDDING_MODEL, query or user_prompt),
+        products=products, trends=trends, faqs=faqs, backlog=backlog
+    )
     prompt = f"""
 You are writing a new article.
 
 User task: "{user_prompt}"
 
 Use this data:
-Products: {json.dumps(products)}
-Trends: {json.dumps(trends)}
-FAQs: {json.dumps(faqs)}
+Products:
+{ctx["products"]}
+
+Trends:
+{ctx["trends"]}
+
+FAQs:
+{ctx["faqs"]}
 
 Follow these style rules:
 {MY_STYLE_GUIDE}
 
 UNDER NO CIRCUMSTANCES should you repeat any topic already present in backlog.
-Backlog items: {backlog}
+Backlog items:
+{ctx["backlog"]}
 
 Return JSON only:
 {{
@@ -151,74 +305,473 @@ Return JSON only:
   "content": "Full article text"
 }}
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o",
+    context_builder.log_prompt_size("write_article", prompt, ctx["tokens"])
+    return prompt
+
+class ArticleOutputError(Exception):
+    pass
+
+FIELD_HINTS = {
+    "title": "short clear title (max 10 words)",
+    "target_audience": "who it is for",
+    "linked_products": "comma-separated product names",
+}
+
+CONTINUE_PROMPT = """Your reply was cut off inside the article content. Continue the content exactly
+where it stops, without repeating anything already written. Reply with the remaining
+article text only, not JSON."""
+
+def article_response_format(fields=ARTICLE_FIELDS, name="article"):
+    """Structured output requiring the given string fields, in this order"""
+    if not STRUCTURED_OUTPUT:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": {
+        "type": "object",
+        "properties": {f: {"type": "string"} for f in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }}}
+
+def continue_content(prompt, content):
+    """Finish a cut-off article body with continuation requests instead of rewriting the article"""
+    for _ in range(ARTICLE_CONTINUATIONS):
+        text, finish_reason = llm.chat_result("continue", model=MODELS["write"], messages=[
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ])
+        content += text
+        if finish_reason != "length":
+            return content
+    logger.warning(f"Article content still cut off after {ARTICLE_CONTINUATIONS} continuations")
+    return content
+
+def fill_fields(content, missing):
+    """Short fields (e.g. a missing title) for a finished article body, from the small model"""
+    wanted = "\n".join(f"- {f}: {FIELD_HINTS.get(f, f)}" for f in missing)
+    prompt = f"""
+Here is an article:
+{content}
+
+Return JSON with these fields for it:
+{wanted}
+"""
+    reply = llm.chat(
+        "repair",
+        model=MODELS["repair"],
         messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+        response_format=article_response_format(missing, name="article_fields")
     )
-    return json.loads(resp.choices[0].message.content)
-
-def add_to_backlog(title, target_audience, linked_products, content):
-    url = f"https://api.airtable.com/v0/{BASE_ID}/content_backlog"
-    data = {
-        "fields": {
-            "title": title,
-            "status": "draft",
-            "target_audience": target_audience,
-            "linked_products": linked_products,
-            "created": datetime.now().strftime("%Y-%m-%d"),
-            "content": content
-        }
-    }
+    fields = json.loads(reply)
+    return {f: str(fields.get(f) or "") for f in missing}
+
+def finish_article(prompt, text):
+    """Article from the write call's JSON text, repairing truncated or incomplete output.
+
+    Fields that arrived complete are kept. A content field cut off mid-way is
+    finished with up to ARTICLE_CONTINUATIONS continuation requests, and
+    missing short fields are filled by one small call. Raises
+    ArticleOutputError when no article content came back at all.
+    """
+    parser = partial_json.parse(text or "")
+    article = dict(parser.fields)
+    missing = [f for f in ARTICLE_FIELDS if not str(article.get(f) or "").strip()]
+    if parser.done and not missing:
+        return article
+
+    reason = "malformed" if parser.error else "truncated" if not parser.done else "missing_fields"
+    incr("article_repairs_total", reason=reason)
+    logger.info(f"Repairing article output ({reason}): complete fields {sorted(article)}, cut off in {parser.pending_key!r}")
+    if "content" in missing and parser.pending_key == "content" and parser.pending_value:
+        article["content"] = continue_content(prompt, parser.pending_value)
+    missing = [f for f in ARTICLE_FIELDS if not str(article.get(f) or "").strip()]
+    if "content" in missing:
+        raise ArticleOutputError(f"The write call returned no article content ({parser.error or reason})")
+    if missing:
+        article.update(fill_fields(article["content"], missing))
+    return article
 
-    res = requests.post(
-        url, 
-        headers={**headers, "Content-Type": "application/json"}, 
-        json=data
+def write_article(user_prompt, products, trends, faqs, backlog, query=None):
+    prompt = build_article_prompt(user_prompt, products, trends, faqs, backlog, query=query)
+    content = llm.chat(
+        "write",
+        model=MODELS["write"],
+        messages=[{"role": "user", "content": prompt}],
+        response_format=article_response_format()
     )
-    res.raise_for_status()
-    return res.json()
+    return finish_article(prompt, content)
 
-# ---------- MAIN FLOW ----------
+def stream_write_article(prompt):
+    """Yield article JSON text deltas as the model produces them"""
+    return llm.stream(
+        "write",
+        model=MODELS["write"],
+        messages=[{"role": "user", "content": prompt}],
+        response_format=article_response_format()
+    )
 
-def generate_article():
-    user_prompt = "Napisz artykuł blogowy na temat związany z remontem/renowacją i przynajmniej jednym z produktów z tabeli produkty. Artykuł zostanie umieszczony na stronie: primacol.com. Ta marka zajmuje się produkcją farb oraz impregnatów i chemii użytkowej. To ma być na pierwszym miejscu artyków a nie reklama produktu. Całość ma być po angielsku."
-    plan = plan_initial(user_prompt)
-    trends = fetch_table("trends") if plan.get("trends_needed") else []
-    backlog = fetch_backlog()
-    backlog_summary = get_backlog_summary(backlog)
+def backlog_fields(title, target_audience, linked_products, content, market=None):
+    fields = {
+        "title": title,
+        "status": "draft",
+        "target_audience": target_audience,
+        "linked_products": linked_products,
+        "created": datetime.now().strftime("%Y-%m-%d"),
+        "content": content
+    }
+    if market:
+        fields["market"] = market  # the backlog is sharded per market like trends and products
+    return fields
 
-    # NEW: first only get product lines
-    product_lines = fetch_product_lines()
+def add_to_backlog(title, target_audience, linked_products, content, market=None):
+    return airtable_mirror.create_record(
+        "content_backlog", backlog_fields(title, target_audience, linked_products, content, market)
+    )
 
-    # LLM chooses product lines + FAQ keywords
-    selection = extract_keywords_and_products(user_prompt, product_lines, trends, backlog_summary)
-    selected_lines = selection["selected_product_lines"]
-    faq_keywords = selection["faq_keywords"]
+def add_many_to_backlog(articles):
+    """Save several articles with batched (10 per request) Airtable creates"""
+    rows = [
+        backlog_fields(a["title"], a["target_audience"], a["linked_products"], a["content"], a.get("market"))
+        for a in articles
+    ]
+    return airtable_mirror.create_records("content_backlog", rows)
 
-    # Now fetch full products only for those lines
-    products = fetch_selected_products(selected_lines)
+def index_fields(article):
+    """What the backlog index keeps for a saved article"""
+    return {**get_backlog_summary([article])[0], "market": article.get("market")}
 
-    # Semantic FAQ search
-    faqs = semantic_faq_search(faq_keywords, top_k=5)
+# ---------- MAIN FLOW ----------
 
-    # Generate article
-    article = write_article(user_prompt, products, trends, faqs, backlog_summary)
+USER_PROMPT = "Napisz artykuł blogowy na temat związany z remontem/renowacją i przynajmniej jednym z produktów z tabeli produkty. Artykuł zostanie umieszczony na stronie: primacol.com. Ta marka zajmuje się produkcją farb oraz impregnatów i chemii użytkowej. To ma być na pierwszym miejscu artyków a nie reklama produktu. Całość ma być po angielsku."
+MARKET_PROMPT = "Napisz artykuł blogowy na temat związany z remontem/renowacją i przynajmniej jednym z produktów z tabeli produkty. Artykuł zostanie umieszczony na stronie: primacol.com dla rynku: {name}. Ta marka zajmuje się produkcją farb oraz impregnatów i chemii użytkowej. To ma być na pierwszym miejscu artyków a nie reklama produktu. Całość ma być {language}."
+
+def prompt_for(market=None):
+    """USER_PROMPT, or its variant naming the market and its article language"""
+    return MARKET_PROMPT.format(**markets.get(market)) if market else USER_PROMPT
+
+def trends_needed(plan):
+    return bool(plan.get("trends_needed"))
+
+def selection_stages(user_prompt, select):
+    """Stages producing "trends" and "selection" arranged per PLAN_MODE.
+
+    select(r, trends, ask_trends) runs the topic selection call with the
+    results so far; ask_trends asks it to answer trends_needed as well.
+    """
+    if PLAN_MODE not in PLAN_MODES:
+        raise ValueError(f"Unknown PLAN_MODE {PLAN_MODE!r}, expected one of {PLAN_MODES}")
+    inputs = ("product_lines", "backlog")
+    if PLAN_MODE == "merged":
+        return {
+            "trends": (("trends_data",), lambda r: r["trends_data"]),
+            "selection": ((*inputs, "trends"), lambda r: select(r, r["trends"], True)),
+        }
+    stages = {
+        "plan": ((), lambda r: plan_initial(user_prompt)),
+        "trends": (("plan", "trends_data"), lambda r: r["trends_data"] if trends_needed(r["plan"]) else []),
+    }
+    if PLAN_MODE == "sequential":
+        stages["selection"] = ((*inputs, "trends"), lambda r: select(r, r["trends"], False))
+    else:
+        # Usually the plan wants trends, so the selection made with them is kept
+        stages["selection_draft"] = ((*inputs, "trends_data"), lambda r: select(r, r["trends_data"], False))
+        stages["selection"] = (("plan", "selection_draft"), lambda r: (
+            r["selection_draft"] if trends_needed(r["plan"]) else select(r, [], False)))
+    return stages
+
+def article_trends(results):
+    """Trends handed to write_article; in merged mode the selection call decides whether they are needed"""
+    if PLAN_MODE == "merged" and not results["selection"].get("trends_needed", True):
+        return []
+    return results["trends"]
+
+def context_stages(user_prompt, market=None, select=None):
+    """Stages that gather everything write_article needs for one article, from one market's shard when given"""
+    # Each stage lists the stages whose output it needs; everything else runs concurrently.
+    # Trends are fetched speculatively alongside the plan and dropped if it says they're not needed.
+    select = select or (lambda r, trends, ask_trends: select_unique_topic(
+        user_prompt, r["product_lines"], trends, r["backlog"], ask_trends=ask_trends, market=market))
+    return {
+        "trends_data": ((), lambda r: fetch_trends(market)),
+        "backlog_index": ((), lambda r: refresh_backlog_index()),
+        "backlog": (("backlog_index",), lambda r: similar_backlog(user_prompt, market)),
+        "product_lines": ((), lambda r: fetch_product_lines(market)),
+        "faq_index": ((), lambda r: refresh_faq_index()),
+        # LLM chooses topic, product lines + FAQ keywords; duplicate topics are rejected before writing
+        **selection_stages(user_prompt, select),
+        # Full products only for the chosen lines, FAQ search in parallel
+        "products": (("selection",), lambda r: fetch_selected_products(r["selection"]["selected_product_lines"], market)),
+        "faqs": (("selection", "faq_index"), lambda r: semantic_faq_search(r["selection"]["faq_keywords"], top_k=5, market=market)),
+    }
 
-    # Save to backlog
-    add_to_backlog(
+def save_article(article):
+    """Save to the backlog unless the finished article duplicates an existing one of its market"""
+    vectors, matches = backlog_index.find_duplicates(
+        llm.client, [backlog_index.summary_text(article)], market=article.get("market"))
+    if matches[0] is not None:
+        logger.info(f"Not saving {article['title']!r}: duplicates backlog item {matches[0]!r}")
+        article["duplicate_of"] = matches[0]
+        return None
+    saved = add_to_backlog(
         title=article["title"],
         target_audience=article["target_audience"],
         linked_products=article["linked_products"],
-        content=article["content"]
+        content=article["content"],
+        market=article.get("market")
     )
+    backlog_index.add([(saved["id"], index_fields(article), vectors[0])])
+    return saved
 
+def with_market(article, market):
+    """Tag an article with its market before it is checked against and saved to that market's backlog"""
+    if market:
+        article["market"] = market_code(market)
     return article
 
+def generate_article(market=None):
+    """Generate and save one article; with a market only its trends, products and FAQs are used.
+
+    When every proposed topic repeats the backlog the run returns a
+    duplicate_topic_result instead of failing.
+    """
+    user_prompt = prompt_for(market)
+
+    stages = context_stages(user_prompt, market)
+    stages.update({
+        "article": (("products", "faqs"), lambda r: with_market(write_article(
+            user_prompt, r["products"], article_trends(r), r["faqs"], r["backlog"],
+            query=" ".join(r["selection"]["faq_keywords"])), market)),
+        "saved": (("article",), lambda r: save_article(r["article"])),
+    })
+    try:
+        results, timings = run_graph(stages)
+    except DuplicateTopicError as e:
+        return duplicate_topic_result(e, market)
+
+    article = results["article"]
+    article["timings"] = timings
+    return article
+
+def generate_market_articles(codes=None, concurrency=None):
+    """One article per market (all markets by default), generated concurrently.
+
+    Each article runs its own pipeline over its market's shard of trends,
+    products and FAQs. A failing market is reported in "errors" without
+    stopping the others.
+    """
+    codes = [markets.get(c)["code"] for c in (codes or markets.MARKETS)]
+    articles, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=concurrency or len(codes)) as pool:
+        futures = {code: pool.submit(generate_article, code) for code in codes}
+        for code, future in futures.items():
+            try:
+                article = future.result()
+                if article.get("skipped"):
+                    errors[code] = article["error"]
+                else:
+                    articles[code] = article
+            except Exception as e:
+                logger.exception("Article for market %s failed", code)
+                errors[code] = str(e)
+    return {"articles": articles, "errors": errors}
+
+# What each streamed pipeline stage reports to the client
+STREAM_STAGES = {
+    "plan": lambda v: v,
+    "selection": lambda v: v,
+    "products": lambda v: [p.get("line") for p in v],
+    "faqs": lambda v: [f.get("Question") for f in v],
+}
+
+def stream_article(user_prompt=None, market=None):
+    """Generate one article, yielding (event, data) pairs as work completes.
+
+    Emits "job" with the id of the job doing the work, a "stage" event per
+    finished pipeline stage, then "token" events with the article text as
+    the model streams it (decoded from the JSON reply), interleaved with a
+    "field" event as each short field (title, ...) completes, and finally
+    "article" with the parsed article once it has been saved to the backlog
+    ("skipped" instead, when every proposed topic repeats the backlog).
+
+    The work runs as a "generate_article_stream" job, so it shares the job
+    executor's limits, is still finished and saved when the client
+    disconnects and this generator is closed, and is marked failed if the
+    process stops first. Raises jobs.QueueFull before the first event when
+    the job queue is full.
+    """
+    user_prompt = user_prompt or prompt_for(market)
+    events = queue.Queue()
+
+    def on_stage(name, value):
+        if name in STREAM_STAGES:
+            events.put(("stage", {"stage": name, "data": STREAM_STAGES[name](value)}))
+
+    def run(market=None):
+        try:
+            results, timings = run_graph(context_stages(user_prompt, market), on_stage=on_stage)
+            prompt = build_article_prompt(
+                user_prompt, results["products"], article_trends(results), results["faqs"], results["backlog"],
+                query=" ".join(results["selection"]["faq_keywords"])
+            )
+            parts, streamed = [], ""
+            parser = partial_json.ObjectParser()
+
+            def send_content(text):
+                nonlocal streamed
+                if len(text) > len(streamed):
+                    events.put(("token", text[len(streamed):]))
+                    streamed = text
+
+            for delta in stream_write_article(prompt):
+                parts.append(delta)
+                for name, value in parser.feed(delta):
+                    if name == "content":
+                        send_content(value)
+                    else:
+                        # Short fields are announced as soon as they are complete
+                        events.put(("field", {"field": name, "value": value}))
+                if parser.pending_key == "content":
+                    send_content(parser.pending_value)
+
+            # Backlog write happens once, from the assembled (and if needed repaired) text
+            article = with_market(finish_article(prompt, "".join(parts)), market)
+            if article["content"].startswith(streamed):
+                send_content(article["content"])  # the part a continuation request added
+            saved = save_article(article)
+            article["id"] = saved and saved.get("id")
+            article["timings"] = timings
+            events.put(("article", article))
+            return article
+        except DuplicateTopicError as e:
+            result = duplicate_topic_result(e, market)
+            events.put(("skipped", result))
+            return result
+        except Exception as e:
+            events.put(("failed", e))
+            raise
+
+    job, _ = jobs.submit("generate_article_stream", run, {"market": market} if market else None)
+    yield "job", {"job_id": job["id"], "status_url": f"/jobs/{job['id']}"}
+    while True:
+        kind, value = events.get()
+        if kind == "failed":
+            raise value
+        yield kind, value
+        if kind in ("article", "skipped"):
+            return
+
+def topics_per_prompt(topics, n, interchangeable):
+    """Slot the selection's topics by their 1-based "request" number; None where no topic came back.
+
+    When every prompt is the same (interchangeable) topics without a usable
+    number fill the free slots in order.
+    """
+    slots, spare = [None] * n, []
+    for topic in topics:
+        number = topic.get("request")
+        if isinstance(number, int) and 1 <= number <= n and slots[number - 1] is None:
+            slots[number - 1] = topic
+        else:
+            spare.append(topic)
+    if interchangeable:
+        for i in range(n):
+            if slots[i] is None and spare:
+                slots[i] = spare.pop(0)
+    return slots
+
+def generate_articles(n, prompts=None, concurrency=None, market=None):
+    """Generate n articles sharing one context load and one topic-selection call.
+
+    prompts optionally gives a user prompt per article (defaults to the
+    market's prompt, or USER_PROMPT without a market); the selection call
+    proposes one numbered topic per prompt so each article is written for
+    the prompt its topic was chosen for.
+    write_article calls run concurrently, at most `concurrency` at a time, and
+    all finished articles are saved with batched backlog creates. Articles that
+    fail, and prompts the selection proposed no topic for, are reported in
+    "errors" without aborting the rest of the batch.
+    """
+    prompts = list(prompts or [])
+    if prompts and len(prompts) != n:
+        raise ValueError(f"Expected {n} prompts, got {len(prompts)}")
+    prompts = prompts or [prompt_for(market)] * n
+    distinct = list(dict.fromkeys(prompts))
+    shared_prompt = "\n".join(distinct)
+    requests = prompts if len(distinct) > 1 else None
+
+    stages = context_stages(shared_prompt, market, select=lambda r, trends, ask_trends: extract_keywords_and_products(
+        shared_prompt, r["product_lines"], trends, r["backlog"], n=n, ask_trends=ask_trends, requests=requests))
+    del stages["faqs"]  # searched per topic below
+    stages.update({
+        # One products read for the union of all selected lines, split per topic below
+        "products": (("selection",), lambda r: fetch_selected_products(sorted({
+            line for t in r["selection"]["topics"] for line in t["selected_product_lines"]}), market)),
+    })
+    results, timings = run_graph(stages)
+
+    articles, errors = [], []
+    slots = topics_per_prompt(results["selection"].get("topics") or [], n, interchangeable=requests is None)
+    candidates = []
+    for i, topic in enumerate(slots):
+        if topic is None:
+            errors.append({"prompt": i + 1, "topic": None, "error": "the selection proposed no topic for this prompt"})
+        else:
+            candidates.append((i, topic))
+
+    # Drop topics that repeat the backlog or each other before paying for write_article
+    topics = []
+    _, matches = backlog_index.find_duplicates(
+        llm.client, [backlog_index.candidate_text(t) for _, t in candidates], market=market_code(market))
+    for (i, topic), match in zip(candidates, matches):
+        if match is None:
+            topics.append((i, topic))
+        else:
+            errors.append({"prompt": i + 1, "topic": topic.get("topic"), "error": f"duplicates {match!r}"})
+
+    def write_one(i, topic):
+        lines = set(topic["selected_product_lines"])
+        products = [p for p in results["products"] if p.get("line") in lines]
+        faqs = semantic_faq_search(topic["faq_keywords"], top_k=5, market=market)
+        prompt = f"{prompts[i]}\nTopic: {topic.get('topic', '')}"
+        return with_market(write_article(prompt, products, article_trends(results), faqs, results["backlog"],
+                                         query=" ".join(topic["faq_keywords"])), market)
+
+    written = []
+    with ThreadPoolExecutor(max_workers=concurrency or ARTICLE_CONCURRENCY) as pool:
+        futures = [pool.submit(write_one, i, t) for i, t in topics]
+        for (i, topic), future in zip(topics, futures):
+            try:
+                written.append(future.result())
+            except Exception as e:
+                logger.exception("Article for topic %r failed", topic.get("topic"))
+                errors.append({"prompt": i + 1, "topic": topic.get("topic"), "error": str(e)})
+
+    # Finished articles get the same check before they reach the backlog
+    vectors, matches = backlog_index.find_duplicates(
+        llm.client, [backlog_index.summary_text(a) for a in written], market=market_code(market))
+    kept = []
+    for article, vector, match in zip(written, vectors, matches):
+        if match is None:
+            articles.append(article)
+            kept.append(vector)
+        else:
+            article["duplicate_of"] = match
+            errors.append({"topic": article.get("title"), "error": f"duplicates {match!r}"})
+
+    if articles:
+        saved = add_many_to_backlog(articles)
+        backlog_index.add([
+            (record["id"], index_fields(article), vector)
+            for record, article, vector in zip(saved, articles, kept)
+        ])
+    return {"articles": articles, "errors": errors, "timings": timings}
+
 # ---------- RUN EXAMPLE ----------
 
 if __name__ == "__main__":
     result = generate_article()
+    if result.get("skipped"):
+        raise SystemExit(result["error"])
     print("\n✅ ARTICLE GENERATED:\n")
     print("Title:", result["title"])
     print("Target Audience:", result["target_audience"])
@@ -0,0 +1,94 @@
+import os, logging
+import numpy as np
+import embeddings
+from vector_index import VectorIndex, normalize
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+BACKLOG_INDEX_DIR = os.environ.get("BACKLOG_INDEX_DIR", ".cache/backlog_index")
+DUPLICATE_THRESHOLD = float(os.environ.get("BACKLOG_DUPLICATE_THRESHOLD", 0.88))  # cosine similarity
+PROMPT_ITEMS = int(os.environ.get("BACKLOG_PROMPT_ITEMS", 20))  # nearest backlog rows shown to the LLM
+
+# Same compact float32 form as the FAQ index, one row per content_backlog record
+index = VectorIndex(BACKLOG_INDEX_DIR)
+
+
+def in_market(market):
+    """Row filter for one market's shard; rows saved without a market apply to every market"""
+    if not market:
+        return None
+    return lambda fields: fields.get("market") in (None, "", market)
+
+def summary_text(fields):
+    """What a backlog entry is about: title plus audience and linked products"""
+    parts = [fields.get("title", ""), fields.get("target_audience", ""), fields.get("linked_products", "")]
+    return " | ".join(str(p) for p in parts if p)
+
+def candidate_text(selection):
+    """A proposed topic in summary_text's shape, so it compares like for like with backlog rows"""
+    return summary_text({
+        "title": selection.get("topic", ""),
+        "target_audience": selection.get("target_audience", ""),
+        "linked_products": ", ".join(selection.get("selected_product_lines") or []),
+    })
+
+def refresh(client, records):
+    """Bring the index in line with content_backlog records ({"id", "fields"}), embedding only new text"""
+    known = {rid: row for rid, row in zip(index.ids, index.rows)}
+    changed = []
+    for r in records:
+        text = summary_text(r["fields"])
+        if not text:
+            continue
+        h = embeddings.text_hash(text)
+        row = known.get(r["id"], {})
+        if row.get("hash") != h or row.get("market") != r["fields"].get("market"):
+            changed.append((r["id"], text, h, r["fields"]))
+
+    deletes = set(known) - {r["id"] for r in records}
+    if not changed and not deletes:
+        return index
+    vectors = embeddings.embed_texts(client, [text for _, text, _, _ in changed])
+    upserts = [
+        (rid, {**fields, "hash": h}, vector)
+        for (rid, _, h, fields), vector in zip(changed, vectors)
+    ]
+    index.update(upserts, deletes)
+    logger.info(f"Backlog index: {len(upserts)} embedded, {len(deletes)} removed, {len(index)} total")
+    return index
+
+def add(saved):
+    """Index freshly saved backlog records, given as (record id, fields, vector), so later checks see them"""
+    index.update([
+        (rid, {**fields, "hash": embeddings.text_hash(summary_text(fields))}, vector)
+        for rid, fields, vector in saved
+    ])
+
+def similar(vector, top_k=PROMPT_ITEMS, market=None):
+    """Backlog rows closest to the query vector, for the prompt's do-not-repeat list"""
+    return [fields for _, fields in index.search(vector, top_k=top_k, keep=in_market(market))]
+
+def find_duplicates(client, texts, threshold=DUPLICATE_THRESHOLD, market=None):
+    """Check candidate texts against the backlog and against each other in one pass.
+
+    With a market only that market's backlog (and untagged rows) counts.
+    Returns (vectors, matches) where matches[i] is the title of the backlog
+    item (or earlier candidate) that text i duplicates, or None.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), []
+    vectors = normalize(embeddings.embed_texts(client, texts))
+    matches = []
+    for best in index.nearest(vectors, keep=in_market(market)):
+        matches.append(best[1].get("title") if best and best[0] >= threshold else None)
+
+    # Candidates in the same batch must not repeat each other either
+    pairwise = vectors @ vectors.T
+    for i in range(len(texts)):
+        if matches[i] is None:
+            for j in range(i):
+                if matches[j] is None and pairwise[i, j] >= threshold:
+                    matches[i] = texts[j]
+                    break
+    return vectors, matches
@@ -0,0 +1,73 @@
+"""Offline TrendReq replaying related queries from fixtures/pytrends.json.
+
+Keywords missing from the fixture get deterministic synthetic related
+queries, so g_trends.SEARCH_QUERIES always produces a realistic upload.
+
+    python -m benchmarks.fake_trends --record   # capture real related queries into the fixture
+"""
+import os, sys, json, time, random, hashlib, argparse
+import pandas as pd
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pytrends.json")
+SUFFIXES = ["ideas", "colours", "cost", "diy", "near me", "2025", "how to", "best", "tips", "before and after"]
+
+
+def load_fixture(path=FIXTURE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def synthetic_related(keyword):
+    rng = random.Random(hashlib.sha1(keyword.encode("utf-8")).hexdigest())
+    top = [{"query": f"{keyword} {s}", "value": rng.randint(20, 100)} for s in rng.sample(SUFFIXES, 8)]
+    rising = [{"query": f"{keyword} {s}", "value": rng.randint(50, 5000)} for s in rng.sample(SUFFIXES, 4)]
+    return {"top": top, "rising": rising}
+
+
+class FakeTrendReq:
+    """Same calls trends_collector makes on pytrends' TrendReq, answered from the fixture"""
+
+    def __init__(self, latency=0.0, fixture=None):
+        self.latency = latency
+        self.fixture = load_fixture() if fixture is None else fixture
+        self.kw_list, self.geo = [], ""
+        self.calls = 0
+
+    def build_payload(self, kw_list, cat=0, timeframe="now 7-d", geo="", gprop=""):
+        self.kw_list, self.geo = list(kw_list), geo
+
+    def related_queries(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.9, 1.1))
+        out = {}
+        for kw in self.kw_list:
+            related = self.fixture.get(self.geo, {}).get(kw) or synthetic_related(kw)
+            out[kw] = {
+                part: pd.DataFrame(rows, columns=["query", "value"]) if rows else None
+                for part, rows in related.items()
+            }
+        return out
+
+
+def record(search_queries, path=FIXTURE_PATH):
+    """Fetch related queries for every keyword with the real TrendReq and save them"""
+    import trends_collector
+    fixture = load_fixture(path)
+    results, failed = trends_collector.collect(search_queries)
+    for country, per_keyword in results.items():
+        fixture.setdefault(trends_collector.geo_for(country), {}).update(per_keyword)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=1)
+    print(f"Saved {sum(len(v) for v in fixture.values())} keywords to {path}; failed: {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record pytrends related queries for offline benchmarks")
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+    if args.record:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import g_trends
+        record(g_trends.SEARCH_QUERIES)
@@ -0,0 +1,393 @@
+"""Offline benchmarks for the article, FAQ search, trends and scraper pipelines.
+
+Starts the stand-in server in-process, points the app at it through
+AIRTABLE_API_URL / OPENAI_BASE_URL / COLLECTION_URL, replaces TrendReq with
+FakeTrendReq, and runs everything from a throwaway working directory so the
+local .cache is untouched. Results are written as JSON; pass --baseline to
+fail when a benchmark's median got slower than the threshold allows.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --only faq_search --faq-sizes 1000,10000,100000
+    python -m benchmarks.run --latency openai=0,airtable=0 --baseline benchmarks/results/main.json
+"""
+import os, sys, json, time, uuid, shutil, logging, argparse, platform, tempfile, functools, subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import stand_in as stand_in_module
+from benchmarks.fake_trends import FakeTrendReq
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+DEFAULT_ITERATIONS = {
+    "parse_product_html": 200,
+    "scraper": 3,
+    "scraper_incremental": 3,
+    "generate_article": 5,
+    "generate_article_concurrent": 1,
+    "generate_article_markets": 1,
+    "generate_article_truncated": 3,
+    "faq_search": 50,
+    "mirror_read": 1000,
+    "g_trends": 1,
+    "startup": 5,
+}
+PYTRENDS_LATENCY = 0.8  # seconds per related_queries call unless --latency sets pytrends=
+
+# What a fresh worker imports: app alone (lazy pipelines), app plus the module one route
+# needs, and everything at once, which is what app.py used to import eagerly
+STARTUP_SCENARIOS = {
+    "startup_app": [],
+    "startup_app_article_generator": ["article_generator"],
+    "startup_app_eager": ["get_products", "g_trends", "article_generator"],
+}
+STARTUP_PROBE = """
+import sys, json, time, importlib
+started = time.perf_counter()
+import app
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+seconds = time.perf_counter() - started
+rss_kb = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmRSS:"))
+print(json.dumps({"seconds": seconds, "rss_mb": rss_kb / 1024, "modules": len(sys.modules)}))
+"""
+
+
+def summarize(samples, wall=None):
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "iterations": len(samples),
+        "first_ms": round(float(ms[0]), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "min_ms": round(float(ms.min()), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "throughput_per_s": round(len(samples) / (wall or ms.sum() / 1000), 3),
+    }
+
+def measure(fn, iterations, setup=None):
+    """Run fn `iterations` times; returns (per-call seconds, wall seconds)"""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, time.perf_counter() - started
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+# ---------- BENCHMARKS ----------
+# Each takes (ctx, iterations) and returns {name: result}; ctx carries the stand-in and options.
+
+def bench_parse_product_html(ctx, iterations):
+    import product_http
+    pages = [(h, ctx["stand_in"].shop.pages[h]) for h in sorted(ctx["stand_in"].shop.pages)]
+    samples, wall = measure(lambda: [product_http.parse_product_html(page, h) for h, page in pages], iterations)
+    result = summarize(samples, wall)
+    result["params"] = {"pages_per_iteration": len(pages)}
+    return {"parse_product_html": result}
+
+def bench_scraper(ctx, iterations):
+    import product_sync, get_products
+
+    def cold():
+        # Fresh snapshot: every page is downloaded, parsed and synced
+        if os.path.exists(product_sync.SNAPSHOT_PATH):
+            os.remove(product_sync.SNAPSHOT_PATH)
+
+    out = {}
+    samples, wall = measure(lambda: get_products.main(backend="http"), iterations, setup=cold)
+    out["scraper"] = {**summarize(samples, wall), "params": {"products": len(ctx["stand_in"].shop.handles), "backend": "http"}}
+    # Snapshot kept from the previous run: conditional GETs answer 304 and nothing is written
+    samples, wall = measure(lambda: get_products.main(backend="http"), ctx["iterations"].get("scraper_incremental", iterations))
+    out["scraper_incremental"] = {**summarize(samples, wall), "params": {"products": len(ctx["stand_in"].shop.handles), "backend": "http"}}
+    return out
+
+def bench_generate_article(ctx, iterations):
+    import article_generator
+    from concurrent.futures import ThreadPoolExecutor
+
+    out = {}
+    samples, wall = measure(article_generator.generate_article, iterations)
+    out["generate_article"] = {**summarize(samples, wall), "params": {"article_words": ctx["article_words"]}}
+
+    # Throughput: several articles in flight at once, as parallel /generate_article jobs would run
+    n = ctx["concurrency"]
+    def concurrent():
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            list(pool.map(lambda _: article_generator.generate_article(), range(n)))
+    samples, wall = measure(concurrent, ctx["iterations"].get("generate_article_concurrent", 1))
+    result = summarize(samples, wall)
+    result["throughput_per_s"] = round(n * len(samples) / wall, 3)
+    out["generate_article_concurrent"] = {**result, "params": {"concurrency": n}}
+
+    # One article per market at once, each from its own shard of trends and products
+    samples, wall = measure(article_generator.generate_market_articles, ctx["iterations"].get("generate_article_markets", 1))
+    result = summarize(samples, wall)
+    result["throughput_per_s"] = round(len(article_generator.markets.MARKETS) * len(samples) / wall, 3)
+    out["generate_article_markets"] = {**result, "params": {"markets": list(article_generator.markets.MARKETS)}}
+
+    # Article replies cut off at 60%: the rest comes from a continuation request, not a rewrite
+    openai = ctx["stand_in"].openai
+    openai.truncate = 0.4
+    try:
+        samples, wall = measure(article_generator.generate_article, ctx["iterations"].get("generate_article_truncated", iterations))
+    finally:
+        openai.truncate = 0
+    out["generate_article_truncated"] = {**summarize(samples, wall), "params": {"cut_off": 0.4}}
+    return out
+
+def build_faq_index(path, rows, dims, chunk=10000):
+    """Random unit vectors written straight into the VectorIndex file layout, version file included"""
+    os.makedirs(path, exist_ok=True)
+    matrix = np.lib.format.open_memmap(os.path.join(path, "matrix.npy"), mode="w+", dtype=np.float32, shape=(rows, dims))
+    rng = np.random.default_rng(rows)
+    for start in range(0, rows, chunk):
+        block = rng.standard_normal((min(chunk, rows - start), dims), dtype=np.float32)
+        matrix[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    matrix.flush()
+    del matrix
+    # VectorIndex only loads a matrix whose version matches index.json
+    version = uuid.uuid4().hex
+    meta = {
+        "ids": [f"recFAQ{i:09d}" for i in range(rows)],
+        "rows": [{"Question": f"Synthetic question {i}", "Answer": f"Synthetic answer {i}"} for i in range(rows)],
+        "synced_at": datetime.now(timezone.utc).isoformat(),
+        "version": version,
+    }
+    with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with open(os.path.join(path, "matrix.version"), "w", encoding="utf-8") as f:
+        f.write(version)
+
+def bench_faq_search(ctx, iterations):
+    import article_generator
+    from vector_index import VectorIndex
+
+    out = {}
+    original = article_generator.faq_index
+    try:
+        for rows in ctx["faq_sizes"]:
+            path = os.path.join(ctx["workdir"], f"faq_index_{rows}")
+            t0 = time.perf_counter()
+            build_faq_index(path, rows, ctx["dims"])
+            build_seconds = time.perf_counter() - t0
+            index = VectorIndex(path)
+            article_generator.faq_index = index
+
+            # Distinct keywords per call so the query-embedding cache does not hide the API round-trip
+            calls = iter(range(10 ** 9))
+            samples, wall = measure(lambda: article_generator.semantic_faq_search([f"paint query {rows}-{next(calls)}"], top_k=5), iterations)
+            query = stand_in_module.fake_embedding("search only", ctx["dims"])
+            search_samples, search_wall = measure(lambda: index.search(query, top_k=5), iterations)
+
+            label = f"faq_search_{rows // 1000}k" if rows >= 1000 else f"faq_search_{rows}"
+            out[label] = {**summarize(samples, wall), "params": {"rows": rows, "dims": ctx["dims"], "build_s": round(build_seconds, 2)}}
+            out[label + "_index_only"] = {**summarize(search_samples, search_wall), "params": {"rows": rows, "dims": ctx["dims"]}}
+            del index
+            shutil.rmtree(path, ignore_errors=True)
+    finally:
+        article_generator.faq_index = original
+    return out
+
+def bench_mirror_read(ctx, iterations):
+    """Cold full sync of the mirrored tables, then the local reads generate_article makes"""
+    import airtable_mirror, article_generator
+
+    out = {}
+    samples, wall = measure(lambda: [airtable_mirror.sync(t, full=True) for t in airtable_mirror.TABLES], 1)
+    out["mirror_full_sync"] = {**summarize(samples, wall), "params": {"tables": list(airtable_mirror.TABLES)}}
+    lines = article_generator.fetch_product_lines()[:2]
+    reads = {
+        "mirror_read_product_lines": article_generator.fetch_product_lines,
+        "mirror_read_trends": article_generator.fetch_trends,
+        "mirror_read_selected_products": lambda: article_generator.fetch_selected_products(lines),
+    }
+    for label, fn in reads.items():
+        samples, wall = measure(fn, iterations)
+        out[label] = summarize(samples, wall)
+    return out
+
+def bench_g_trends(ctx, iterations):
+    import g_trends, trends_collector
+
+    latency = ctx["latency"].get("pytrends", PYTRENDS_LATENCY)
+    original = trends_collector.collect
+    g_trends.trends_collector.collect = functools.partial(original, trend_req_factory=lambda: FakeTrendReq(latency))
+
+    def fresh_checkpoint():
+        if os.path.exists(trends_collector.CHECKPOINT_PATH):
+            os.remove(trends_collector.CHECKPOINT_PATH)
+    try:
+        samples, wall = measure(g_trends.main, iterations, setup=fresh_checkpoint)
+    finally:
+        trends_collector.collect = original
+    keywords = sum(len(v) for v in g_trends.SEARCH_QUERIES.values())
+    return {"g_trends": {**summarize(samples, wall), "params": {"keywords": keywords, "pytrends_latency_s": latency}}}
+
+def bench_startup(ctx, iterations):
+    """Import time and resident memory of a fresh interpreter loading the app, per scenario"""
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    def probe(modules):
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, *modules], cwd=REPO_ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    out = {}
+    for name, modules in STARTUP_SCENARIOS.items():
+        probe(modules)  # warm the bytecode and page caches
+        runs = [probe(modules) for _ in range(iterations)]
+        result = summarize([r["seconds"] for r in runs])
+        result["rss_mb"] = round(float(np.median([r["rss_mb"] for r in runs])), 1)
+        result["params"] = {"modules": modules, "loaded_modules": runs[-1]["modules"]}
+        out[name] = result
+    return out
+
+BENCHMARKS = {
+    "parse_product_html": bench_parse_product_html,
+    "scraper": bench_scraper,
+    "generate_article": bench_generate_article,
+    "faq_search": bench_faq_search,
+    "mirror_read": bench_mirror_read,
+    "g_trends": bench_g_trends,
+    "startup": bench_startup,
+}
+
+# ---------- RESULTS ----------
+
+def compare(results, baseline, threshold):
+    """Benchmarks whose median is more than `threshold` (fraction) slower than the baseline"""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if old and old.get("p50_ms") and result["p50_ms"] > old["p50_ms"] * (1 + threshold):
+            regressions.append({"benchmark": name, "baseline_p50_ms": old["p50_ms"], "p50_ms": result["p50_ms"],
+                                "change": round(result["p50_ms"] / old["p50_ms"] - 1, 3)})
+    return regressions
+
+def print_table(results):
+    print(f"\n{'benchmark':34} {'n':>4} {'p50 ms':>10} {'p95 ms':>10} {'first ms':>10} {'per s':>9} {'rss MB':>8}")
+    for name, r in results["benchmarks"].items():
+        rss = f"{r['rss_mb']:>8.1f}" if "rss_mb" in r else ""
+        print(f"{name:34} {r['iterations']:>4} {r['p50_ms']:>10.1f} {r['p95_ms']:>10.1f} {r['first_ms']:>10.1f} {r['throughput_per_s']:>9.2f} {rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline pipeline benchmarks")
+    parser.add_argument("--only", help="comma-separated benchmarks: " + ",".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, help="override every benchmark's iteration count")
+    parser.add_argument("--latency", help="per-service seconds, e.g. openai=0.5,airtable=0.08,shop=0.1,pytrends=0.8,openai_tps=80")
+    parser.add_argument("--faq-sizes", default="1000,10000,100000")
+    parser.add_argument("--dims", type=int, default=stand_in_module.EMBEDDING_DIMS)
+    parser.add_argument("--products", type=int, default=40, help="products on the stand-in collection page")
+    parser.add_argument("--article-words", type=int, default=stand_in_module.ARTICLE_WORDS)
+    parser.add_argument("--concurrency", type=int, default=3, help="articles in flight for the throughput run")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown vs baseline, as a fraction")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="show the pipelines' own logs")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    latency = stand_in_module.parse_latency(args.latency)
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    iterations = {**DEFAULT_ITERATIONS, **({k: args.iterations for k in DEFAULT_ITERATIONS} if args.iterations else {})}
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"))
+    baseline = args.baseline and json.load(open(args.baseline, encoding="utf-8"))
+
+    server = stand_in_module.StandIn(latency, products=args.products, article_words=args.article_words, dims=args.dims).start()
+    workdir = tempfile.mkdtemp(prefix="content-generator-bench-")
+    os.environ.update({
+        "AIRTABLE_API_URL": f"{server.url}/v0",
+        "AIRTABLE_API_KEY": "bench",
+        "AIRTABLE_BASE_ID": "appBench",
+        "OPENAI_BASE_URL": f"{server.url}/v1",
+        "OPENAI_API_KEY": "bench",
+        "COLLECTION_URL": f"{server.url}/en-pl/collections/collections",
+        "TRENDS_MIN_DELAY": "0",
+        "TRENDS_RATE_LIMIT": "0",
+    })
+    os.chdir(workdir)
+
+    # The real FAQ export, embedded by the stand-in, backs the article pipeline's FAQ search
+    import embeddings, faq_ingest, instrumentation
+    faqs = faq_ingest.dedupe(faq_ingest.read_faqs(os.path.join(REPO_ROOT, faq_ingest.CSV_PATH)))
+    server.airtable.seed("faq_queries", [
+        {"Question": q, "Answer": a, "Embedding": embeddings.encode(stand_in_module.fake_embedding(faq_ingest.faq_text(q, a), args.dims))}
+        for q, a in faqs.values()
+    ])
+
+    ctx = {
+        "stand_in": server, "workdir": workdir, "latency": latency, "iterations": iterations,
+        "faq_sizes": [int(s) for s in args.faq_sizes.split(",")], "dims": args.dims,
+        "article_words": args.article_words, "concurrency": args.concurrency,
+    }
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "latency": latency,
+        "benchmarks": {},
+        "failed": {},
+    }
+    try:
+        for name in names:
+            requests_before = dict(server.requests)
+            instrumentation.reset()
+            print(f"Running {name}...", flush=True)
+            try:
+                produced = BENCHMARKS[name](ctx, iterations.get(name, 1))
+            except Exception as e:
+                logger.exception("Benchmark %s failed", name)
+                results["failed"][name] = f"{type(e).__name__}: {e}"
+                continue
+            requests = {k: v - requests_before.get(k, 0) for k, v in server.requests.items() if v - requests_before.get(k, 0)}
+            spans = instrumentation.snapshot()
+            llm = instrumentation.llm_stats()
+            for label, result in produced.items():
+                result["stand_in_requests"] = requests
+                result["spans"] = spans
+                if llm:
+                    result["llm"] = llm
+                results["benchmarks"][label] = result
+    finally:
+        server.stop()
+        os.chdir(REPO_ROOT)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if baseline:
+        results["regressions"] = compare(results, baseline, args.threshold)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+
+    print_table(results)
+    print(f"\nResults written to {output}")
+    for name, error in results["failed"].items():
+        print(f"FAILED {name}: {error}")
+    for r in results.get("regressions", []):
+        print(f"REGRESSION {r['benchmark']}: p50 {r['baseline_p50_ms']} -> {r['p50_ms']} ms ({r['change']:+.0%})")
+    return 1 if results["failed"] or results.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
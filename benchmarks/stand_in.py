@@ -0,0 +1,521 @@
+"""Local stand-in for Airtable, OpenAI and the Shopify store, for offline benchmarks.
+
+Replays recorded exchanges from fixtures/recorded/<service>.jsonl when a request
+matches one exactly, and otherwise answers synthetically: an in-memory Airtable
+base seeded from fixtures/airtable, deterministic OpenAI chat/embedding replies,
+and product pages from fixtures/products. Every response is delayed by the
+configured per-service latency.
+
+    python -m benchmarks.stand_in --port 8765 --latency openai=0.6,airtable=0.08
+    python -m benchmarks.stand_in --record     # proxy to the real services and save exchanges
+"""
+import os, re, json, time, base64, random, hashlib, argparse, itertools, threading, logging
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RECORDED_DIR = os.path.join(FIXTURES_DIR, "recorded")
+UPSTREAMS = {
+    "airtable": "https://api.airtable.com",
+    "openai": "https://api.openai.com",
+    "shop": "https://primacol.com",
+}
+# Seconds added to every response; openai_tps is the simulated completion speed in tokens/s.
+# "<key>@<model>" overrides a key for one model, so model routing shows up in the timings.
+DEFAULT_LATENCY = {
+    "airtable": 0.08, "openai": 0.5, "shop": 0.1, "openai_tps": 80,
+    "openai@gpt-4o-mini": 0.3, "openai_tps@gpt-4o-mini": 160,
+}
+EMBEDDING_DIMS = int(os.environ.get("STAND_IN_EMBEDDING_DIMS", 1536))
+ARTICLE_WORDS = 600
+
+
+def parse_latency(spec):
+    """"openai=0.6,airtable=0.1" -> dict merged over the defaults"""
+    latency = dict(DEFAULT_LATENCY)
+    given = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, value = part.split("=")
+        given[name.strip()] = float(value)
+    # Setting a key for all models (e.g. openai=0) also replaces its default per-model overrides
+    for name in given:
+        for key in [k for k in latency if k.startswith(name + "@") and k not in given]:
+            del latency[key]
+    return {**latency, **given}
+
+def fake_embedding(text, dims=EMBEDDING_DIMS):
+    """Deterministic unit vector per text, so equal texts embed equally and others are near-orthogonal"""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def approx_tokens(text):
+    return max(1, len(text) // 4)
+
+def now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+# ---------- RECORD / REPLAY ----------
+
+def exchange_key(method, path, query, body):
+    canonical_query = urlencode(sorted(parse_qs(query).items()), doseq=True)
+    return f"{method} {path}?{canonical_query} {hashlib.sha1(body or b'').hexdigest()}"
+
+
+class Recordings:
+    """Exchanges captured from the real services, replayed on an exact request match"""
+
+    def __init__(self, directory=RECORDED_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.entries = {}
+        for service in UPSTREAMS:
+            path = os.path.join(directory, f"{service}.jsonl")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def save(self, service, key, status, content_type, body):
+        entry = {"key": key, "status": status, "content_type": content_type, "body": body.decode("utf-8", "replace")}
+        with self.lock:
+            self.entries[key] = entry
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{service}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+# ---------- AIRTABLE ----------
+
+class AirtableStore:
+    """In-memory tables with the subset of formulas the pipelines send"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.ids = itertools.count(1)
+
+    def seed(self, table, rows):
+        with self.lock:
+            records = self.tables.setdefault(table, [])
+            for fields in rows:
+                records.append(self._new(fields))
+
+    def seed_fixtures(self, directory=os.path.join(FIXTURES_DIR, "airtable")):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    self.seed(name[:-5], json.load(f))
+
+    def rebase(self, table, field, old, new):
+        """Point URLs seeded for the real site at the stand-in"""
+        with self.lock:
+            for record in self.tables.get(table, []):
+                value = record["fields"].get(field)
+                if isinstance(value, str) and value.startswith(old):
+                    record["fields"][field] = new + value[len(old):]
+
+    def _new(self, fields):
+        stamp = now_iso()
+        return {"id": f"rec{next(self.ids):014d}", "createdTime": stamp, "modified": stamp, "fields": dict(fields)}
+
+    def matches(self, record, formula):
+        if not formula:
+            return True
+        fields = record["fields"]
+        m = re.fullmatch(r"IS_BEFORE\(\{(\w+)\},\s*'([^']*)'\)", formula)
+        if m:
+            return str(fields.get(m.group(1), "")) < m.group(2)
+        m = re.fullmatch(r"IS_AFTER\(LAST_MODIFIED_TIME\(\),\s*'([^']*)'\)", formula)
+        if m:
+            return record["modified"] > m.group(1)
+        # OR({a}="x",{b}="y"), {a}="x", {a} = ''
+        body = formula[3:-1] if formula.startswith("OR(") else formula
+        for field, value in re.findall(r"\{(\w+)\}\s*=\s*[\"']((?:[^\"']|\\.)*)[\"']", body):
+            if str(fields.get(field) or "") == value:
+                return True
+        return not re.search(r"\{\w+\}\s*=", body)
+
+    def list(self, table, params):
+        formula = params.get("filterByFormula", [None])[0]
+        with self.lock:
+            records = [r for r in self.tables.get(table, []) if self.matches(r, formula)]
+        sorts = []
+        while f"sort[{len(sorts)}][field]" in params:
+            i = len(sorts)
+            sorts.append((params[f"sort[{i}][field]"][0], params.get(f"sort[{i}][direction]", ["asc"])[0] == "desc"))
+        for field, desc in reversed(sorts):
+            records.sort(key=lambda r: r["fields"].get(field) or 0, reverse=desc)
+        if "maxRecords" in params:
+            records = records[:int(params["maxRecords"][0])]
+
+        offset = int(params.get("offset", ["0"])[0])
+        size = int(params.get("pageSize", ["100"])[0])
+        page = records[offset:offset + size]
+        fields = params.get("fields[]")
+        out = {"records": [self._public(r, fields) for r in page]}
+        if offset + size < len(records):
+            out["offset"] = str(offset + size)
+        return out
+
+    def _public(self, record, fields=None):
+        values = record["fields"]
+        if fields:
+            values = {k: v for k, v in values.items() if k in fields}
+        return {"id": record["id"], "createdTime": record["createdTime"], "fields": values}
+
+    def create(self, table, payload):
+        with self.lock:
+            records = self.tables.setdefault(table, [])
+            if "fields" in payload:
+                created = self._new(payload["fields"])
+                records.append(created)
+                return self._public(created)
+            created = [self._new(r["fields"]) for r in payload["records"]]
+            records.extend(created)
+        return {"records": [self._public(r) for r in created]}
+
+    def update(self, table, payload):
+        merge_on = payload.get("performUpsert", {}).get("fieldsToMergeOn")
+        out = []
+        with self.lock:
+            records = self.tables.setdefault(table, [])
+            by_id = {r["id"]: r for r in records}
+            for item in payload["records"]:
+                if merge_on:
+                    key = tuple(item["fields"].get(f) for f in merge_on)
+                    target = next((r for r in records if tuple(r["fields"].get(f) for f in merge_on) == key), None)
+                    if target is None:
+                        target = self._new({})
+                        records.append(target)
+                else:
+                    target = by_id[item["id"]]
+                target["fields"].update(item["fields"])
+                target["modified"] = now_iso()
+                out.append(self._public(target))
+        return {"records": out}
+
+    def delete(self, table, ids):
+        ids = set(ids)
+        with self.lock:
+            self.tables[table] = [r for r in self.tables.get(table, []) if r["id"] not in ids]
+        return {"records": [{"id": rid, "deleted": True} for rid in ids]}
+
+# ---------- OPENAI ----------
+
+class OpenAIStandIn:
+    """Synthetic replies shaped like the pipeline prompts expect"""
+
+    def __init__(self, article_words=ARTICLE_WORDS, dims=EMBEDDING_DIMS):
+        self.article_words = article_words
+        self.dims = dims
+        # Fraction cut off the end of each article reply, which then stops with finish_reason "length"
+        self.truncate = 0
+        # Answer to the plan call; the merged-mode selection call answers trends_needed the same way
+        self.plan = {"products_needed": True, "trends_needed": True}
+        # Every chat request as {"model", "prompt", "usage"}, in arrival order
+        self.calls = []
+        self.calls_lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.rng = random.Random(7)
+
+    def product_lines(self, prompt):
+        m = re.search(r"available product lines:\n(.*)\n", prompt)
+        lines = [l.strip() for l in m.group(1).split(",")] if m else []
+        return [l for l in lines if l] or ["Decorative Plaster"]
+
+    def topic(self, lines):
+        n = next(self.counter)
+        picked = self.rng.sample(lines, min(2, len(lines)))
+        return {
+            "topic": f"Renovation guide {n}: working with {' and '.join(picked)}",
+            "target_audience": "Homeowners planning a renovation",
+            "selected_product_lines": picked,
+            "faq_keywords": [f"{picked[0].lower()} application", "surface preparation", f"drying time {n}"],
+        }
+
+    def words(self, n):
+        return " ".join(self.rng.choice(("paint", "wall", "primer", "finish", "colour", "surface", "layer", "brush", "room", "texture")) for _ in range(n))
+
+    def reply(self, prompt):
+        if "Continue the content exactly" in prompt:
+            return " " + self.words(int(self.article_words * self.truncate))
+        if '"products_needed"' in prompt:
+            return dict(self.plan)
+        m = re.search(r"Propose (\d+) distinct article topics", prompt)
+        if m:
+            lines = self.product_lines(prompt)
+            return {"topics": [{"request": i, **self.topic(lines)} for i in range(1, int(m.group(1)) + 1)]}
+        if '"selected_product_lines"' in prompt:
+            topic = self.topic(self.product_lines(prompt))
+            if 'add "trends_needed"' in prompt:
+                topic["trends_needed"] = self.plan["trends_needed"]
+            return topic
+        if "Return JSON with these fields" in prompt:
+            return {"title": "Refreshing interior walls", "target_audience": "Homeowners", "linked_products": "Chalk Paint"}
+        n = next(self.counter)
+        words = self.words(self.article_words)
+        return {
+            "title": f"Article {n} on refreshing interior walls",
+            "target_audience": "Homeowners planning a renovation",
+            "linked_products": "Decorative Plaster, Chalk Paint",
+            "content": words,
+        }
+
+    def chat(self, body):
+        """(content, usage, finish_reason) for a chat request"""
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        reply = self.reply(prompt)
+        content = reply if isinstance(reply, str) else json.dumps(reply, ensure_ascii=False)
+        finish_reason = "stop"
+        if self.truncate and isinstance(reply, dict) and "content" in reply:
+            content, finish_reason = content[:int(len(content) * (1 - self.truncate))], "length"
+        usage = {"prompt_tokens": approx_tokens(prompt), "completion_tokens": approx_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self.calls_lock:
+            self.calls.append({"model": body.get("model"), "prompt": prompt, "usage": usage})
+        return content, usage, finish_reason
+
+    def embeddings(self, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, self.dims)
+            if body.get("encoding_format") == "base64":
+                value = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                value = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": value})
+        tokens = sum(approx_tokens(t) for t in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+# ---------- SHOP ----------
+
+class Shop:
+    """Collection page listing `size` products, each served from a fixture page"""
+
+    def __init__(self, size=None, directory=os.path.join(FIXTURES_DIR, "products")):
+        self.pages = {}
+        self.json = {}
+        for name in sorted(os.listdir(directory)):
+            handle, ext = os.path.splitext(name)
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                (self.pages if ext == ".html" else self.json)[handle] = f.read()
+        templates = sorted(self.pages)
+        size = size or len(templates)
+        # Extra products reuse fixture pages under numbered handles
+        self.handles = {
+            (t if i < len(templates) else f"{t}-{i // len(templates)}"): t
+            for i, t in ((i, templates[i % len(templates)]) for i in range(size))
+        }
+
+    def collection(self):
+        links = "\n".join(f'<li><a href="/en-pl/products/{h}">{h}</a></li>' for h in self.handles)
+        return f"<html><body><header><menu-dropdown><ul>{links}</ul></menu-dropdown></header></body></html>"
+
+    def product(self, handle):
+        template = self.handles.get(handle)
+        return template and self.pages[template]
+
+    def product_json(self, handle):
+        template = self.handles.get(handle)
+        return template and self.json.get(template)
+
+# ---------- SERVER ----------
+
+class StandIn:
+    def __init__(self, latency=None, record=False, products=None, article_words=ARTICLE_WORDS, dims=EMBEDDING_DIMS, seed=True):
+        self.latency = latency or dict(DEFAULT_LATENCY)
+        self.record = record
+        self.recordings = Recordings()
+        self.airtable = AirtableStore()
+        if seed:
+            self.airtable.seed_fixtures()
+        self.openai = OpenAIStandIn(article_words, dims)
+        self.shop = Shop(products)
+        self.requests = {}
+        self.server = None
+
+    def latency_for(self, key, model=None):
+        return self.latency.get(f"{key}@{model}", self.latency.get(key, 0))
+
+    def delay(self, service, completion_tokens=0, model=None):
+        seconds = self.latency_for(service, model)
+        tps = self.latency_for("openai_tps", model)
+        if completion_tokens and tps:
+            seconds += completion_tokens / tps
+        if seconds:
+            time.sleep(seconds * random.uniform(0.9, 1.1))
+
+    def start(self, host="127.0.0.1", port=0):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.handle(self)
+            do_POST = do_PATCH = do_DELETE = do_GET
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        # Seeded products name the real shop; the scraper finds them under the stand-in's address
+        if not self.record:
+            self.airtable.rebase("products", "url", UPSTREAMS["shop"], self.url)
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def service_for(self, path):
+        if path.startswith("/v0/"):
+            return "airtable"
+        if path.startswith("/v1/"):
+            return "openai"
+        return "shop"
+
+    def handle(self, h):
+        parts = urlparse(h.path)
+        length = int(h.headers.get("Content-Length") or 0)
+        raw = h.rfile.read(length) if length else b""
+        service = self.service_for(parts.path)
+        self.requests[service] = self.requests.get(service, 0) + 1
+        key = exchange_key(h.command, parts.path, parts.query, raw)
+
+        if self.record:
+            return self.proxy(h, service, key, parts, raw)
+        recorded = self.recordings.get(key)
+        if recorded:
+            self.delay(service)
+            return self.send(h, recorded["status"], recorded["body"].encode("utf-8"), recorded["content_type"])
+        try:
+            getattr(self, f"handle_{service}")(h, parts, raw)
+        except Exception as e:
+            logger.exception("Stand-in failed on %s %s", h.command, h.path)
+            self.send_json(h, 500, {"error": {"message": str(e)}})
+
+    def proxy(self, h, service, key, parts, raw):
+        import requests
+        headers = {k: v for k, v in h.headers.items() if k.lower() in ("authorization", "content-type", "accept", "user-agent")}
+        res = requests.request(h.command, UPSTREAMS[service] + h.path, data=raw or None, headers=headers, timeout=120)
+        content_type = res.headers.get("Content-Type", "application/json")
+        if res.status_code < 500 and res.status_code != 429:
+            self.recordings.save(service, key, res.status_code, content_type, res.content)
+        self.send(h, res.status_code, res.content, content_type)
+
+    def handle_airtable(self, h, parts, raw):
+        _, _, _base, table = parts.path.split("/", 3)
+        params = parse_qs(parts.query)
+        self.delay("airtable")
+        if h.command == "GET":
+            return self.send_json(h, 200, self.airtable.list(table, params))
+        if h.command == "DELETE":
+            return self.send_json(h, 200, self.airtable.delete(table, params.get("records[]", [])))
+        payload = json.loads(raw or b"{}")
+        if h.command == "POST":
+            return self.send_json(h, 200, self.airtable.create(table, payload))
+        return self.send_json(h, 200, self.airtable.update(table, payload))
+
+    def handle_openai(self, h, parts, raw):
+        body = json.loads(raw or b"{}")
+        if parts.path.endswith("/embeddings"):
+            self.delay("openai")
+            return self.send_json(h, 200, self.openai.embeddings(body))
+
+        content, usage, finish_reason = self.openai.chat(body)
+        base = {"id": f"chatcmpl-{next(self.openai.counter)}", "created": int(time.time()), "model": body.get("model")}
+        if not body.get("stream"):
+            self.delay("openai", usage["completion_tokens"], model=body.get("model"))
+            return self.send_json(h, 200, {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            })
+
+        # Server-sent events: first byte after the base latency, then tokens at openai_tps
+        self.delay("openai", model=body.get("model"))
+        h.send_response(200)
+        h.send_header("Content-Type", "text/event-stream")
+        h.send_header("Connection", "close")
+        h.end_headers()
+        chunk_chars = 16
+        tps = self.latency_for("openai_tps", body.get("model"))
+        for i in range(0, len(content), chunk_chars):
+            delta = {"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}
+            h.wfile.write(b"data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [delta]}).encode("utf-8") + b"\n\n")
+            if tps:
+                time.sleep(approx_tokens(content[i:i + chunk_chars]) / tps)
+        if body.get("stream_options", {}).get("include_usage"):
+            h.wfile.write(b"data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}).encode("utf-8") + b"\n\n")
+        h.wfile.write(b"data: [DONE]\n\n")
+        h.wfile.flush()
+        h.close_connection = True
+
+    def handle_shop(self, h, parts, raw):
+        self.delay("shop")
+        path = parts.path.rstrip("/")
+        if "/collections/" in path:
+            return self.send(h, 200, self.shop.collection().encode("utf-8"), "text/html; charset=utf-8")
+        handle = path.rsplit("/", 1)[-1]
+        if handle.endswith(".json"):
+            body = self.shop.product_json(handle[:-5])
+            if body:
+                return self.send(h, 200, body.encode("utf-8"), "application/json")
+        else:
+            body = self.shop.product(handle)
+            if body:
+                etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+                if h.headers.get("If-None-Match") == etag:
+                    return self.send(h, 304, b"", "text/html", {"ETag": etag})
+                return self.send(h, 200, body.encode("utf-8"), "text/html; charset=utf-8", {"ETag": etag})
+        self.send(h, 404, b"Not found", "text/plain")
+
+    def send_json(self, h, status, data):
+        self.send(h, status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def send(self, h, status, body, content_type, headers=None):
+        h.send_response(status)
+        h.send_header("Content-Type", content_type)
+        h.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            h.send_header(k, v)
+        h.end_headers()
+        if body:
+            h.wfile.write(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Airtable/OpenAI/shop stand-ins for offline runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", help="per-service seconds, e.g. openai=0.6,airtable=0.08,shop=0.1,openai_tps=80")
+    parser.add_argument("--products", type=int, help="number of products on the collection page")
+    parser.add_argument("--record", action="store_true", help="proxy to the real services and save responses")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stand_in = StandIn(parse_latency(args.latency), record=args.record, products=args.products).start(args.host, args.port)
+    print(f"Stand-in listening on {stand_in.url}")
+    print(f"  AIRTABLE_API_URL={stand_in.url}/v0  OPENAI_BASE_URL={stand_in.url}/v1  COLLECTION_URL={stand_in.url}/en-pl/collections/collections")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stand_in.stop()
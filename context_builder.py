@@ -0,0 +1,130 @@
+import os, logging, threading
+import numpy as np
+import embeddings
+from vector_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+# Token budget per prompt section; override with CONTEXT_BUDGET_<SECTION>
+DEFAULT_BUDGETS = {
+    "products": 3000,
+    "trends": 600,
+    "faqs": 1500,
+    "backlog": 1200,
+}
+PRODUCT_DESCRIPTION_TOKENS = int(os.environ.get("CONTEXT_PRODUCT_DESCRIPTION_TOKENS", 400))
+TOKENIZER_MODEL = "gpt-4o"
+
+def budget_for(section, budgets=None):
+    if budgets and section in budgets:
+        return budgets[section]
+    env = os.environ.get(f"CONTEXT_BUDGET_{section.upper()}")
+    return int(env) if env is not None else DEFAULT_BUDGETS[section]
+
+# ---------- TOKENS ----------
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """tiktoken encoding for gpt-4o, or None when its BPE file can't be loaded"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable ({e}); estimating 4 characters per token")
+                _encoding = False
+        return _encoding or None
+
+def count_tokens(text):
+    enc = get_encoding()
+    return len(enc.encode(text)) if enc else (len(text) + 3) // 4
+
+def truncate_tokens(text, max_tokens):
+    enc = get_encoding()
+    if enc:
+        tokens = enc.encode(text)
+        return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens]) + "…"
+    limit = max_tokens * 4
+    return text if len(text) <= limit else text[:limit] + "…"
+
+# ---------- RANKING ----------
+
+def rank(items, texts, query_vector, client):
+    """Order items by cosine similarity of their (cached) embeddings to the query"""
+    if query_vector is None or len(items) < 2:
+        return list(items)
+    matrix = normalize(embeddings.embed_texts(client, texts))
+    scores = matrix @ normalize(query_vector)
+    return [items[i] for i in np.argsort(-scores)]
+
+def pack(lines, budget):
+    """Keep lines in order until the token budget is spent"""
+    kept, used = [], 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            if not kept and budget > 1:
+                # A single oversized row still gets a truncated slot
+                kept.append(truncate_tokens(line, budget - 1))
+                used = budget
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept), used
+
+# ---------- SERIALIZATION ----------
+
+def product_line(p):
+    desc = truncate_tokens(" ".join(str(p.get("description", "")).split()), PRODUCT_DESCRIPTION_TOKENS)
+    parts = [p.get("line", "")]
+    if p.get("url"):
+        parts.append(p["url"])
+    if p.get("colorways"):
+        parts.append(f"colors: {p['colorways']}")
+    parts.append(desc)
+    return "- " + " | ".join(x for x in parts if x)
+
+def trend_line(t):
+    return f"- {t.get('keyword', '')} ({t.get('country', '')}, score {t.get('score', '')})"
+
+def faq_line(f):
+    return f"Q: {f.get('Question', '')}\nA: {f.get('Answer', '')}"
+
+def backlog_line(b):
+    extra = ", ".join(x for x in (b.get("target_audience"), b.get("linked_products")) if x)
+    return f"- {b.get('title', '')}" + (f" [{extra}]" if extra else "")
+
+# ---------- BUILDER ----------
+
+def build_context(client, query_vector=None, products=(), trends=(), faqs=(), backlog=(), budgets=None):
+    """Serialize each section compactly within its token budget.
+
+    Products, trends and backlog are ranked by embedding similarity to the
+    query first; FAQs arrive already ranked by semantic search. Returns a
+    dict of section text plus "tokens" with the count used per section.
+    """
+    products, trends, faqs, backlog = list(products), list(trends), list(faqs), list(backlog)
+    products = rank(products, [f"{p.get('line', '')}\n{p.get('description', '')}" for p in products], query_vector, client)
+    trends = rank(trends, [t.get("keyword", "") for t in trends], query_vector, client)
+    backlog = rank(backlog, [b.get("title", "") for b in backlog], query_vector, client)
+
+    out, tokens = {}, {}
+    for section, rows, fmt in (
+        ("products", products, product_line),
+        ("trends", trends, trend_line),
+        ("faqs", faqs, faq_line),
+        ("backlog", backlog, backlog_line),
+    ):
+        out[section], tokens[section] = pack([fmt(r) for r in rows], budget_for(section, budgets))
+    out["tokens"] = tokens
+    return out
+
+def log_prompt_size(stage, prompt, sections=None):
+    total = count_tokens(prompt)
+    logger.info(f"{stage} prompt: {total} tokens" + (f" (sections: {sections})" if sections else ""))
+    return total
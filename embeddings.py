@@ -0,0 +1,99 @@
+import os, json, base64, sqlite3, hashlib, threading
+import numpy as np
+from openai import APIConnectionError
+from instrumentation import span, record_usage
+import governor
+
+# ---------- CONFIG ----------
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 256))  # texts per embeddings.create call
+
+# ---------- ENCODING ----------
+# Vectors are stored as base64 of little-endian float32 bytes: ~4x smaller than
+# a JSON list of floats and decoded without parsing.
+
+def encode(vector):
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+def decode(value):
+    """Decode an Embedding cell: base64 float32, or the legacy JSON list"""
+    if isinstance(value, list):
+        return np.asarray(value, dtype=np.float32)
+    value = value.strip()
+    if value.startswith("["):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    return np.frombuffer(base64.b64decode(value), dtype="<f4").astype(np.float32)
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# ---------- CACHE ----------
+
+class EmbeddingCache:
+    """(model, text hash) -> float32 vector, persisted in SQLite"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+            self.db.commit()
+
+    def get_many(self, model, hashes):
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self.db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    (model, *chunk),
+                ).fetchall()
+                found.update({h: np.frombuffer(v, dtype="<f4").astype(np.float32) for h, v in rows})
+        return found
+
+    def put_many(self, model, items):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype="<f4").tobytes()) for h, v in items],
+            )
+            self.db.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def default_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+def embed_texts(client, texts, model=EMBEDDING_MODEL, cache=None, batch_size=EMBEDDING_BATCH_SIZE):
+    """Embed texts as a float32 matrix, calling the API only for texts not cached yet"""
+    cache = cache or default_cache()
+    hashes = [text_hash(t) for t in texts]
+    vectors = cache.get_many(model, list(dict.fromkeys(hashes)))
+
+    todo = list({h: t for h, t in zip(hashes, texts) if h not in vectors}.items())
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        with span("openai", call="embedding_batch", model=model):
+            resp = governor.call("openai", lambda: client.embeddings.create(model=model, input=[t for _, t in batch]),
+                                 retryable=APIConnectionError)
+        record_usage(getattr(resp, "usage", None), call="embedding_batch", model=model)
+        fresh = [(h, d.embedding) for (h, _), d in zip(batch, sorted(resp.data, key=lambda d: d.index))]
+        cache.put_many(model, fresh)
+        vectors.update({h: np.asarray(v, dtype=np.float32) for h, v in fresh})
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([vectors[h] for h in hashes])
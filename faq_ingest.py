@@ -0,0 +1,101 @@
+import os, re, csv, argparse, logging
+from openai import OpenAI
+from dotenv import load_dotenv
+import airtable_client
+import airtable_mirror
+import embeddings
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+FAQ_TABLE = "faq_queries"
+CSV_PATH = "tidio_datasources_export.csv"
+
+# ---------- CSV ----------
+
+def question_key(question):
+    """Normalized question used to spot near-identical duplicates"""
+    text = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(text.split())
+
+def read_faqs(path=CSV_PATH):
+    """Stream Q/A rows from the Tidio export, yielding (question, answer)"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            question = (row.get("Question") or "").strip()
+            answer = (row.get("Answer") or "").strip()
+            if question and answer:
+                yield question, answer
+
+def dedupe(rows):
+    """Collapse near-identical questions, keeping the most detailed answer"""
+    best = {}
+    for question, answer in rows:
+        key = question_key(question)
+        if key not in best or len(answer) > len(best[key][1]):
+            best[key] = (question, answer)
+    return best
+
+def faq_text(question, answer):
+    return f"Q: {question}\nA: {answer}"
+
+# ---------- INGEST ----------
+
+def ingest(path=CSV_PATH, client=None, dry_run=False):
+    """Embed new or changed FAQ pairs and write them to faq_queries.
+
+    Existing records are matched by normalized question; a pair whose text is
+    unchanged and already carries an embedding is skipped. Embeddings come
+    from the local text-hash cache where possible and are stored as compact
+    base64 float32 in the Embedding column. Returns counts of what happened.
+    """
+    faqs = dedupe(read_faqs(path))
+    existing = {}
+    for r in airtable_client.fetch_records(FAQ_TABLE, fields=["Question", "Answer"], ttl=0):
+        key = question_key(r["fields"].get("Question", ""))
+        if key:
+            existing.setdefault(key, r)
+    # Listing ids without an embedding avoids downloading the vectors themselves
+    missing_embedding = {
+        r["id"] for r in airtable_client.fetch_records(FAQ_TABLE, formula="{Embedding} = ''", fields=["Question"], ttl=0)
+    }
+
+    creates, updates = [], []
+    for key, (question, answer) in faqs.items():
+        record = existing.get(key)
+        if record is None:
+            creates.append((question, answer))
+            continue
+        f = record["fields"]
+        if f.get("Answer", "").strip() != answer or record["id"] in missing_embedding:
+            updates.append((record["id"], question, answer))
+
+    report = {"rows": len(faqs), "created": len(creates), "updated": len(updates),
+              "unchanged": len(faqs) - len(creates) - len(updates)}
+    logger.info(f"FAQ ingest: {report}")
+    if dry_run or not (creates or updates):
+        return report
+
+    client = client or OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    pairs = [(q, a) for q, a in creates] + [(q, a) for _, q, a in updates]
+    vectors = embeddings.embed_texts(client, [faq_text(q, a) for q, a in pairs])
+    encoded = [embeddings.encode(v) for v in vectors]
+
+    airtable_mirror.create_records(FAQ_TABLE, [
+        {"Question": q, "Answer": a, "Embedding": e}
+        for (q, a), e in zip(creates, encoded[:len(creates)])
+    ])
+    airtable_mirror.update_records(FAQ_TABLE, [
+        {"id": rid, "fields": {"Question": q, "Answer": a, "Embedding": e}}
+        for (rid, q, a), e in zip(updates, encoded[len(creates):])
+    ])
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Embed the Tidio FAQ export into the faq_queries table")
+    parser.add_argument("csv", nargs="?", default=CSV_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+    print(ingest(args.csv, dry_run=args.dry_run))
@@ -1,13 +1,85 @@
-from pytrends.request import TrendReq
-import pandas as pd
-import time
 import requests
 import os
-import json
-from datetime import datetime
+from datetime import datetime, date
 from datetime import timedelta
 from dotenv import load_dotenv
 import logging
+import airtable_mirror
+import trends_collector
+import trends_aggregate
+
+# Rerunning on the same day updates (date, country, keyword) rows instead of adding new ones
+UPSERT = os.environ.get("TRENDS_UPSERT", "1") == "1"
+UPSERT_KEY = ["date", "country", "keyword"]
+
+SEARCH_QUERIES = {
+    "PL": [
+        "remont mieszkania",
+        "remont domu", 
+        "malowanie ścian",
+        "malowanie sufitu",
+        "przygotowanie ścian do malowania",
+        "jak pomalować ściany",
+        "farba do salonu",
+        "farba do kuchni",
+        "farba do wnętrz",
+        "jak wybrać farbę",
+        "kolory farb do wnętrz",
+        "farby do pokoju dziecięcego",
+        "farby odporne na wilgoć",
+        "malowanie pokoju",
+        "malowanie mebli",
+        "tapetowanie ścian",
+        "dekoracja wnętrz",
+        "renowacja ścian",
+        "jak zrobić remont",
+        "tanie farby do malowania",
+        "profesjonalne malowanie"
+    ],
+    "UK": [
+        "home renovation",
+        "DIY wall painting",
+        "decorative wall finishes",
+        "interior paint trends",
+        "wall texture paint",
+        "eco-friendly wall paint",
+        "decorative plaster",
+        "chalk paint furniture",
+        "microcement walls",
+        "concrete effect paint",
+        "wood protection oil",
+        "decking stain",
+        "wall colour ideas 2025",
+        "popular living room colours",
+        "bathroom waterproof paint",
+        "kitchen wall paint trends",
+        "furniture upcycling paint",
+        "wall stencils",
+        "modern wall design ideas",
+        "sustainable home decor"
+    ],
+    "DE": [
+        "Wohnung renovieren",
+        "Wände streichen",
+        "Dekorative Wandgestaltung",
+        "Farbtrends Innenräume",
+        "Wandfarbe Ideen",
+        "Ökologische Wandfarbe",
+        "Dekorputz",
+        "Möbel mit Kreidefarbe streichen",
+        "Mikrozement Wände",
+        "Betonoptik Farbe",
+        "Holzschutz Öl",
+        "Terrassenlasur",
+        "Wohnzimmer Farbe Trends",
+        "Badezimmer Wandfarbe",
+        "Küche Wandfarbe",
+        "Möbel Upcycling Farbe",
+        "Wandschablonen",
+        "Moderne Wandgestaltung",
+        "Nachhaltige Wohnideen"
+    ]
+}
 
 def main(): 
     load_dotenv()
@@ -24,218 +96,106 @@ def main():
 
     def delete_old_records():
         """Delete records older than 10 days from Airtable."""
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         threshold_date = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')
-
-        url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
-        params = {
-            'filterByFormula': f"IS_BEFORE({{date}}, '{threshold_date}')",
-            'pageSize': 100
-        }
-
-        def get_old_records():
-            old_record_ids = []
-            offset = None
-            while True:
-                if offset:
-                    params['offset'] = offset
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                data = response.json()
-                for record in data.get('records', []):
-                    old_record_ids.append(record['id'])
-                offset = data.get('offset')
-                if not offset:
-                    break
-            return old_record_ids
-
-        def delete_records(record_ids):
-            for i in range(0, len(record_ids), 10):
-                batch = record_ids[i:i+10]
-                delete_url = f"{url}"
-                payload = {'records': batch}
-                response = requests.delete(delete_url, headers=headers, json=payload)
-                response.raise_for_status()
-
-        old_records = get_old_records()
+        old_records = [
+            r['id'] for r in airtable_mirror.records(AIRTABLE_TABLE_NAME, where={"date": ("<", threshold_date)}, max_staleness=0)
+        ]
         if old_records:
-            delete_records(old_records)
+            airtable_mirror.delete_records(AIRTABLE_TABLE_NAME, old_records)
             msg = f"Deleted {len(old_records)} records older than {threshold_date}."
             logger.info(msg); print(msg)
         else:
             msg = "No records older than 10 days to delete."
             logger.info(msg); print(msg)
 
-    def upload_to_airtable(trendy_keywords_dict, country):
-        """Upload trending keywords to Airtable."""
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
+    def upload_to_airtable(columns, country):
+        """Upload one country's aggregated columns to Airtable in 10-record batches."""
         upload_date = datetime.now().strftime('%Y-%m-%d')
 
         geo = "GB" if country == "UK" else country
 
-        for keyword, score in trendy_keywords_dict.items():
-            time.sleep(0.5)  # avoid hitting API too fast
+        rows = []
+        for keyword, score in zip(columns["query"], columns["score"].tolist()):
             encoded_keyword = keyword.replace(' ', '%20')
-            source_url = f"https://trends.google.com/trends/explore?q={encoded_keyword}&geo={geo}"
-            
-            payload = {
-                "fields": {
-                    "date": upload_date,
-                    "platform": "Google Trends",
-                    "country": country,
-                    "keyword": keyword,
-                    "score": float(score/10),
-                    "source_url": source_url
-                }
-            }
-            msg = json.dumps(payload, indent=2)
+            rows.append({
+                "date": upload_date,
+                "platform": "Google Trends",
+                "country": country,
+                "keyword": keyword,
+                "score": float(score/10),
+                "source_url": f"https://trends.google.com/trends/explore?q={encoded_keyword}&geo={geo}"
+            })
+
+        try:
+            if UPSERT:
+                written = airtable_mirror.upsert_records(AIRTABLE_TABLE_NAME, rows, merge_on=UPSERT_KEY)
+            else:
+                written = airtable_mirror.create_records(AIRTABLE_TABLE_NAME, rows)
+            msg = f"Uploaded {len(written)} keywords for {country}"
+            logger.info(msg); print(msg)
+            return True
+        except requests.exceptions.RequestException as e:
+            msg = f"Failed to upload keywords for {country} after retries: {e}; collected data kept for the next run"
             logger.info(msg); print(msg)
-            try:
-                response = requests.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                msg = f"Uploaded: {keyword} ({country}) with score {float(score/10)}"
-                logger.info(msg); print(msg)
-            except requests.exceptions.RequestException as e:
-                msg = f"Failed to upload {keyword} ({country}): {e}"
-                logger.info(msg); print(msg)
+            return False
+
+    def previous_scores():
+        """Most recent earlier score per country and normalized keyword, with its age in days."""
+        today = datetime.now().date()
+        previous = {}
+        rows = airtable_mirror.rows(AIRTABLE_TABLE_NAME)
+        for row in rows:
+            if not (row.get("date") and row.get("keyword") and row.get("score") is not None):
+                continue
+            age = (today - date.fromisoformat(row["date"][:10])).days
+            if age <= 0:
+                continue  # today's rows are the ones being replaced
+            key = trends_aggregate.normalize_query(row["keyword"])
+            country_scores = previous.setdefault(row.get("country"), {})
+            if key not in country_scores or age < country_scores[key][1]:
+                # Stored scores are divided by 10 on upload
+                country_scores[key] = (float(row["score"]) * 10, age)
+        return previous
 
     # Step 1: Delete old records
     delete_old_records()
 
-    # Step 2: Seed queries
-    search_queries = {
-        "PL": [
-            "remont mieszkania",
-            "remont domu", 
-            "malowanie ścian",
-            "malowanie sufitu",
-            "przygotowanie ścian do malowania",
-            "jak pomalować ściany",
-            "farba do salonu",
-            "farba do kuchni",
-            "farba do wnętrz",
-            "jak wybrać farbę",
-            "kolory farb do wnętrz",
-            "farby do pokoju dziecięcego",
-            "farby odporne na wilgoć",
-            "malowanie pokoju",
-            "malowanie mebli",
-            "tapetowanie ścian",
-            "dekoracja wnętrz",
-            "renowacja ścian",
-            "jak zrobić remont",
-            "tanie farby do malowania",
-            "profesjonalne malowanie"
-        ],
-        "UK": [
-            "home renovation",
-            "DIY wall painting",
-            "decorative wall finishes",
-            "interior paint trends",
-            "wall texture paint",
-            "eco-friendly wall paint",
-            "decorative plaster",
-            "chalk paint furniture",
-            "microcement walls",
-            "concrete effect paint",
-            "wood protection oil",
-            "decking stain",
-            "wall colour ideas 2025",
-            "popular living room colours",
-            "bathroom waterproof paint",
-            "kitchen wall paint trends",
-            "furniture upcycling paint",
-            "wall stencils",
-            "modern wall design ideas",
-            "sustainable home decor"
-        ],
-        "DE": [
-            "Wohnung renovieren",
-            "Wände streichen",
-            "Dekorative Wandgestaltung",
-            "Farbtrends Innenräume",
-            "Wandfarbe Ideen",
-            "Ökologische Wandfarbe",
-            "Dekorputz",
-            "Möbel mit Kreidefarbe streichen",
-            "Mikrozement Wände",
-            "Betonoptik Farbe",
-            "Holzschutz Öl",
-            "Terrassenlasur",
-            "Wohnzimmer Farbe Trends",
-            "Badezimmer Wandfarbe",
-            "Küche Wandfarbe",
-            "Möbel Upcycling Farbe",
-            "Wandschablonen",
-            "Moderne Wandgestaltung",
-            "Nachhaltige Wohnideen"
-        ]
-    }
-
-    # Step 3: Init pytrends
-    pytrends = TrendReq(hl='pl-PL', tz=120)
+    # Step 2: Collect related queries (5 keywords per payload, countries in parallel, resumable)
+    checkpoint = trends_collector.Checkpoint()
+    collected, failed = trends_collector.collect(SEARCH_QUERIES, checkpoint=checkpoint, keep_checkpoint=True)
+    for country, keywords in failed.items():
+        msg = f"{len(keywords)} keywords for {country} failed and will be retried on the next run"
+        logger.info(msg); print(msg)
 
-    # Step 4: Collect trends
+    # Step 3: Merge each country's seed results into one weighted score per query
+    previous = previous_scores() if trends_aggregate.SCORING == "decayed" else {}
     trendy_keywords = {}
 
-    for country, keywords in search_queries.items():
-        geo = "GB" if country == "UK" else country
-        trendy_keywords[country] = {}
-
+    for country, per_keyword in collected.items():
         msg = f"=== Processing country: {country} ==="
         logger.info(msg); print(msg)
 
-        for kw in keywords:
-            msg = f"Processing keyword: {kw}"
-            logger.info(msg); print(msg)
-            try:
-                time.sleep(120)  # long wait to avoid block
-                pytrends.build_payload([kw], cat=0, timeframe='now 7-d', geo=geo, gprop='')
-                related_queries = pytrends.related_queries()
-
-                if kw in related_queries:
-                    top = related_queries[kw]['top']
-                    if top is not None:
-                        for _, row in top.iterrows():
-                            keyword = row['query']
-                            score = row['value']
-                            trendy_keywords[country][keyword] = score * 0.75
-
-                    rising = related_queries[kw]['rising']
-                    if rising is not None:
-                        for _, row in rising.iterrows():
-                            keyword = row['query']
-                            score = row['value']
-                            trendy_keywords[country][keyword] = score * 1.25
-
-            except Exception as e:
-                msg = f"Error processing {kw}: {e}"
-                logger.info(msg); print(msg)
-                continue
+        trendy_keywords[country] = trends_aggregate.aggregate(per_keyword, previous=previous.get(country))
 
-        msg = f"Found {len(trendy_keywords[country])} trending keywords for {country}"
+        msg = f"Found {len(trendy_keywords[country]['query'])} trending keywords for {country} ({trends_aggregate.SCORING} scoring)"
         logger.info(msg); print(msg)
 
-    # Step 5: Upload results
+    # Step 4: Upload results
+    uploaded = True
     for country, trends in trendy_keywords.items():
-        if trends:
-            msg = f"Uploading {len(trends)} keywords for {country}"
+        if trends["query"]:
+            msg = f"Uploading {len(trends['query'])} keywords for {country}"
             logger.info(msg); print(msg)
-            upload_to_airtable(trends, country)
+            uploaded = upload_to_airtable(trends, country) and uploaded
             msg = f"Upload to Airtable completed for {country}"
             logger.info(msg); print(msg)
         else:
             msg = f"No trending keywords found for {country}"
             logger.info(msg); print(msg)
 
+    # A rerun today re-uploads from the checkpoint instead of querying Google again
+    if uploaded and not failed:
+        checkpoint.clear()
+
 if __name__ == "__main__":
     main()
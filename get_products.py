@@ -2,26 +2,30 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
 from datetime import datetime
-from pyairtable import Table
-from math import ceil
+import product_http
+import product_sync
+import markets
+from instrumentation import CustomRailwayLogFormatter, span, incr
 import os
-import time
+import queue
+import threading
 from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import logging
 import json
 
-class CustomRailwayLogFormatter(logging.Formatter):
-    def format(self, record):
-        log_record = {
-            "time": self.formatTime(record),
-            "level": record.levelname,
-            "message": record.getMessage()
-        }
-        return json.dumps(log_record)
-    
+COLLECTION_URL = markets.get(markets.DEFAULT_MARKET)["collection_url"]  # per-market URLs live in markets.MARKETS
+SCRAPER_WORKERS = int(os.environ.get("SCRAPER_WORKERS", min(4, os.cpu_count() or 1)))  # parallel browsers
+SCRAPER_RETRIES = int(os.environ.get("SCRAPER_RETRIES", 2))  # extra attempts per failing link
+PAGE_TIMEOUT = int(os.environ.get("SCRAPER_PAGE_TIMEOUT", 15))
+# "auto": plain HTTP first, browser only for pages missing required fields; "http" or "selenium" force one backend
+SCRAPER_BACKEND = os.environ.get("SCRAPER_BACKEND", "auto")
+# Images built with INSTALL_CHROME=false have no browser: "auto" then stays on HTTP
+INSTALL_CHROME = os.environ.get("INSTALL_CHROME", "true").lower() != "false"
+# Send If-None-Match/If-Modified-Since from the last sync so unchanged pages are skipped
+CONDITIONAL_GET = os.environ.get("SCRAPER_CONDITIONAL_GET", "1") == "1"
+
 def get_logger():
     logger = logging.getLogger()
     logger.setLevel(logging.INFO) # this should be just "logger.setLevel(logging.INFO)" but markdown is interpreting it wrong here...
@@ -33,16 +37,7 @@ def get_logger():
     logger.addHandler(handler)
     return logger
 
-def main():
-    print("call initiated")
-
-    load_dotenv()
-
-    AIRTABLE_API_KEY = os.environ.get("AIRTABLE_API_KEY")
-    AIRTABLE_BASE_ID = os.environ.get("AIRTABLE_BASE_ID")
-    AIRTABLE_TABLE_NAME = 'products'
-
-
+def chrome_options():
     # Change to your chromedriver path if necessary
     chrome_options = webdriver.ChromeOptions()
     # chrome_options.set_capability('browserless:token', os.environ['BROWSER_TOKEN'])
@@ -64,86 +59,193 @@ def main():
     chrome_options.add_argument("--mute-audio")
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--no-sandbox")
+    return chrome_options
 
+def new_driver():
     # driver = webdriver.Remote(
     #     command_executor=os.environ['BROWSER_WEBDRIVER_ENDPOINT'],
-    #     options=chrome_options
+    #     options=chrome_options()
     # )
-
-    driver = webdriver.Chrome(options=chrome_options)
-
-    WebDriverWait(driver, 15)
-    logging.basicConfig(level=logging.INFO)
-    log = get_logger()
-    log.info("browser launched")
-    # Step 1: Go to the collections page
-    COLLECTION_URL = "https://primacol.com/en-pl/collections/collections"
-    driver.get(COLLECTION_URL)
-
-    # Step 2: Wait for the product grid to load
-    WebDriverWait(driver, 15).until(
+    return webdriver.Chrome(options=chrome_options())
+
+def driver_alive(driver):
+    """Probe the browser with a cheap command; a crashed one still has its session_id"""
+    try:
+        driver.title
+        return True
+    except WebDriverException:
+        return False
+
+def discard_if_dead(driver):
+    """driver when it still answers, else None after cleaning up what is left of it"""
+    if driver is None or driver_alive(driver):
+        return driver
+    try:
+        driver.quit()
+    except Exception:
+        pass
+    return None
+
+def collect_product_links(driver, collection_url=COLLECTION_URL):
+    """Read product links from the collections page menu"""
+    driver.get(collection_url)
+    WebDriverWait(driver, PAGE_TIMEOUT).until(
         EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/products/']"))
     )
-
-    # Step 3: Extract product links from the collections page
     product_links = set()
     products = driver.find_elements(By.CSS_SELECTOR, "menu-dropdown a[href*='/products/']:not(.card__colors a):not(.card__colors *)")
-
     for p in products:
         url = p.get_attribute("href")
         if url:
             product_links.add(url)
+    return product_links
 
-    all_data = []
-    # Step 4: Scrape details from each individual product page
-    log.info(f"Found {len(product_links)} products. Scraping details...")
-    print(f"Found {len(product_links)} products. Scraping details...")
-    for link in product_links:
+def scrape_product(driver, link):
+    """Scrape one product page; raises if the page never becomes ready"""
+    with span("selenium_page"):
         driver.get(link)
+        wait = WebDriverWait(driver, PAGE_TIMEOUT)
+        # Explicit readiness instead of a fixed sleep: document loaded and the title rendered
+        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
+        wait.until(EC.visibility_of_element_located((By.TAG_NAME, "h1")))
+
+    # Open every accordion except section "5." in one round-trip
+    driver.execute_script("""
+        document.querySelectorAll('.summary__title h3').forEach(function (el) {
+            if (!el.textContent.trim().toLowerCase().startsWith('5.')) { el.click(); }
+        });
+    """)
+    name = driver.find_element(By.TAG_NAME, "h1").text
+    desc_blocks = driver.find_elements(By.CSS_SELECTOR, ".product__description, .summary__title h3, .accordion__content.rte")
+
+    description = "\n".join([
+        el.text for el in desc_blocks
+        if el.text.strip() and not el.text.strip().startswith("5.")
+    ])
+
+    color_blocks = driver.find_elements(By.CSS_SELECTOR, ".color__swatch-tooltip")
+    colors = ", ".join([el.get_attribute("textContent") for el in color_blocks])
+    # Any additional selectors for details:
+    # For example: price, image, availability, etc.
+    return {"line": name, "colorways": colors, "updated": datetime.now().strftime("%Y-%m-%d"), "description": description, "url": link}
+
+def scrape_links(product_links, workers=None, retries=None):
+    """Scrape links with a pool of browsers sharing one work queue.
+
+    Returns (items, failures); failures lists {"url", "error", "attempts"} for
+    links that still failed after `retries` extra attempts.
+    """
+    workers = workers or SCRAPER_WORKERS
+    retries = SCRAPER_RETRIES if retries is None else retries
+    log = logging.getLogger()
+
+    work = queue.Queue()
+    for link in product_links:
+        work.put((link, 1))
+    items, failures = [], []
+    lock = threading.Lock()
+
+    def worker():
+        driver = None
+        try:
+            while True:
+                try:
+                    link, attempt = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    driver = driver or new_driver()
+                    item = scrape_product(driver, link)
+                    with lock:
+                        items.append(item)
+                    log.info(f"Scraped {link}: {item['line']}")
+                except Exception as e:
+                    if isinstance(e, WebDriverException):
+                        driver = discard_if_dead(driver)
+                    if attempt <= retries:
+                        incr("retries_total", service="selenium")
+                        log.info(f"Retrying {link} (attempt {attempt} failed: {type(e).__name__})")
+                        work.put((link, attempt + 1))
+                    else:
+                        log.error(f"Failed to scrape {link} after {attempt} attempts: {e}")
+                        with lock:
+                            failures.append({"url": link, "error": f"{type(e).__name__}: {e}", "attempts": attempt})
+                finally:
+                    work.task_done()
+        finally:
+            if driver is not None:
+                driver.quit()
+
+    threads = [threading.Thread(target=worker, name=f"scraper-{i}") for i in range(min(workers, work.qsize()))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return items, failures
+
+def resolve_backend(backend=None):
+    """Backend to scrape with; "auto" drops its browser fallback when Chrome is not installed"""
+    backend = backend or SCRAPER_BACKEND
+    if backend not in ("auto", "http", "selenium"):
+        raise ValueError(f"Unknown scraper backend: {backend}")
+    if not INSTALL_CHROME:
+        if backend == "selenium":
+            raise ValueError("SCRAPER_BACKEND=selenium needs Chrome, but this image was built with INSTALL_CHROME=false")
+        return "http"
+    return backend
+
+def main(backend=None, market=None):
+    """Scrape one market's collection (the default market when none is given) and sync it"""
+    print("call initiated")
+
+    load_dotenv()
+
+    backend = resolve_backend(backend)
+    market = markets.get(market)
+
+    logging.basicConfig(level=logging.INFO)
+    log = get_logger()
+
+    # Step 1-3: Extract product links from the collections page
+    product_links = set()
+    if backend != "selenium":
+        try:
+            product_links = product_http.collect_product_links(market["collection_url"])
+        except Exception as e:
+            log.info(f"HTTP link collection failed: {e}")
+    if not product_links and backend != "http":
+        driver = new_driver()
+        log.info("browser launched")
         try:
-            time.sleep(5)
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "[data-product-name], h1, .product__title, .product__description, .summary__title h3, .accordion__content.rte"))
-            )
-
-            for elem in driver.find_elements(By.CSS_SELECTOR, ".summary__title h3"):
-                if not elem.text.strip().lower().startswith("5."):
-                    elem.click()
-            name = driver.find_element(By.TAG_NAME, "h1").text
-            desc_blocks = driver.find_elements(By.CSS_SELECTOR, ".product__description, .summary__title h3, .accordion__content.rte")
-            
-            description = "\n".join([
-                el.text for el in desc_blocks
-                if el.text.strip() and not el.text.strip().startswith("5.")
-            ])
-            print(description)
-
-            color_blocks = driver.find_elements(By.CSS_SELECTOR, ".color__swatch-tooltip")
-            print(f"Found {len(color_blocks)} colors")
-            colors = ", ".join([el.get_attribute("textContent") for el in color_blocks])
-            print(colors)
-            # Any additional selectors for details:
-            # For example: price, image, availability, etc.
-            item = {"line": name, "colorways": colors, "updated": datetime.now().strftime("%Y-%m-%d"), "description": description, "url": link}
-            all_data.append(item)
-        except Exception:
-            print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!!Failed to scrape {link}")
-            continue
-        
-
-    driver.quit()
-
-    # Print or save the results
-    for row in all_data:
-        print(row)
-    log.info(f"uploading {len(all_data)} records to Airtable")
-    table = Table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
-
-    batch_size = 10
-    num_batches = ceil(len(all_data) / batch_size)
-    for i in range(num_batches):
-        batch = all_data[i * batch_size: (i + 1) * batch_size]
-        table.batch_create(batch)  # add typecast=True if you want Airtable to auto-convert types
+            product_links = collect_product_links(driver, market["collection_url"])
+        finally:
+            driver.quit()
+
+    # Step 4: Scrape details from each individual product page
+    log.info(f"Found {len(product_links)} {market['code']} products. Scraping details with the {backend} backend...")
+    all_data, failures, unchanged, page_validators = [], [], [], {}
+    remaining = list(product_links)
+    if backend != "selenium":
+        validators = product_sync.validators(product_sync.load_snapshot()) if CONDITIONAL_GET else {}
+        all_data, remaining, unchanged, page_validators = product_http.scrape_links(remaining, validators)
+        log.info(f"HTTP backend scraped {len(all_data)} products, {len(unchanged)} unchanged, {len(remaining)} need the browser")
+    if remaining and backend == "http":
+        failures = [{"url": link, "error": "required fields missing from static HTML", "attempts": 1} for link in remaining]
+    elif remaining:
+        items, failures = scrape_links(remaining)
+        all_data.extend(items)
+    if failures:
+        log.error(f"{len(failures)} product pages failed: {json.dumps(failures)}")
+
+    # Step 5: Only write what changed; failed pages keep their existing records.
+    # Without a link list (collection failed or came back empty) nothing may be deleted.
+    if not product_links:
+        log.error(f"No {market['code']} product links collected; syncing without deletes")
+    log.info(f"syncing {len(all_data)} scraped records to Airtable")
+    report = product_sync.sync(all_data, all_links=product_links or None, unchanged=unchanged, page_validators=page_validators,
+                               market=market["code"])
+    report["failures"] = failures
+    return report
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
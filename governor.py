@@ -0,0 +1,220 @@
+import os, time, fcntl, random, logging, threading
+from contextlib import contextmanager
+import requests
+from instrumentation import incr
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+# Per service: requests per second (0 disables the bucket), requests in flight, and the wait after a 429
+# that carries no Retry-After. Rates are shared by every thread and, through the bucket
+# files in GOVERNOR_STATE_DIR, every process (each gunicorn worker and its mirror-sync
+# thread), so concurrent jobs queue behind one budget instead of tripping 429s on each
+# other. The concurrency cap still applies per process.
+GOVERNOR_STATE_DIR = os.environ.get("GOVERNOR_STATE_DIR", ".cache/governor")  # empty: rates per process
+SERVICES = {
+    "airtable": {
+        "rate": float(os.environ.get("AIRTABLE_RATE_LIMIT", 5)),  # Airtable allows 5 req/s per base
+        "concurrency": int(os.environ.get("AIRTABLE_CONCURRENCY", 5)),
+        "penalty": 30,  # Airtable asks clients to back off for 30 seconds after a 429
+    },
+    "openai": {
+        "rate": float(os.environ.get("OPENAI_RATE_LIMIT", 8)),
+        "concurrency": int(os.environ.get("OPENAI_CONCURRENCY", 8)),
+        "penalty": None,
+    },
+    "google_trends": {
+        "rate": float(os.environ.get("TRENDS_RATE_LIMIT", 1)),
+        "concurrency": int(os.environ.get("TRENDS_CONCURRENCY", 3)),
+        "penalty": 60,
+    },
+    "shop": {
+        "rate": float(os.environ.get("SHOP_RATE_LIMIT", 0)),  # 0: no rate limit, only the concurrency cap
+        "concurrency": int(os.environ.get("SHOP_CONCURRENCY", 8)),
+        "penalty": None,
+    },
+}
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 5))
+TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 60))  # seconds, when the caller sets none
+BASE_DELAY = float(os.environ.get("HTTP_RETRY_BASE_DELAY", 0.5))  # first backoff, doubled per attempt
+MAX_DELAY = float(os.environ.get("HTTP_RETRY_MAX_DELAY", 60))
+
+# Methods that can be repeated without changing the outcome. Others (e.g. POST
+# creates) are only retried when the server certainly did not process them.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent.
+
+    With a path the bucket state lives in that file under an flock, so every
+    process using the same file draws from one budget.
+    """
+
+    def __init__(self, rate, capacity=None, path=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.path = path
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _shared(self):
+        """Load tokens/updated from the state file and store them back, under an exclusive flock"""
+        if not self.path:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                saved = f.read().split()
+                if len(saved) == 2:
+                    self.tokens, self.updated = float(saved[0]), float(saved[1])
+                yield
+                f.seek(0)
+                f.truncate()
+                f.write(f"{self.tokens} {self.updated}")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock, self._shared():
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Drain the bucket so nobody sends for `seconds`, e.g. after a 429"""
+        with self.lock, self._shared():
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class Limiter:
+    """Rate and concurrency limit for one service"""
+
+    def __init__(self, name, rate, concurrency, penalty=None, path=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, path=path) if rate else None
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.penalty = penalty
+
+    @contextmanager
+    def slot(self):
+        with self.slots:
+            if self.bucket:
+                self.bucket.acquire()
+            yield
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter(service):
+    with _limiters_lock:
+        if service not in _limiters:
+            config = SERVICES.get(service, {"rate": 0, "concurrency": 8, "penalty": None})
+            path = GOVERNOR_STATE_DIR and os.path.join(GOVERNOR_STATE_DIR, f"{service}.bucket")
+            _limiters[service] = Limiter(service, config["rate"], config["concurrency"], config["penalty"], path)
+        return _limiters[service]
+
+# ---------- RETRY POLICY ----------
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry `attempt` (1-based): Retry-After if given, else jittered exponential"""
+    if retry_after is not None:
+        return min(MAX_DELAY, retry_after)
+    return random.uniform(0.5, 1.0) * min(MAX_DELAY, BASE_DELAY * 2 ** (attempt - 1))
+
+def parse_retry_after(headers):
+    value = (headers or {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def should_retry(status=None, error=None, idempotent=True):
+    """429 and unsent requests are always safe to repeat; 5xx and timeouts only when idempotent"""
+    if status == 429:
+        return True
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not idempotent:
+        return False
+    if error is not None:
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    return status in RETRY_STATUSES
+
+def _wait(limit, attempt, status, retry_after, reason):
+    if status == 429:
+        retry_after = retry_after if retry_after is not None else limit.penalty
+        if limit.bucket and retry_after:
+            limit.bucket.pause(retry_after)
+    delay = backoff_delay(attempt, retry_after)
+    incr("retries_total", service=limit.name, reason=reason)
+    logger.info(f"{limit.name}: retry {attempt}/{MAX_RETRIES} in {delay:.1f}s ({reason})")
+    time.sleep(delay)
+
+# ---------- ENTRY POINTS ----------
+
+def request(service, session, method, url, idempotent=None, max_retries=None, **kwargs):
+    """Send an HTTP request through the service's limiter, retrying per the policy above.
+
+    Returns the last response (callers still raise_for_status) or raises the
+    last connection error once retries are exhausted.
+    """
+    limit = limiter(service)
+    idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    kwargs.setdefault("timeout", TIMEOUT)
+    for attempt in range(1, max_retries + 2):
+        try:
+            with limit.slot():
+                res = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if attempt > max_retries or not should_retry(error=e, idempotent=idempotent):
+                raise
+            _wait(limit, attempt, None, None, type(e).__name__)
+            continue
+        if attempt > max_retries or not should_retry(status=res.status_code, idempotent=idempotent):
+            return res
+        _wait(limit, attempt, res.status_code, parse_retry_after(res.headers), str(res.status_code))
+
+def error_status(error):
+    """HTTP status of an SDK exception (OpenAI, pytrends) if it carries one"""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    return status or getattr(response, "status_code", None)
+
+def call(service, fn, idempotent=True, max_retries=None, retryable=()):
+    """Run an SDK call (OpenAI, pytrends) under the service's limiter with the same retry policy.
+
+    retryable lists extra exception types, such as the SDK's connection
+    errors, that count as transient.
+    """
+    limit = limiter(service)
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(1, max_retries + 2):
+        try:
+            with limit.slot():
+                return fn()
+        except Exception as e:
+            status = error_status(e)
+            transient = should_retry(status=status, idempotent=idempotent) if status else (idempotent and isinstance(e, retryable))
+            if attempt > max_retries or not transient:
+                raise
+            response = getattr(e, "response", None)
+            _wait(limit, attempt, status, parse_retry_after(getattr(response, "headers", None)), str(status or type(e).__name__))
@@ -0,0 +1,23 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+
+# Load app.py once in the master and fork workers from it. Importing the app opens
+# no connections, threads or database handles (the OpenAI client, job executor and
+# caches are all created on first use), so forking after it is safe. Combine with
+# PRELOAD_MODULES=article_generator to share that module's memory between workers.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+# Jobs run in worker threads, so a job whose worker is gone will never finish;
+# fail such jobs instead of leaving them queued/running forever
+def on_starting(server):
+    import jobs
+    jobs.fail_interrupted()
+
+def child_exit(server, worker):
+    import jobs
+    jobs.fail_interrupted(owner=worker.pid)
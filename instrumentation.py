@@ -0,0 +1,161 @@
+import json, time, logging, threading, functools
+from contextlib import contextmanager
+
+# ---------- CONFIG ----------
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger("instrumentation")
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # labels -> {"buckets": [...], "sum": float, "count": int}
+
+
+class CustomRailwayLogFormatter(logging.Formatter):
+    """One JSON object per log line; span fields passed via `extra` are included"""
+
+    def format(self, record):
+        log_record = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        log_record.update(getattr(record, "fields", {}))
+        return json.dumps(log_record, ensure_ascii=False, default=str)
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+# ---------- COUNTERS & HISTOGRAMS ----------
+
+def incr(name, value=1, **labels):
+    """Add to a counter, e.g. incr("openai_tokens_total", 120, kind="prompt")"""
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(stage, seconds, **labels):
+    """Record one stage duration in the stage_duration_seconds histogram"""
+    key = _key({"stage": stage, **labels})
+    with _lock:
+        h = _histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+
+def record_usage(usage, **labels):
+    """Count prompt/completion tokens from an OpenAI usage object"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            incr("openai_tokens_total", tokens, kind=kind.split("_")[0], **labels)
+
+# ---------- SPANS ----------
+
+@contextmanager
+def span(stage, **labels):
+    """Time a block: feeds the latency histogram and logs one structured JSON line"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        observe(stage, seconds, **labels)
+        if status == "error":
+            incr("stage_errors_total", stage=stage, **labels)
+        logger.info(f"{stage} {status} in {seconds * 1000:.1f} ms", extra={"fields": {
+            "stage": stage, "status": status, "duration_ms": round(seconds * 1000, 1), **labels
+        }})
+
+def traced(stage, **labels):
+    """Decorator form of span()"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage, **labels):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+# ---------- EXPORT ----------
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{v}"'.replace("\n", " ") for k, v in labels)
+    return "{" + body + "}"
+
+def render_prometheus():
+    """All metrics of this process in Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: {**v, "buckets": list(v["buckets"])} for k, v in _histograms.items()}
+
+    lines = []
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+
+    lines.append("# HELP stage_duration_seconds Duration of pipeline stages and outbound calls")
+    lines.append("# TYPE stage_duration_seconds histogram")
+    for labels, h in sorted(histograms.items()):
+        for bound, count in zip(BUCKETS, h["buckets"]):
+            lines.append(f"stage_duration_seconds_bucket{_labels_text(labels + (('le', str(bound)),))} {count}")
+        lines.append(f"stage_duration_seconds_bucket{_labels_text(labels + (('le', '+Inf'),))} {h['count']}")
+        lines.append(f"stage_duration_seconds_sum{_labels_text(labels)} {h['sum']:.6f}")
+        lines.append(f"stage_duration_seconds_count{_labels_text(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """Counters and per-stage count/total seconds as plain dicts, keyed like Prometheus series"""
+    with _lock:
+        counters = {f"{n}{_labels_text(labels)}": v for (n, labels), v in _counters.items()}
+        stages = {_labels_text(labels): {"count": h["count"], "seconds": round(h["sum"], 6)} for labels, h in _histograms.items()}
+    return {"counters": counters, "stages": stages}
+
+def llm_stats():
+    """Calls, latency and tokens per LLM call type and model, from the "openai" spans and token counters"""
+    with _lock:
+        histograms = {labels: (h["count"], h["sum"]) for labels, h in _histograms.items()}
+        counters = dict(_counters)
+
+    stats = {}
+    def entry(labels):
+        key = (labels.get("call"), labels.get("model"))
+        return stats.setdefault(key, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0})
+
+    for labels, (count, seconds) in histograms.items():
+        labels = dict(labels)
+        if labels.get("stage") == "openai":
+            e = entry(labels)
+            e["calls"] += count
+            e["seconds"] += seconds
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name == "openai_tokens_total":
+            entry(labels)[f"{labels['kind']}_tokens"] += value
+
+    rows = []
+    for (call, model), e in sorted(stats.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        rows.append({
+            "call": call, "model": model, **e,
+            "seconds": round(e["seconds"], 6),
+            "avg_ms": round(e["seconds"] / e["calls"] * 1000, 1) if e["calls"] else None,
+            "completion_tokens_per_s": round(e["completion_tokens"] / e["seconds"], 1) if e["seconds"] else None,
+        })
+    return rows
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
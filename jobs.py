@@ -0,0 +1,168 @@
+import os, json, uuid, sqlite3, hashlib, threading, logging
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+JOBS_DB = os.environ.get("JOBS_DB", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))  # concurrent jobs per web process
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 20))  # queued jobs across all processes
+JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", 3600))  # seconds before an unfinished job stops blocking dedup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    owner INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status);
+"""
+
+ACTIVE = ("queued", "running")
+INTERRUPTED = "Interrupted: the web process running it stopped before it finished"
+
+# Created on first submit so gunicorn's preloaded master never owns worker threads
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+def connect():
+    os.makedirs(os.path.dirname(JOBS_DB) or ".", exist_ok=True)
+    db = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    if "owner" not in {c["name"] for c in db.execute("PRAGMA table_info(jobs)")}:
+        try:
+            db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")  # databases from before owner was tracked
+        except sqlite3.OperationalError:
+            pass  # another process added it first
+    return db
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+def dedup_key(kind, params):
+    body = json.dumps({"kind": kind, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+def as_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    if job["result"] is not None:
+        job["result"] = json.loads(job["result"])
+    del job["dedup_key"]
+    return job
+
+# ---------- API ----------
+
+def submit(kind, fn, params=None, dedup=False):
+    """Queue fn(**params) as a job.
+
+    With dedup=True (for idempotent jobs such as scrapes) an identical
+    queued/running job is returned instead of starting another one. Returns
+    (job, created). Raises QueueFull when JOB_QUEUE_LIMIT jobs are already
+    waiting.
+    """
+    params = params or {}
+    key = dedup_key(kind, params)
+    stale_before = (datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_AFTER)).isoformat()
+    db = connect()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        row = dedup and db.execute(
+            "SELECT * FROM jobs WHERE dedup_key = ? AND status IN (?, ?) AND created_at > ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (key, *ACTIVE, stale_before),
+        ).fetchone()
+        if row:
+            db.execute("COMMIT")
+            return as_dict(row), False
+
+        queued = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at > ?", (stale_before,)
+        ).fetchone()[0]
+        if queued >= JOB_QUEUE_LIMIT:
+            db.execute("ROLLBACK")
+            raise QueueFull(f"{queued} jobs already queued")
+
+        job_id = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO jobs (id, kind, params, dedup_key, status, created_at, owner) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(params, ensure_ascii=False), key, now(), os.getpid()),
+        )
+        db.execute("COMMIT")
+        row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        db.close()
+
+    get_executor().submit(run_job, job_id, kind, fn, params)
+    return as_dict(row), True
+
+def get(job_id):
+    db = connect()
+    try:
+        row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        db.close()
+    return as_dict(row) if row else None
+
+def update(job_id, **fields):
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    db = connect()
+    try:
+        db.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        db.close()
+
+def fail_interrupted(owner=None):
+    """Mark queued/running jobs of a stopped process (all of them when owner is None) as failed.
+
+    Their threads died with the process, so they would otherwise stay active
+    forever. Called from gunicorn's hooks: for every job on server start and
+    for a worker's jobs when that worker exits. Returns the number marked.
+    """
+    sql = "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status IN (?, ?)"
+    params = [INTERRUPTED, now(), *ACTIVE]
+    if owner is not None:
+        sql += " AND owner = ?"
+        params.append(owner)
+    db = connect()
+    try:
+        count = db.execute(sql, params).rowcount
+    finally:
+        db.close()
+    if count:
+        logger.warning("Marked %s interrupted job(s) as failed", count)
+    return count
+
+def run_job(job_id, kind, fn, params):
+    update(job_id, status="running", started_at=now())
+    logger.info("Job %s (%s) started", job_id, kind)
+    try:
+        result = fn(**params)
+        update(job_id, status="done", finished_at=now(), result=json.dumps(result, ensure_ascii=False, default=str))
+        logger.info("Job %s (%s) done", job_id, kind)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, kind)
+        update(job_id, status="failed", finished_at=now(), error=str(e))
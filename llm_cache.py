@@ -0,0 +1,187 @@
+import os, json, time, sqlite3, hashlib, threading, logging
+from collections import Counter
+from openai import APIConnectionError
+from instrumentation import span, incr, record_usage
+import governor
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# Seconds an entry stays valid per call type; 0 means never cached.
+# Override any of them with LLM_CACHE_TTL_<TYPE>, e.g. LLM_CACHE_TTL_PLAN=3600.
+DEFAULT_TTLS = {
+    "plan": 24 * 3600,
+    "query_embedding": 30 * 24 * 3600,
+    "select": 0,
+    "write": 0,
+    "continue": 0,
+    "repair": 0,
+}
+
+def ttl_for(call_type):
+    env = os.environ.get(f"LLM_CACHE_TTL_{call_type.upper()}")
+    return int(env) if env is not None else DEFAULT_TTLS.get(call_type, 0)
+
+def make_key(call_type, model, payload):
+    """Key on call type, model and a hash of the prompt plus request parameters"""
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{call_type}:{model}:{hashlib.sha256(body.encode('utf-8')).hexdigest()}"
+
+
+class LLMCache:
+    """SQLite-backed response cache with per-entry expiry and size-bounded LRU eviction"""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, call_type TEXT NOT NULL, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+            self.db.commit()
+
+    def get(self, key, call_type):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses[call_type] += 1
+                return None
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits[call_type] += 1
+        incr("llm_cache_hits_total", call=call_type)
+        return json.loads(row[0])
+
+    def put(self, key, call_type, value, ttl):
+        body = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, call_type, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, call_type, body, len(body), now + ttl, now),
+            )
+            self.db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "evictions": self.evictions,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+
+class CachedClient:
+    """Wraps an OpenAI client so cacheable call types are served from LLMCache.
+
+    Pass either a client or a factory; a factory is only called on first use.
+    """
+
+    def __init__(self, client=None, cache=None, factory=None):
+        self._client = client
+        self.factory = factory
+        self._client_lock = threading.Lock()
+        self._cache = cache
+        self._cache_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.factory()
+            return self._client
+
+    @property
+    def cache(self):
+        # Opened lazily so importing this module never touches the disk
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = LLMCache()
+            return self._cache
+
+    def chat(self, call_type, model, messages, **params):
+        """Chat completion content for the given call type, cached per its TTL"""
+        ttl = ttl_for(call_type)
+        key = make_key(call_type, model, {"messages": messages, **params})
+        if ttl:
+            cached = self.cache.get(key, call_type)
+            if cached is not None:
+                return cached
+        content = self._create(call_type, model, messages, **params).choices[0].message.content
+        if ttl:
+            self.cache.put(key, call_type, content, ttl)
+        return content
+
+    def chat_result(self, call_type, model, messages, **params):
+        """(content, finish_reason) of an uncached chat completion, for callers that act on truncation"""
+        choice = self._create(call_type, model, messages, **params).choices[0]
+        return choice.message.content or "", choice.finish_reason
+
+    def _create(self, call_type, model, messages, **params):
+        with span("openai", call=call_type, model=model):
+            resp = governor.call("openai", lambda: self.client.chat.completions.create(
+                model=model, messages=messages, **params), retryable=APIConnectionError)
+        record_usage(getattr(resp, "usage", None), call=call_type, model=model)
+        return resp
+
+    def stream(self, call_type, model, messages, **params):
+        """Yield content deltas of a streamed chat completion; streams are never cached"""
+        params.setdefault("stream_options", {"include_usage": True})
+        with span("openai", call=call_type, model=model):
+            # Retried only until the stream opens; a stream cut mid-way surfaces to the caller
+            resp = governor.call("openai", lambda: self.client.chat.completions.create(
+                model=model, messages=messages, stream=True, **params), retryable=APIConnectionError)
+            for chunk in resp:
+                # With include_usage the last chunk has no choices, only the token counts
+                if getattr(chunk, "usage", None):
+                    record_usage(chunk.usage, call=call_type, model=model)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    def embedding(self, model, text, call_type="query_embedding"):
+        ttl = ttl_for(call_type)
+        key = make_key(call_type, model, {"input": text})
+        if ttl:
+            cached = self.cache.get(key, call_type)
+            if cached is not None:
+                return cached
+        with span("openai", call=call_type, model=model):
+            resp = governor.call("openai", lambda: self.client.embeddings.create(model=model, input=text),
+                                 retryable=APIConnectionError)
+        record_usage(getattr(resp, "usage", None), call=call_type, model=model)
+        vector = resp.data[0].embedding
+        if ttl:
+            self.cache.put(key, call_type, vector, ttl)
+        return vector
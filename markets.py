@@ -0,0 +1,47 @@
+import os
+
+# ---------- CONFIG ----------
+# One entry per shop market. The key is also the country code trends are stored
+# under in Airtable. collection_url is where that market's products are scraped
+# from; products belong to the market whose shop prefix their url starts with.
+# language is the phrase the (Polish) article prompt uses for the output language.
+SHOP_URL = os.environ.get("SHOP_URL", "https://primacol.com")
+MARKETS = {
+    "PL": {
+        "name": "Polska",
+        "collection_url": os.environ.get("COLLECTION_URL_PL") or os.environ.get("COLLECTION_URL") or f"{SHOP_URL}/en-pl/collections/collections",
+        "language": "po angielsku",
+    },
+    "UK": {
+        "name": "Wielka Brytania",
+        "collection_url": os.environ.get("COLLECTION_URL_UK", f"{SHOP_URL}/en-gb/collections/collections"),
+        "language": "po angielsku",
+    },
+    "DE": {
+        "name": "Niemcy",
+        "collection_url": os.environ.get("COLLECTION_URL_DE", f"{SHOP_URL}/de-de/collections/collections"),
+        "language": "po niemiecku",
+    },
+}
+DEFAULT_MARKET = os.environ.get("DEFAULT_MARKET", "PL")
+
+
+class UnknownMarket(ValueError):
+    pass
+
+
+def get(market):
+    """Config of one market, accepting any letter case"""
+    code = (market or DEFAULT_MARKET).upper()
+    if code not in MARKETS:
+        raise UnknownMarket(f"Unknown market {market!r}, expected one of {sorted(MARKETS)}")
+    return {"code": code, **MARKETS[code]}
+
+def shop_prefix(market):
+    """Part of the collection URL every product url of the market starts with"""
+    return get(market)["collection_url"].split("/collections/")[0] + "/"
+
+def market_of(url):
+    """Market owning a product url: longest matching shop prefix, else the default market"""
+    matches = [code for code in MARKETS if (url or "").startswith(shop_prefix(code))]
+    return max(matches, key=lambda code: len(shop_prefix(code)), default=DEFAULT_MARKET)
@@ -0,0 +1,180 @@
+import json
+
+# ---------- INCREMENTAL OBJECT PARSER ----------
+# Reads one top-level JSON object as text arrives (whole or in stream deltas)
+# and keeps every field whose value has fully arrived, so a truncated or
+# malformed reply still yields its completed fields plus the raw start of the
+# field it was cut off in.
+
+WHITESPACE = " \t\r\n"
+
+
+def decode_partial_string(raw):
+    """Decode the body of an unterminated JSON string, dropping a trailing half escape or surrogate pair"""
+    for cut in range(0, 7):
+        body = raw[:len(raw) - cut] if cut else raw
+        try:
+            text = json.loads('"' + body + '"')
+        except json.JSONDecodeError:
+            continue
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            text = text[:-1]  # first half of a \uXXXX\uXXXX pair
+        return text
+    return raw
+
+
+class ObjectParser:
+    """Feed JSON object text with feed(); completed fields collect in .fields.
+
+    pending_key/pending_value describe the field being read when the text
+    stopped (pending_value only for strings). done turns True on the
+    closing brace; error is set, and further input ignored, on text that
+    cannot be part of a JSON object.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.state = "start"
+        self.key = None
+        self.buffer = []
+        self.escaped = False
+        self.depth = 0
+        self.in_string = False
+        self.done = False
+        self.error = None
+
+    @property
+    def pending_key(self):
+        return self.key if self.state in ("colon", "value", "string", "nested", "scalar") else None
+
+    @property
+    def pending_value(self):
+        """Decoded start of the string being read ("" if its value had not begun)"""
+        if self.state in ("colon", "value"):
+            return ""
+        if self.state != "string":
+            return None
+        return decode_partial_string("".join(self.buffer))
+
+    def feed(self, text):
+        """Consume more text; returns the [(key, value)] fields it completed"""
+        completed = []
+        for ch in text:
+            if self.done or self.error:
+                break
+            field = self._step(ch)
+            if field:
+                completed.append(field)
+        return completed
+
+    def _fail(self, ch):
+        self.error = f"unexpected {ch!r} while reading {self.state}"
+
+    def _finish_value(self, raw):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self.error = f"invalid value for {self.key!r}"
+            return None
+        self.fields[self.key] = value
+        field = (self.key, value)
+        self.key, self.buffer = None, []
+        return field
+
+    def _step(self, ch):
+        state = self.state
+        if state == "start":
+            # Anything before the object (e.g. a ```json fence) is skipped
+            if ch == "{":
+                self.state = "key_or_end"
+        elif state in ("key_or_end", "key_next"):
+            if ch in WHITESPACE:
+                pass
+            elif ch == '"':
+                self.state, self.buffer = "key", []
+            elif ch == "}" and state == "key_or_end":
+                self.done = True
+            else:
+                self._fail(ch)
+        elif state == "key":
+            if self.escaped:
+                self.escaped = False
+                self.buffer.append(ch)
+            elif ch == "\\":
+                self.escaped = True
+                self.buffer.append(ch)
+            elif ch == '"':
+                self.key = decode_partial_string("".join(self.buffer))
+                self.state, self.buffer = "colon", []
+            else:
+                self.buffer.append(ch)
+        elif state == "colon":
+            if ch == ":":
+                self.state = "value"
+            elif ch not in WHITESPACE:
+                self._fail(ch)
+        elif state == "value":
+            if ch in WHITESPACE:
+                pass
+            elif ch == '"':
+                self.state, self.buffer = "string", []
+            elif ch in "{[":
+                self.state, self.buffer, self.depth, self.in_string = "nested", [ch], 1, False
+            else:
+                self.state, self.buffer = "scalar", [ch]
+        elif state == "string":
+            if self.escaped:
+                self.escaped = False
+                self.buffer.append(ch)
+            elif ch == "\\":
+                self.escaped = True
+                self.buffer.append(ch)
+            elif ch == '"':
+                self.state = "after_value"
+                return self._finish_value('"' + "".join(self.buffer) + '"')
+            else:
+                self.buffer.append(ch)
+        elif state == "nested":
+            self.buffer.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.state = "after_value"
+                    return self._finish_value("".join(self.buffer))
+        elif state == "scalar":
+            if ch in ",}" or ch in WHITESPACE:
+                field = self._finish_value("".join(self.buffer))
+                self.state = "after_value"
+                if ch in ",}" and not self.error:
+                    self._after_value(ch)
+                return field
+            self.buffer.append(ch)
+        elif state == "after_value":
+            self._after_value(ch)
+        return None
+
+    def _after_value(self, ch):
+        if ch == ",":
+            self.state = "key_next"
+        elif ch == "}":
+            self.done = True
+        elif ch not in WHITESPACE:
+            self._fail(ch)
+
+
+def parse(text):
+    """Parse a whole (possibly truncated) reply in one go; returns the parser for inspection"""
+    parser = ObjectParser()
+    parser.feed(text)
+    return parser
@@ -0,0 +1,63 @@
+import time, logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+# ---------- DEPENDENCY GRAPH RUNNER ----------
+
+def run_graph(stages, max_workers=8, on_stage=None):
+    """Run stages concurrently as soon as their dependencies are done.
+
+    stages maps name -> (dependency names, fn); fn gets the dict of results
+    produced so far. Returns (results, timings) where timings maps each stage
+    to its start offset and duration in seconds. The first failing stage
+    cancels everything not yet started and its exception is re-raised.
+    on_stage(name, result) is called from the calling thread as each stage
+    finishes.
+    """
+    for name, (deps, _) in stages.items():
+        missing = [d for d in deps if d not in stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+
+    results, timings = {}, {}
+    started = time.perf_counter()
+    pending = dict(stages)
+    running = {}
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        try:
+            with span("pipeline", step=name):
+                return fn(results)
+        finally:
+            timings[name] = {
+                "start": round(t0 - started, 4),
+                "duration": round(time.perf_counter() - t0, 4),
+            }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            ready = [n for n, (deps, _) in pending.items() if all(d in results for d in deps)]
+            for name in ready:
+                _, fn = pending.pop(name)
+                running[pool.submit(timed, name, fn)] = name
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+                if on_stage:
+                    on_stage(name, results[name])
+
+    timings["total"] = {"start": 0.0, "duration": round(time.perf_counter() - started, 4)}
+    logger.info("Stage timings: %s", timings)
+    return results, timings
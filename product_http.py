@@ -0,0 +1,154 @@
+import os, re, copy, logging, requests
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from lxml import html
+from instrumentation import traced
+import governor
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+HTTP_WORKERS = int(os.environ.get("SCRAPER_HTTP_WORKERS", 8))
+HTTP_TIMEOUT = int(os.environ.get("SCRAPER_HTTP_TIMEOUT", 15))
+REQUIRED_FIELDS = ("line", "description")
+
+session = requests.Session()
+session.headers.update({"User-Agent": "Mozilla/5.0 (compatible; primacol-content-generator)"})
+session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_WORKERS))
+session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_WORKERS))
+
+# Same selectors the Selenium scraper uses, as XPath so lxml needs no cssselect
+def has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+DESC_XPATH = (
+    f"//*[{has_class('product__description')}]"
+    f" | //*[{has_class('summary__title')}]//h3"
+    f" | //*[{has_class('accordion__content')} and {has_class('rte')}]"
+)
+COLOR_XPATH = f"//*[{has_class('color__swatch-tooltip')}]"
+LINK_XPATH = "//menu-dropdown//a[contains(@href, '/products/')][not(ancestor::*[" + has_class("card__colors") + "])]"
+
+# ---------- PARSING ----------
+
+BLOCK_TAGS = ("p", "br", "li", "div", "tr", "h1", "h2", "h3", "h4", "h5", "h6")
+
+def clean_text(el):
+    """Collapse whitespace and break lines at block elements, like a browser's innerText"""
+    el = copy.deepcopy(el)
+    for child in el.iter(*BLOCK_TAGS):
+        child.tail = "\n" + (child.tail or "")
+    lines = (re.sub(r"\s+", " ", line).strip() for line in el.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def parse_product_html(page, link):
+    """Extract the product row from a product page's HTML"""
+    tree = html.fromstring(page)
+    h1 = tree.xpath("//h1")
+    name = clean_text(h1[0]) if h1 else ""
+
+    # Section "5." stays collapsed in the browser, so skip its title and content
+    blocks, skip_content = [], False
+    for el in tree.xpath(DESC_XPATH):
+        text = clean_text(el)
+        if el.tag == "h3":
+            skip_content = text.lower().startswith("5.")
+        elif "accordion__content" in el.get("class", "") and skip_content:
+            skip_content = False
+            continue
+        if text and not text.startswith("5."):
+            blocks.append(text)
+
+    colors = ", ".join(el.text_content() for el in tree.xpath(COLOR_XPATH))
+    return {"line": name, "colorways": colors, "updated": datetime.now().strftime("%Y-%m-%d"), "description": "\n".join(blocks), "url": link}
+
+def parse_product_json(data, link):
+    """Build the product row from Shopify's /products/<handle>.json payload"""
+    product = data.get("product", {})
+    description = clean_text(html.fromstring(product["body_html"])) if product.get("body_html") else ""
+    colors = []
+    for option in product.get("options", []):
+        if option.get("name", "").lower() in ("color", "colour", "kolor", "farbe"):
+            colors = option.get("values", [])
+    return {"line": product.get("title", ""), "colorways": ", ".join(colors), "updated": datetime.now().strftime("%Y-%m-%d"), "description": description, "url": link}
+
+def parse_product_links(page, base_url):
+    tree = html.fromstring(page)
+    return {urljoin(base_url, a.get("href")) for a in tree.xpath(LINK_XPATH) if a.get("href")}
+
+def is_complete(item):
+    return bool(item) and all(item.get(f) for f in REQUIRED_FIELDS)
+
+# ---------- FETCHING ----------
+
+def collect_product_links(collection_url):
+    res = governor.request("shop", session, "GET", collection_url, timeout=HTTP_TIMEOUT)
+    res.raise_for_status()
+    return parse_product_links(res.text, collection_url)
+
+def product_json_url(link):
+    parts = urlparse(link)
+    return f"{parts.scheme}://{parts.netloc}{parts.path.rstrip('/')}.json"
+
+NOT_MODIFIED = "not_modified"
+
+@traced("product_http")
+def scrape_product(link, validator=None):
+    """Scrape a product over plain HTTP.
+
+    Returns (item, page_validator). item is NOT_MODIFIED when the server
+    answers 304 to the ETag/Last-Modified in validator, and None when
+    required fields are missing.
+    """
+    headers = {}
+    if validator and validator.get("etag"):
+        headers["If-None-Match"] = validator["etag"]
+    if validator and validator.get("last_modified"):
+        headers["If-Modified-Since"] = validator["last_modified"]
+    res = governor.request("shop", session, "GET", link, headers=headers, timeout=HTTP_TIMEOUT)
+    if res.status_code == 304:
+        return NOT_MODIFIED, validator
+    res.raise_for_status()
+    page_validator = {"etag": res.headers.get("ETag"), "last_modified": res.headers.get("Last-Modified")}
+    item = parse_product_html(res.text, link)
+    if is_complete(item):
+        return item, page_validator
+
+    # Fill gaps from the store's JSON endpoint before giving up on HTTP
+    res = governor.request("shop", session, "GET", product_json_url(link), timeout=HTTP_TIMEOUT)
+    if res.ok:
+        fallback = parse_product_json(res.json(), link)
+        item = {k: item.get(k) or fallback.get(k) for k in item}
+    return (item if is_complete(item) else None), page_validator
+
+def scrape_links(product_links, validators=None):
+    """Scrape links concurrently over HTTP.
+
+    validators maps url -> {"etag", "last_modified"} from a previous run.
+    Returns (items, missing, unchanged, page_validators): missing are links
+    that need the browser because the static page lacked required fields or
+    could not be fetched, unchanged are links answered with 304.
+    """
+    validators = validators or {}
+    items, missing, unchanged, page_validators = [], [], [], {}
+
+    def one(link):
+        try:
+            return link, *scrape_product(link, validators.get(link))
+        except Exception as e:
+            logger.info(f"HTTP scrape failed for {link}: {e}")
+            return link, None, None
+
+    with ThreadPoolExecutor(max_workers=HTTP_WORKERS) as pool:
+        for link, item, validator in pool.map(one, product_links):
+            if validator and (validator.get("etag") or validator.get("last_modified")):
+                page_validators[link] = validator
+            if item == NOT_MODIFIED:
+                unchanged.append(link)
+            elif item:
+                items.append(item)
+            else:
+                missing.append(link)
+    return items, missing, unchanged, page_validators
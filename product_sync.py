@@ -0,0 +1,153 @@
+import os, json, hashlib, logging
+import airtable_client
+import airtable_mirror
+import markets
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+TABLE = "products"
+SNAPSHOT_PATH = os.environ.get("PRODUCT_SNAPSHOT_PATH", ".cache/product_snapshot.json")
+HASHED_FIELDS = ("line", "colorways", "description")
+# A scrape that would delete more than this share of a market's products is refused
+# (a broken collection page looks exactly like every product being discontinued)
+MAX_DELETE_FRACTION = float(os.environ.get("PRODUCT_SYNC_MAX_DELETE_FRACTION", 0.5))
+
+
+class SyncRefused(Exception):
+    pass
+
+
+# ---------- HASHING ----------
+
+def content_hash(fields):
+    """Stable hash over the scraped content, ignoring whitespace noise and the `updated` date"""
+    parts = [" ".join(str(fields.get(f) or "").split()) for f in HASHED_FIELDS]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+# ---------- SNAPSHOT ----------
+# url -> {"hash", "record_id", "etag", "last_modified"}; lets the HTTP scraper
+# send conditional requests so unchanged pages are not downloaded again.
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_snapshot(snapshot, path=SNAPSHOT_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def validators(snapshot):
+    """Conditional-request headers per url from the last sync"""
+    return {
+        url: {"etag": entry.get("etag"), "last_modified": entry.get("last_modified")}
+        for url, entry in snapshot.items()
+        if entry.get("etag") or entry.get("last_modified")
+    }
+
+# ---------- SYNC ----------
+
+def sync(items, all_links=None, unchanged=(), page_validators=None, dry_run=False, market=None, max_delete_fraction=None):
+    """Upsert scraped products into Airtable keyed by url.
+
+    items are scraped rows; unchanged are urls the server reported as not
+    modified (HTTP 304). An unchanged url with no record (e.g. deleted by
+    hand) is reported as "missing" and its validators are dropped, so the
+    next run downloads and creates it again. Records whose url is no longer in all_links are
+    deleted; when all_links is None nothing is deleted, so a partial scrape
+    never removes products. Raises SyncRefused, before writing anything,
+    when that would delete more than max_delete_fraction (default
+    MAX_DELETE_FRACTION) of the existing records. Duplicate records for the
+    same url left by older blind batch creates are removed. With a market
+    only that market's records (by url, see markets.market_of) are compared,
+    so scraping one market never deletes another's products. Returns a
+    report of what changed.
+    """
+    page_validators = page_validators or {}
+    existing = airtable_client.fetch_records(
+        TABLE, fields=["url", *HASHED_FIELDS], ttl=0
+    )
+    by_url, duplicates = {}, []
+    for r in existing:
+        url = r["fields"].get("url")
+        if not url or (market and markets.market_of(url) != market):
+            continue
+        if url in by_url:
+            duplicates.append(r["id"])
+        else:
+            by_url[url] = r
+
+    creates, updates, same = [], [], []
+    new_hashes = {}
+    for item in items:
+        url = item["url"]
+        new_hashes[url] = content_hash(item)
+        record = by_url.get(url)
+        if record is None:
+            creates.append(item)
+        elif content_hash(record["fields"]) != new_hashes[url]:
+            updates.append({"id": record["id"], "fields": item})
+        else:
+            same.append(url)
+
+    missing = sorted(url for url in set(unchanged) if url not in by_url)
+    if missing:
+        logger.warning(f"{len(missing)} unchanged product page(s) have no Airtable record, rescraping next run: {missing}")
+    unchanged = set(unchanged) - set(missing)
+
+    keep = set(all_links) | set(unchanged) | set(new_hashes) if all_links is not None else None
+    deletes = list(duplicates)
+    if keep is not None:
+        gone = [r["id"] for url, r in by_url.items() if url not in keep]
+        max_delete_fraction = MAX_DELETE_FRACTION if max_delete_fraction is None else max_delete_fraction
+        if gone and len(gone) > max_delete_fraction * len(by_url):
+            raise SyncRefused(
+                f"Refusing to delete {len(gone)} of {len(by_url)} {market or 'all'} products "
+                f"(limit {max_delete_fraction:.0%}); check the collection page, or raise PRODUCT_SYNC_MAX_DELETE_FRACTION"
+            )
+        deletes += gone
+
+    report = {
+        "created": [i["url"] for i in creates],
+        "updated": [u["fields"]["url"] for u in updates],
+        "deleted": len(deletes),
+        "duplicates_removed": len(duplicates),
+        "unchanged": len(same) + len(unchanged),
+        "missing": missing,
+    }
+    logger.info(
+        f"Product sync: {len(creates)} created, {len(updates)} updated, "
+        f"{len(deletes)} deleted ({len(duplicates)} duplicates), {report['unchanged']} unchanged"
+    )
+    if dry_run:
+        return report
+
+    created = airtable_mirror.create_records(TABLE, creates)
+    airtable_mirror.update_records(TABLE, updates)
+    airtable_mirror.delete_records(TABLE, deletes)
+
+    # Remember hashes, record ids and HTTP validators for the next run
+    snapshot = load_snapshot()
+    record_ids = {url: r["id"] for url, r in by_url.items()}
+    record_ids.update({r["fields"].get("url"): r["id"] for r in created})
+    for url in missing:
+        snapshot.pop(url, None)
+    for url in set(new_hashes) | unchanged:
+        entry = snapshot.get(url, {})
+        entry.update(page_validators.get(url, {}))
+        if url in new_hashes:
+            entry["hash"] = new_hashes[url]
+        entry["record_id"] = record_ids.get(url, entry.get("record_id"))
+        snapshot[url] = entry
+    if keep is not None:
+        snapshot = {
+            url: e for url, e in snapshot.items()
+            if url in keep or (market and markets.market_of(url) != market)
+        }
+    save_snapshot(snapshot)
+    return report
@@ -0,0 +1,11 @@
+import os, sys
+
+# The app is a flat set of top-level modules; make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture_text(*parts):
+    with open(os.path.join(FIXTURES_DIR, *parts), encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,35 @@
+import time
+import governor
+
+
+def timed(fn):
+    start = time.monotonic()
+    fn()
+    return time.monotonic() - start
+
+
+def test_buckets_on_one_file_share_the_rate(tmp_path):
+    path = str(tmp_path / "airtable.bucket")
+    first, second = governor.TokenBucket(4, path=path), governor.TokenBucket(4, path=path)
+    for _ in range(4):
+        first.acquire()
+    # The other process's bucket sees the spent tokens and waits for a refill
+    assert timed(second.acquire) >= 0.2
+
+def test_buckets_without_a_file_are_independent():
+    first, second = governor.TokenBucket(4), governor.TokenBucket(4)
+    for _ in range(4):
+        first.acquire()
+    assert timed(second.acquire) < 0.05
+
+def test_pause_reaches_every_process(tmp_path):
+    path = str(tmp_path / "airtable.bucket")
+    first, second = governor.TokenBucket(10, path=path), governor.TokenBucket(10, path=path)
+    first.pause(0.3)
+    assert timed(second.acquire) >= 0.25
+
+def test_limiters_keep_their_bucket_in_the_state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(governor, "GOVERNOR_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(governor, "_limiters", {})
+    governor.limiter("airtable").bucket.acquire()
+    assert (tmp_path / "airtable.bucket").exists()
@@ -0,0 +1,121 @@
+import re, threading
+import pytest
+from benchmarks import stand_in as stand_in_module
+import airtable_client, airtable_mirror, backlog_index, embeddings, governor, instrumentation
+import article_generator
+from llm_cache import CachedClient
+from vector_index import VectorIndex
+
+MODELS = {"plan": "plan-model", "select": "select-model", "write": "write-model", "repair": "repair-model"}
+# Distinct per-model latency, so llm_stats has to attribute time to the right model
+LATENCY = "openai=0,airtable=0,shop=0,openai_tps=0,openai@plan-model=0.05,openai@write-model=0.15"
+TREND_LINE = re.compile(r"\(\w*, score ")
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = stand_in_module.StandIn(stand_in_module.parse_latency(LATENCY), article_words=50, dims=64).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def openai(server, monkeypatch, tmp_path):
+    """The article pipeline pointed at the stand-in, with fresh caches and indexes in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server.url}/v1")
+    monkeypatch.setattr(article_generator, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(article_generator, "llm", CachedClient(factory=article_generator.make_client))
+    monkeypatch.setattr(article_generator, "MODELS", MODELS)
+    monkeypatch.setattr(article_generator, "faq_index", VectorIndex(article_generator.FAQ_INDEX_DIR))
+    monkeypatch.setattr(backlog_index, "index", VectorIndex(backlog_index.BACKLOG_INDEX_DIR))
+    monkeypatch.setattr(embeddings, "_cache", None)
+    # No rate limit, so the timed spans hold only the stand-in's latency
+    monkeypatch.setitem(governor._limiters, "openai", governor.Limiter("openai", 0, 8))
+
+    monkeypatch.setattr(airtable_client, "API_URL", f"{server.url}/v0")
+    monkeypatch.setattr(airtable_client, "BASE_ID", "appTest")
+    monkeypatch.setattr(airtable_client, "_cache", {})
+    monkeypatch.setitem(airtable_client.session.headers, "Authorization", "Bearer test")
+    monkeypatch.setattr(airtable_mirror, "SYNC_INTERVAL", 0)
+    monkeypatch.setattr(airtable_mirror, "_local", threading.local())
+    monkeypatch.setattr(airtable_mirror, "_checked", {})
+
+    server.openai.plan = {"products_needed": True, "trends_needed": True}
+    server.openai.calls.clear()
+    instrumentation.reset()
+    yield server.openai
+    instrumentation.reset()
+
+
+def kind(call):
+    if '"products_needed"' in call["prompt"]:
+        return "plan"
+    if "You are writing a new article" in call["prompt"]:
+        return "write"
+    if '"selected_product_lines"' in call["prompt"]:
+        return "select"
+    return None
+
+def calls(openai, stage):
+    return [c for c in openai.calls if kind(c) == stage]
+
+def run(monkeypatch, mode):
+    monkeypatch.setattr(article_generator, "PLAN_MODE", mode)
+    article = article_generator.generate_article()
+    assert "skipped" not in article
+    return article
+
+
+@pytest.mark.parametrize("mode", article_generator.PLAN_MODES)
+def test_each_stage_uses_its_model(openai, monkeypatch, mode):
+    run(monkeypatch, mode)
+    assert openai.calls
+    for call in openai.calls:
+        assert kind(call) is not None
+        assert call["model"] == MODELS[kind(call)]
+
+def test_sequential_selects_after_the_plan(openai, monkeypatch):
+    openai.plan["trends_needed"] = False
+    run(monkeypatch, "sequential")
+    assert [kind(c) for c in openai.calls] == ["plan", "select", "write"]
+    assert not TREND_LINE.search(calls(openai, "select")[0]["prompt"])
+
+def test_speculative_keeps_the_selection_when_trends_are_needed(openai, monkeypatch):
+    run(monkeypatch, "speculative")
+    assert len(calls(openai, "plan")) == 1
+    [select] = calls(openai, "select")
+    assert TREND_LINE.search(select["prompt"])
+    assert TREND_LINE.search(calls(openai, "write")[0]["prompt"])
+
+def test_speculative_reselects_without_trends_when_not_needed(openai, monkeypatch):
+    openai.plan["trends_needed"] = False
+    run(monkeypatch, "speculative")
+    assert len(calls(openai, "plan")) == 1
+    draft, redo = calls(openai, "select")
+    assert TREND_LINE.search(draft["prompt"])
+    assert not TREND_LINE.search(redo["prompt"])
+    assert not TREND_LINE.search(calls(openai, "write")[0]["prompt"])
+
+@pytest.mark.parametrize("trends", [True, False])
+def test_merged_makes_no_plan_call(openai, monkeypatch, trends):
+    openai.plan["trends_needed"] = trends
+    run(monkeypatch, "merged")
+    assert [kind(c) for c in openai.calls] == ["select", "write"]
+    assert 'add "trends_needed"' in openai.calls[0]["prompt"]
+    assert bool(TREND_LINE.search(openai.calls[1]["prompt"])) == trends
+
+def test_llm_stats_per_call_and_model(openai, monkeypatch):
+    run(monkeypatch, "sequential")
+    stats = {(row["call"], row["model"]): row for row in instrumentation.llm_stats()}
+    for stage in ("plan", "select", "write"):
+        row = stats[(stage, MODELS[stage])]
+        sent = calls(openai, stage)
+        assert row["calls"] == len(sent) == 1
+        assert row["prompt_tokens"] == sum(c["usage"]["prompt_tokens"] for c in sent)
+        assert row["completion_tokens"] == sum(c["usage"]["completion_tokens"] for c in sent)
+    # Stand-in latency is 50 ms for the plan model, 150 ms for the write model and none for the select model
+    plan, select, write = (stats[(s, MODELS[s])]["avg_ms"] for s in ("plan", "select", "write"))
+    assert 45 <= plan < write
+    assert write >= 135
+    assert select < plan
@@ -0,0 +1,168 @@
+import json
+import pytest
+import governor
+import product_http
+import get_products
+from conftest import fixture_text
+
+LINK = "https://primacol.com/en-pl/products/chalk-paint"
+INCOMPLETE_LINK = "https://primacol.com/en-pl/products/wood-oil-teak"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class Pages(dict):
+    """url -> FakeResponse served to product_http, plus the (url, headers) it requested"""
+
+    def __init__(self):
+        super().__init__()
+        self.requested = []
+
+    def request(self, service, session, method, url, **kwargs):
+        self.requested.append((url, kwargs.get("headers") or {}))
+        return self.get(url) or FakeResponse(404)
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    pages = Pages()
+    monkeypatch.setattr(governor, "request", pages.request)
+    return pages
+
+
+# ---------- PARSING ----------
+
+def test_parse_full_product_page():
+    item = product_http.parse_product_html(fixture_text("pages", "product_full.html"), LINK)
+
+    assert item["line"] == "Chalk Paint"
+    assert item["url"] == LINK
+    assert item["colorways"] == "Linen White, Graphite, Sage Green, Dusty Pink"
+    description = item["description"].split("\n")
+    assert description[0] == "A matte, velvety paint for furniture and walls that needs no sanding or primer."
+    assert "1. Application" in description
+    assert "Apply with a brush in thin layers, 2 coats are usually enough." in description
+    assert "Touch dry: 30 minutes" in description and "Recoat: 2 hours" in description
+    # Section "5." stays collapsed in the browser: neither its title nor its content is kept
+    assert not any(line.startswith("5.") for line in description)
+    assert "Download the SDS from the documents section." not in item["description"]
+    assert product_http.is_complete(item)
+
+def test_parse_incomplete_product_page():
+    item = product_http.parse_product_html(fixture_text("pages", "product_incomplete.html"), INCOMPLETE_LINK)
+
+    assert item["line"] == "Wood Oil Teak"
+    assert item["colorways"] == "Teak, Natural"
+    assert item["description"] == ""
+    assert not product_http.is_complete(item)
+
+def test_parse_product_json():
+    data = json.loads(fixture_text("pages", "product_incomplete.json"))
+    item = product_http.parse_product_json(data, INCOMPLETE_LINK)
+
+    assert item["line"] == "Wood Oil Teak"
+    assert item["colorways"] == "Teak, Natural"
+    assert item["description"].split("\n") == [
+        "Penetrating oil for garden furniture and decking.",
+        "Application",
+        "Apply with a brush along the grain",
+        "Wipe off the excess after 15 minutes",
+    ]
+
+def test_parse_product_links():
+    links = product_http.parse_product_links(fixture_text("pages", "collection.html"), "https://primacol.com/en-pl/collections/collections")
+
+    # Menu links only, absolute, deduplicated; colour-swatch card links and non-product links are skipped
+    assert links == {
+        "https://primacol.com/en-pl/products/chalk-paint",
+        "https://primacol.com/en-pl/products/wood-oil-teak",
+        "https://primacol.com/en-pl/products/microcement-set",
+    }
+
+# ---------- FALLBACK DECISION ----------
+
+def test_complete_page_needs_no_fallback(pages):
+    pages[LINK] = FakeResponse(text=fixture_text("pages", "product_full.html"), headers={"ETag": '"v1"'})
+
+    item, validator = product_http.scrape_product(LINK)
+
+    assert item["line"] == "Chalk Paint"
+    assert validator == {"etag": '"v1"', "last_modified": None}
+    assert [url for url, _ in pages.requested] == [LINK]
+
+def test_incomplete_page_is_filled_from_product_json(pages):
+    pages[INCOMPLETE_LINK] = FakeResponse(text=fixture_text("pages", "product_incomplete.html"))
+    pages[INCOMPLETE_LINK + ".json"] = FakeResponse(text=fixture_text("pages", "product_incomplete.json"))
+
+    item, _ = product_http.scrape_product(INCOMPLETE_LINK)
+
+    assert item["line"] == "Wood Oil Teak"
+    assert item["description"].startswith("Penetrating oil for garden furniture and decking.")
+    assert [url for url, _ in pages.requested] == [INCOMPLETE_LINK, INCOMPLETE_LINK + ".json"]
+
+def test_incomplete_page_without_json_goes_to_the_browser(pages):
+    pages[LINK] = FakeResponse(text=fixture_text("pages", "product_full.html"))
+    pages[INCOMPLETE_LINK] = FakeResponse(text=fixture_text("pages", "product_incomplete.html"))
+
+    assert product_http.scrape_product(INCOMPLETE_LINK)[0] is None
+    items, missing, unchanged, _ = product_http.scrape_links([LINK, INCOMPLETE_LINK])
+    assert [i["line"] for i in items] == ["Chalk Paint"]
+    assert missing == [INCOMPLETE_LINK]
+    assert unchanged == []
+
+def test_not_modified_page_is_skipped(pages):
+    pages[LINK] = FakeResponse(304)
+    validator = {"etag": '"v1"', "last_modified": "Sat, 17 Oct 2026 10:00:00 GMT"}
+
+    items, missing, unchanged, page_validators = product_http.scrape_links([LINK], {LINK: validator})
+
+    assert (items, missing, unchanged) == ([], [], [LINK])
+    assert page_validators == {LINK: validator}
+    assert pages.requested[0][1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT"}
+
+# ---------- BACKEND CHOICE ----------
+
+def test_auto_backend_uses_the_browser_when_chrome_is_installed(monkeypatch):
+    monkeypatch.setattr(get_products, "INSTALL_CHROME", True)
+    assert get_products.resolve_backend("auto") == "auto"
+    assert get_products.resolve_backend("selenium") == "selenium"
+
+def test_auto_backend_skips_the_browser_without_chrome(monkeypatch):
+    monkeypatch.setattr(get_products, "INSTALL_CHROME", False)
+    assert get_products.resolve_backend("auto") == "http"
+    with pytest.raises(ValueError):
+        get_products.resolve_backend("selenium")
+
+def test_incomplete_pages_fail_instead_of_launching_chrome(monkeypatch, pages):
+    monkeypatch.setattr(get_products, "INSTALL_CHROME", False)
+    monkeypatch.setattr(get_products, "CONDITIONAL_GET", False)
+    monkeypatch.setattr(get_products, "new_driver", lambda: pytest.fail("Chrome was launched"))
+    synced = {}
+    monkeypatch.setattr(get_products.product_sync, "sync", lambda data, **kwargs: synced.update(data=data, **kwargs) or {})
+    collection_url = get_products.markets.get("PL")["collection_url"]
+    pages[collection_url] = FakeResponse(text=fixture_text("pages", "collection.html"))
+    base = get_products.markets.shop_prefix("PL") + "products/"
+    pages[base + "chalk-paint"] = FakeResponse(text=fixture_text("pages", "product_full.html"))
+    pages[base + "wood-oil-teak"] = FakeResponse(text=fixture_text("pages", "product_incomplete.html"))
+    pages[base + "microcement-set"] = FakeResponse(text=fixture_text("pages", "product_full.html"))
+
+    report = get_products.main(backend="auto", market="PL")
+
+    assert sorted(f["url"] for f in report["failures"]) == [base + "wood-oil-teak"]
+    assert len(synced["data"]) == 2
@@ -0,0 +1,55 @@
+import pytest
+import product_sync
+
+SHOP = "https://primacol.com/en-pl/products/"
+
+
+def records(count):
+    return [
+        {"id": f"rec{i}", "fields": {"url": f"{SHOP}p{i}", "line": f"Product {i}", "colorways": "", "description": "text"}}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def existing(monkeypatch):
+    rows = records(40)
+    monkeypatch.setattr(product_sync.airtable_client, "fetch_records", lambda *args, **kwargs: rows)
+    return rows
+
+
+def test_no_link_list_deletes_nothing(existing):
+    report = product_sync.sync([], all_links=None, dry_run=True, market="PL")
+    assert report["deleted"] == 0
+
+def test_empty_link_list_is_refused(existing):
+    with pytest.raises(product_sync.SyncRefused):
+        product_sync.sync([], all_links=set(), dry_run=True, market="PL")
+
+def test_deletes_above_the_limit_are_refused(existing):
+    live = {r["fields"]["url"] for r in existing[:15]}
+    with pytest.raises(product_sync.SyncRefused):
+        product_sync.sync([], all_links=live, dry_run=True, market="PL", max_delete_fraction=0.5)
+
+def test_deletes_within_the_limit_go_ahead(existing):
+    live = {r["fields"]["url"] for r in existing[:35]}
+    report = product_sync.sync([], all_links=live, dry_run=True, market="PL", max_delete_fraction=0.5)
+    assert report["deleted"] == 5
+
+def test_other_markets_are_not_counted(existing):
+    # Every existing record belongs to PL, so a DE scrape neither deletes nor trips the guard
+    report = product_sync.sync([], all_links=set(), dry_run=True, market="DE")
+    assert report["deleted"] == 0
+
+def test_unchanged_page_without_a_record_is_rescraped(existing, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for name in ("create_records", "update_records", "delete_records"):
+        monkeypatch.setattr(product_sync.airtable_mirror, name, lambda *args, **kwargs: [])
+    gone, kept = f"{SHOP}deleted-by-hand", existing[0]["fields"]["url"]
+    product_sync.save_snapshot({url: {"etag": '"v1"', "record_id": "recX"} for url in (gone, kept)})
+
+    report = product_sync.sync([], all_links=None, unchanged=[gone, kept], market="PL")
+
+    assert report["missing"] == [gone]
+    assert report["unchanged"] == 1
+    assert set(product_sync.validators(product_sync.load_snapshot())) == {kept}
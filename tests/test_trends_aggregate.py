@@ -0,0 +1,39 @@
+import pytest
+import trends_aggregate
+
+
+def related(top=(), rising=()):
+    return {
+        "top": [{"query": q, "value": v} for q, v in top],
+        "rising": [{"query": q, "value": v} for q, v in rising],
+    }
+
+
+def test_spellings_merge_into_one_query():
+    result = trends_aggregate.aggregate({
+        "farba": related(top=[("Wall Paint!", 40)]),
+        "lakier": related(top=[("wall  paint", 60)], rising=[("floor varnish", 20)]),
+    }, policy="max")
+
+    assert result["key"] == ["wall paint", "floor varnish"]
+    assert result["query"] == ["Wall Paint!", "floor varnish"]
+    assert result["score"].tolist() == [60 * trends_aggregate.TOP_WEIGHT, 20 * trends_aggregate.RISING_WEIGHT]
+    assert result["seeds"].tolist() == [2, 1]
+
+def test_sum_policy_adds_seed_scores():
+    result = trends_aggregate.aggregate({
+        "farba": related(top=[("wall paint", 40)]),
+        "lakier": related(top=[("wall paint", 60)]),
+    }, policy="sum")
+    assert result["score"].tolist() == [100 * trends_aggregate.TOP_WEIGHT]
+
+@pytest.mark.parametrize("per_keyword", [
+    {},
+    {"a": related()},
+    {"a": related(top=[("???", 1)])},
+    {"a": related(top=[("🎨🖌", 5)], rising=[("!!", 3)]), "b": related(top=[("--", 2)])},
+])
+def test_no_usable_queries_gives_an_empty_result(per_keyword):
+    result = trends_aggregate.aggregate(per_keyword)
+    assert result["key"] == [] and result["query"] == []
+    assert len(result["score"]) == 0 and len(result["seeds"]) == 0
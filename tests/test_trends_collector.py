@@ -0,0 +1,41 @@
+import governor
+import trends_collector
+from benchmarks.fake_trends import FakeTrendReq
+
+
+class TooManyRequestsError(Exception):
+    pass
+
+
+class FlakyTrendReq(FakeTrendReq):
+    """Answers 429 to the first `failures` related_queries calls"""
+
+    def __init__(self, failures):
+        super().__init__(fixture={})
+        self.failures = failures
+
+    def related_queries(self):
+        if self.failures:
+            self.failures -= 1
+            raise TooManyRequestsError("429")
+        return super().related_queries()
+
+
+def collect_with_limiter(monkeypatch, tmp_path, rate):
+    monkeypatch.setitem(governor._limiters, "google_trends", governor.Limiter("google_trends", rate, 3, 60))
+    checkpoint = trends_collector.Checkpoint(path=str(tmp_path / "checkpoint.json"))
+    backoff = trends_collector.AdaptiveBackoff(min_delay=0, max_delay=0)
+    return trends_collector.collect_country("PL", ["farba", "lakier"], checkpoint, lambda: FlakyTrendReq(1), backoff)
+
+def test_429_with_the_rate_limit_disabled_is_retried(monkeypatch, tmp_path):
+    # TRENDS_RATE_LIMIT=0 leaves the limiter without a bucket to pause
+    results, failed = collect_with_limiter(monkeypatch, tmp_path, rate=0)
+    assert sorted(results) == ["farba", "lakier"]
+    assert failed == []
+
+def test_429_pauses_the_shared_bucket(monkeypatch, tmp_path):
+    paused = []
+    monkeypatch.setattr(governor.TokenBucket, "pause", lambda self, seconds: paused.append(seconds))
+    results, failed = collect_with_limiter(monkeypatch, tmp_path, rate=1)
+    assert sorted(results) == ["farba", "lakier"]
+    assert len(paused) == 1
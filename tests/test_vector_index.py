@@ -0,0 +1,34 @@
+import numpy as np
+from vector_index import VectorIndex
+import backlog_index
+
+
+def index_of(tmp_path, rows):
+    index = VectorIndex(str(tmp_path / "index"))
+    index.update([(f"rec{i}", fields, vector) for i, (fields, vector) in enumerate(rows)])
+    return index
+
+
+def test_search_and_nearest_respect_the_row_filter(tmp_path):
+    index = index_of(tmp_path, [
+        ({"title": "pl", "market": "PL"}, [1, 0, 0]),
+        ({"title": "uk", "market": "UK"}, [0.9, 0.1, 0]),
+        ({"title": "shared"}, [0, 1, 0]),
+    ])
+    keep = backlog_index.in_market("UK")
+
+    assert [f["title"] for _, f in index.search([1, 0, 0], top_k=3)] == ["pl", "uk", "shared"]
+    assert [f["title"] for _, f in index.search([1, 0, 0], top_k=3, keep=keep)] == ["uk", "shared"]
+    assert index.nearest([[1, 0, 0]], keep=keep)[0][1]["title"] == "uk"
+    assert index.nearest([[1, 0, 0]], keep=lambda f: False) == [None]
+    assert index.search([1, 0, 0], keep=lambda f: False) == []
+
+def test_saved_index_reloads_in_another_instance(tmp_path):
+    index = index_of(tmp_path, [({"title": "a"}, [1, 0]), ({"title": "b"}, [0, 1])])
+    other = VectorIndex(index.path)
+    assert other.ids == index.ids and other.version == index.version
+    # An update through the first instance is picked up, not overwritten, by the second
+    index.update([("rec9", {"title": "c"}, [1, 1])])
+    other.update(deletes=["rec0"])
+    assert sorted(VectorIndex(index.path).ids) == ["rec1", "rec9"]
+    assert np.allclose(np.linalg.norm(VectorIndex(index.path).matrix, axis=1), 1)
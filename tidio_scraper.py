@@ -1,63 +1,287 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-import csv
-import time
-import os
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+import os
+import csv
+import json
+import queue
+import hashlib
+import argparse
+import logging
+import threading
 from dotenv import load_dotenv
+from get_products import new_driver, discard_if_dead
+from instrumentation import span, incr
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
 EMAIL = os.environ.get('EMAIL')
 PASSWORD = os.environ.get('PASSWORD')
 LOGIN_URL = "https://tidio.com/panel/login"
 DATA_SOURCES_URL = "https://tidio.com/panel/lyro-ai/data-sources/added?item_type=qa"
+CSV_PATH = os.environ.get("TIDIO_CSV_PATH", "tidio_datasources_export.csv")
+CHECKPOINT_PATH = os.environ.get("TIDIO_CHECKPOINT_PATH", ".cache/tidio_checkpoint.json")
+TIDIO_WORKERS = int(os.environ.get("TIDIO_WORKERS", 4))  # parallel browsers, each exporting whole pages
+TIDIO_RETRIES = int(os.environ.get("TIDIO_RETRIES", 2))  # extra attempts per failing page
+PAGE_TIMEOUT = int(os.environ.get("TIDIO_PAGE_TIMEOUT", 15))
+
+FIELDS = ["Id", "Question", "Answer"]
+ROW_SELECTOR = "tr[data-testid^='table-row-']"
+ANSWER_SELECTOR = "form div[role='textbox'] div[data-slate-node='element']"
+
+
+class Checkpoint:
+    """Fingerprints of exported rows, plus the pages an unfinished run already wrote.
+
+    rows maps Tidio row id -> fingerprint of the row as listed in the table;
+    a row whose fingerprint is unchanged is not reopened. pages maps the page
+    numbers finished by the current run to the row ids seen on them, so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"rows": {}, "pages": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    @property
+    def is_empty(self):
+        return not (self.data["rows"] or self.data["pages"])
+
+    def pages_done(self):
+        return {int(p) for p in self.data["pages"]}
+
+    def seen_ids(self):
+        return {i for ids in self.data["pages"].values() for i in ids}
+
+    def unchanged(self, row_id, fingerprint):
+        return self.data["rows"].get(row_id) == fingerprint
+
+    def put_page(self, page, fingerprints):
+        with self.lock:
+            self.data["rows"].update(fingerprints)
+            self.data["pages"][str(page)] = list(fingerprints)
+            self.save()
+
+    def finish(self):
+        """End of a complete run: forget rows Tidio no longer lists and reset page progress"""
+        with self.lock:
+            live = self.seen_ids()
+            self.data = {"rows": {i: fp for i, fp in self.data["rows"].items() if i in live}, "pages": {}}
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.data = {"rows": {}, "pages": {}}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+# ---------- BROWSER ----------
+
+def login(driver):
+    """Sign in with EMAIL/PASSWORD; returns the session cookies for other browsers"""
+    if not EMAIL or not PASSWORD:
+        raise ValueError("Missing EMAIL or PASSWORD in environment variables")
+    wait = WebDriverWait(driver, PAGE_TIMEOUT)
+    driver.get(LOGIN_URL)
+    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'input[aria-label="Email input field"]'))).send_keys(EMAIL)
+    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'input[aria-label="Password input field"]'))).send_keys(PASSWORD)
+    wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[type="submit"]'))).click()
+    wait.until(lambda d: "/login" not in d.current_url)
+    return driver.get_cookies()
+
+def share_session(driver, cookies):
+    """Reuse an authenticated session in another browser instead of logging in again"""
+    driver.get(LOGIN_URL)  # cookies can only be set for the origin currently open
+    driver.delete_all_cookies()
+    for cookie in cookies:
+        driver.add_cookie({k: v for k, v in cookie.items() if k != "sameSite"})
+
+def page_url(page):
+    return f"{DATA_SOURCES_URL}&page={page}"
+
+def open_page(driver, page):
+    driver.get(page_url(page))
+    WebDriverWait(driver, PAGE_TIMEOUT).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, ROW_SELECTOR)))
+
+def count_pages(driver):
+    """Highest page number in the pagination bar of the open list"""
+    labels = [a.get_attribute("aria-label") or "" for a in driver.find_elements(By.CSS_SELECTOR, 'a[aria-label^="Page "]')]
+    numbers = [int(l.split()[-1]) for l in labels if l.split()[-1].isdigit()]
+    return max(numbers, default=1)
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def read_answer(driver, entry):
+    """Open a row in the side form and return its answer once it has replaced the previous one"""
+    previous = driver.find_elements(By.CSS_SELECTOR, ANSWER_SELECTOR)
+    entry.find_element(By.XPATH, "./td[2]").click()
+    wait = WebDriverWait(driver, PAGE_TIMEOUT)
+    if previous:
+        try:
+            wait.until(EC.staleness_of(previous[0]))
+        except TimeoutException:
+            pass  # the form kept its node; the text below is still the freshly opened row's
+    return wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, ANSWER_SELECTOR))).text
+
+def scrape_page(driver, page, checkpoint, full=False):
+    """Export one list page: returns (new or changed rows, {row id: fingerprint} for every listed row)"""
+    with span("tidio_page"):
+        open_page(driver, page)
+        rows, fingerprints = [], {}
+        for entry in driver.find_elements(By.CSS_SELECTOR, ROW_SELECTOR):
+            row_id = entry.get_attribute("data-testid").removeprefix("table-row-")
+            fingerprints[row_id] = fingerprint(entry.text)
+            if not full and checkpoint.unchanged(row_id, fingerprints[row_id]):
+                continue
+            question = entry.find_element(By.CSS_SELECTOR, "td p:first-of-type").text.strip()
+            rows.append({"Id": row_id, "Question": question, "Answer": read_answer(driver, entry).strip()})
+    return rows, fingerprints
+
+# ---------- CSV ----------
+
+def csv_header(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), None)
+
+def open_csv(path, fresh):
+    """Append handle on the export; a fresh export starts the file over"""
+    if fresh:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(FIELDS)
+    return open(path, "a", newline="", encoding="utf-8")
+
+def compact_csv(path, live_ids):
+    """Keep the newest row per Id, drop rows Tidio no longer lists, preserve first-seen order"""
+    latest = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["Id"] in live_ids:
+                latest[row["Id"]] = row  # dict keeps the first insertion position
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(latest.values())
+    os.replace(tmp, path)
+    return len(latest)
+
+# ---------- EXPORT ----------
+
+def export(path=CSV_PATH, workers=None, full=False, retries=None):
+    """Export every Q/A data source to path, reopening only new or changed rows.
+
+    Pages are shared out to `workers` browsers that reuse one login. Rows are
+    appended (CSV-quoted) as each page finishes and the page is checkpointed,
+    so an interrupted export resumes with the pages it had not written yet.
+    The file is compacted to one row per Id once every page succeeded.
+    Returns a report of what was exported.
+    """
+    workers = workers or TIDIO_WORKERS
+    retries = TIDIO_RETRIES if retries is None else retries
+    checkpoint = Checkpoint()
+    if full or csv_header(path) != FIELDS:
+        # Without Id columns (e.g. the old Question,Answer export) no row can be matched; start over
+        checkpoint.clear()
+
+    driver = new_driver()
+    try:
+        cookies = login(driver)
+        open_page(driver, 1)
+        pages = count_pages(driver)
+    except Exception:
+        driver.quit()
+        raise
+    done = checkpoint.pages_done()
+    work = queue.Queue()
+    for page in range(1, pages + 1):
+        if page not in done:
+            work.put((page, 1))
+    logger.info(f"Tidio export: {pages} pages, {len(done)} already done, {work.qsize()} to fetch with {workers} browsers")
+
+    out = open_csv(path, fresh=checkpoint.is_empty)
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    lock = threading.Lock()
+    exported, failures = [0], []
+
+    def worker(driver):
+        try:
+            while True:
+                try:
+                    page, attempt = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    if driver is None:
+                        driver = new_driver()
+                        share_session(driver, cookies)
+                    rows, fingerprints = scrape_page(driver, page, checkpoint, full=full)
+                    with lock:
+                        writer.writerows(rows)
+                        out.flush()
+                        exported[0] += len(rows)
+                    # Only after the rows are on disk, so a crash re-fetches instead of losing them
+                    checkpoint.put_page(page, fingerprints)
+                    logger.info(f"Page {page}/{pages}: {len(rows)} new or changed of {len(fingerprints)}")
+                except Exception as e:
+                    if isinstance(e, WebDriverException):
+                        driver = discard_if_dead(driver)
+                    if attempt <= retries:
+                        incr("retries_total", service="tidio")
+                        logger.info(f"Retrying page {page} (attempt {attempt} failed: {type(e).__name__})")
+                        work.put((page, attempt + 1))
+                    else:
+                        logger.error(f"Failed to export page {page} after {attempt} attempts: {e}")
+                        with lock:
+                            failures.append({"page": page, "error": f"{type(e).__name__}: {e}", "attempts": attempt})
+                finally:
+                    work.task_done()
+        finally:
+            if driver is not None:
+                driver.quit()
 
+    # The login browser becomes the first worker; the others pick up its cookies
+    count = max(1, min(workers, work.qsize()))
+    threads = [threading.Thread(target=worker, args=(driver if i == 0 else None,), name=f"tidio-{i}") for i in range(count)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        out.close()
 
+    report = {"pages": pages, "exported": exported[0], "failures": failures}
+    if not failures:
+        report["rows"] = compact_csv(path, checkpoint.seen_ids())
+        checkpoint.finish()
+    logger.info(f"Tidio export: {json.dumps(report)}")
+    return report
 
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export Tidio Lyro Q/A data sources to CSV")
+    parser.add_argument("csv", nargs="?", default=CSV_PATH)
+    parser.add_argument("--workers", type=int, default=TIDIO_WORKERS, help="parallel browsers")
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and reopen every row")
+    args = parser.parse_args()
+    print(export(args.csv, workers=args.workers, full=args.full))
 
-driver = webdriver.Chrome()
-driver.get(LOGIN_URL)
-wait = WebDriverWait(driver, 15)  # max 15 sekund czekania
-email_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'input[aria-label="Email input field"]')))
-email_input.send_keys(EMAIL)
-time.sleep(3)
-password_input = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'input[aria-label="Password input field"]')))
-password_input.send_keys(PASSWORD)
-time.sleep(5)
-submit_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[type="submit"]')))
-submit_button.click()
-time.sleep(5)
-driver.get(DATA_SOURCES_URL)
-time.sleep(5)
-driver.find_element(By.CSS_SELECTOR, 'a[aria-label="Page 13"]').click()
-time.sleep(5)
-
-data = []
-indeks = 1
-while True:
-    # ZBIERAJ PYTANIA I ODPOWIEDZI Z DANEJ STRONY
-    entries = driver.find_elements(By.CSS_SELECTOR, "tr[data-testid^='table-row-']")
-    for entry in entries:
-        question = entry.find_element(By.CSS_SELECTOR, "td p:first-of-type").text
-        entry.find_element(By.XPATH, "./td[2]").click()
-        time.sleep(3)
-        answer = driver.find_element(By.CSS_SELECTOR, "form div[role='textbox'] div[data-slate-node='element']").text
-        data.append([question.replace('\n', ' ').replace(',', ' '), answer.replace('\n', ' ').replace(',', ' ')])
-        print(indeks)
-        indeks += 1
-    break
-    # # SZUKAJ LINKU rel="next" I PRZECHODŹ DALEJ
-    # try:
-    #     next_link = driver.find_element(By.CSS_SELECTOR, 'a[rel="next"]')
-    #     next_link.click()
-    #     time.sleep(3)
-    # except:
-    #     break  # Nie ma następnej strony, kończymy
-
-with open('tidio_datasources_export.csv', 'w', newline='', encoding='utf-8') as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(['Question', 'Answer'])
-    writer.writerows(data)
-
-driver.quit()
+if __name__ == "__main__":
+    main()
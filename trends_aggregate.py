@@ -0,0 +1,92 @@
+import os, re, unicodedata
+import numpy as np
+
+# ---------- CONFIG ----------
+TOP_WEIGHT = 0.75
+RISING_WEIGHT = 1.25
+# How scores of the same query from several seed keywords combine:
+#   max     - strongest single signal (default)
+#   sum     - queries related to many seeds rank higher
+#   decayed - sum, plus the previous upload's score decayed by its age in days
+SCORING = os.environ.get("TRENDS_SCORING", "max")
+HALF_LIFE_DAYS = float(os.environ.get("TRENDS_DECAY_HALF_LIFE", 3))
+POLICIES = ("max", "sum", "decayed")
+
+
+def normalize_query(text):
+    """Case, Unicode-form and punctuation insensitive key, so "Wall Paint!" and "wall  paint" merge"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def to_columns(per_keyword):
+    """Flatten {seed: {"top": [...], "rising": [...]}} into parallel arrays, one entry per related query"""
+    queries, values, weights, seeds = [], [], [], []
+    for seed, related in enumerate(per_keyword.values()):
+        for part, weight in (("top", TOP_WEIGHT), ("rising", RISING_WEIGHT)):
+            rows = related.get(part) or []
+            queries.extend(r["query"] for r in rows)
+            values.extend(r["value"] for r in rows)
+            weights.extend([weight] * len(rows))
+            seeds.extend([seed] * len(rows))
+    return {
+        "query": np.array(queries, dtype=object),
+        "value": np.array(values, dtype=np.float64),
+        "weight": np.array(weights, dtype=np.float64),
+        "seed": np.array(seeds, dtype=np.int64),
+    }
+
+def aggregate(per_keyword, policy=None, previous=None, half_life=None):
+    """Merge all seed results of one country into one score per normalized query.
+
+    previous maps normalized query -> (score, age in days) from the last
+    upload and only matters for the "decayed" policy. Returns columns
+    {"query", "key", "score", "seeds"} sorted by score, highest first; query
+    is the first spelling seen and seeds counts the seed keywords that
+    surfaced it.
+    """
+    policy = policy or SCORING
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown trends scoring policy {policy!r}, expected one of {POLICIES}")
+    empty = {"query": [], "key": [], "score": np.zeros(0), "seeds": np.zeros(0, dtype=np.int64)}
+    cols = to_columns(per_keyword)
+    if not len(cols["query"]):
+        return empty
+
+    # Normalize each distinct spelling once; seeds repeat the same queries a lot
+    spellings, spelling_of = np.unique(cols["query"].astype(str), return_inverse=True)
+    keys = np.array([normalize_query(q) for q in spellings], dtype=object)[spelling_of]
+    keep = keys != ""
+    if not keep.any():
+        return empty  # e.g. only "???" or emoji queries
+    keys = keys[keep]
+    cols = {k: v[keep] for k, v in cols.items()}
+    unique, group = np.unique(keys, return_inverse=True)
+    weighted = cols["value"] * cols["weight"]
+
+    if policy == "max":
+        score = np.full(len(unique), -np.inf)
+        np.maximum.at(score, group, weighted)
+    else:
+        score = np.bincount(group, weights=weighted, minlength=len(unique))
+    if policy == "decayed" and previous:
+        half_life = half_life or HALF_LIFE_DAYS
+        prev_keys = np.array(list(previous), dtype=object)
+        prev_score, prev_age = np.array(list(previous.values()), dtype=np.float64).T
+        at = np.searchsorted(unique, prev_keys).clip(max=len(unique) - 1)
+        found = unique[at] == prev_keys
+        np.add.at(score, at[found], prev_score[found] * 0.5 ** (prev_age[found] / half_life))
+
+    # Display the first spelling of each query and count distinct seeds per query
+    first = np.full(len(unique), len(keys))
+    np.minimum.at(first, group, np.arange(len(keys)))
+    pairs = np.unique(group * (cols["seed"].max() + 1) + cols["seed"])
+    seeds = np.bincount(pairs // (cols["seed"].max() + 1), minlength=len(unique))
+
+    order = np.argsort(-score, kind="stable")
+    return {
+        "query": cols["query"][first][order].tolist(),
+        "key": unique[order].tolist(),
+        "score": score[order],
+        "seeds": seeds[order],
+    }
@@ -0,0 +1,160 @@
+import os, json, time, random, logging, threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import span, incr
+import governor
+
+logger = logging.getLogger(__name__)
+
+# ---------- CONFIG ----------
+BATCH_SIZE = 5  # pytrends accepts at most 5 keywords per payload
+MIN_DELAY = float(os.environ.get("TRENDS_MIN_DELAY", 10))  # seconds between requests when all is well
+MAX_DELAY = float(os.environ.get("TRENDS_MAX_DELAY", 600))
+MAX_ATTEMPTS = int(os.environ.get("TRENDS_MAX_ATTEMPTS", 6))  # per batch before it is left for the next run
+CHECKPOINT_PATH = os.environ.get("TRENDS_CHECKPOINT_PATH", ".cache/trends_checkpoint.json")
+TIMEFRAME = "now 7-d"
+
+
+def geo_for(country):
+    return "GB" if country == "UK" else country
+
+def default_trend_req():
+    from pytrends.request import TrendReq
+    return TrendReq(hl='pl-PL', tz=120)
+
+def is_rate_limited(error):
+    response = getattr(error, "response", None)
+    return type(error).__name__ == "TooManyRequestsError" or getattr(response, "status_code", None) == 429
+
+
+class AdaptiveBackoff:
+    """Delay between requests that doubles on 429/errors and decays back on success"""
+
+    def __init__(self, min_delay=MIN_DELAY, max_delay=MAX_DELAY):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self.last = None
+
+    def wait(self):
+        if self.last is not None:
+            remaining = self.delay * random.uniform(0.8, 1.2) - (time.monotonic() - self.last)
+            if remaining > 0:
+                time.sleep(remaining)
+        self.last = time.monotonic()
+
+    def success(self):
+        self.delay = max(self.min_delay, self.delay * 0.7)
+
+    def failure(self, rate_limited=True):
+        factor = 2.0 if rate_limited else 1.5
+        self.delay = min(self.max_delay, max(self.delay, self.min_delay) * factor)
+
+
+class Checkpoint:
+    """Per-day record of finished keyword batches so an interrupted run resumes"""
+
+    def __init__(self, path=CHECKPOINT_PATH, run_date=None):
+        self.path = path
+        self.run_date = run_date or datetime.now().strftime('%Y-%m-%d')
+        self.lock = threading.Lock()
+        self.data = {"date": self.run_date, "batches": {}}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("date") == self.run_date:
+                self.data = saved
+
+    def get(self, country, batch):
+        return self.data["batches"].get(country, {}).get("|".join(batch))
+
+    def put(self, country, batch, results):
+        with self.lock:
+            self.data["batches"].setdefault(country, {})["|".join(batch)] = results
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def clear(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def frame_rows(frame):
+    """pytrends DataFrame (or None) -> [{"query", "value"}]"""
+    if frame is None:
+        return []
+    return [{"query": q, "value": float(v)} for q, v in zip(frame["query"].tolist(), frame["value"].tolist())]
+
+def fetch_batch(pytrends, batch, geo):
+    # The governor caps Google Trends requests across all country threads and jobs
+    with span("pytrends", geo=geo), governor.limiter("google_trends").slot():
+        pytrends.build_payload(batch, cat=0, timeframe=TIMEFRAME, geo=geo, gprop='')
+        related = pytrends.related_queries()
+    return {
+        kw: {"top": frame_rows(related[kw]['top']), "rising": frame_rows(related[kw]['rising'])}
+        for kw in batch if kw in related
+    }
+
+def collect_country(country, keywords, checkpoint, trend_req_factory=default_trend_req, backoff=None):
+    """Collect related queries for one country on its own pytrends session"""
+    pytrends = trend_req_factory()
+    backoff = backoff or AdaptiveBackoff()
+    geo = geo_for(country)
+    results, failed = {}, []
+
+    for i in range(0, len(keywords), BATCH_SIZE):
+        batch = keywords[i:i + BATCH_SIZE]
+        done = checkpoint.get(country, batch)
+        if done is not None:
+            results.update(done)
+            continue
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            backoff.wait()
+            try:
+                batch_results = fetch_batch(pytrends, batch, geo)
+            except Exception as e:
+                limited = is_rate_limited(e)
+                backoff.failure(rate_limited=limited)
+                limit = governor.limiter("google_trends")
+                if limited and limit.bucket:
+                    # Every country shares one IP, so a 429 slows all of them down
+                    limit.bucket.pause(backoff.delay)
+                incr("retries_total", service="google_trends", reason="429" if limited else type(e).__name__)
+                logger.info(f"[{country}] batch {batch} attempt {attempt} failed ({'429' if limited else e}); next delay {backoff.delay:.0f}s")
+                continue
+            backoff.success()
+            checkpoint.put(country, batch, batch_results)
+            results.update(batch_results)
+            logger.info(f"[{country}] collected {len(batch)} keywords")
+            break
+        else:
+            failed.extend(batch)
+            logger.info(f"[{country}] giving up on {batch} for this run")
+
+    return results, failed
+
+def collect(search_queries, trend_req_factory=default_trend_req, checkpoint=None, keep_checkpoint=False):
+    """Collect all countries in parallel; returns ({country: {kw: {"top", "rising"}}}, failed keywords).
+
+    The checkpoint is cleared once every batch succeeded, otherwise the next
+    run on the same day picks up only the missing batches. With keep_checkpoint
+    the caller clears it itself, e.g. only after the results were uploaded.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    results, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, len(search_queries))) as pool:
+        futures = {
+            country: pool.submit(collect_country, country, keywords, checkpoint, trend_req_factory)
+            for country, keywords in search_queries.items()
+        }
+        for country, future in futures.items():
+            results[country], failed[country] = future.result()
+
+    if not any(failed.values()) and not keep_checkpoint:
+        checkpoint.clear()
+    return results, {c: kws for c, kws in failed.items() if kws}
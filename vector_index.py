@@ -0,0 +1,190 @@
+import os, json, uuid, fcntl, tempfile, threading
+from contextlib import contextmanager
+import numpy as np
+
+# ---------- VECTOR INDEX ----------
+# Embeddings live in one contiguous float32 matrix (matrix.npy, memory-mapped on
+# load) with L2-normalized rows, so cosine similarity is a single mat-vec product.
+# index.json keeps the Airtable record ids and row fields aligned with the matrix.
+# Several gunicorn workers share one directory: writers hold an exclusive flock on
+# index.lock, readers a shared one. index.json and matrix.version carry the id of
+# the save that wrote them, so a mismatched pair is never loaded.
+
+def normalize(vectors):
+    """L2-normalize rows of a 2D array (or a single vector) as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # (matrix, ids, rows) swapped as one tuple so readers never see a torn update
+        self.snapshot = (np.zeros((0, 0), dtype=np.float32), [], [])
+        self.synced_at = None
+        self.version = None
+        self.load()
+
+    @property
+    def matrix(self):
+        return self.snapshot[0]
+
+    @property
+    def ids(self):
+        return self.snapshot[1]
+
+    @property
+    def rows(self):
+        return self.snapshot[2]
+
+    @property
+    def matrix_path(self):
+        return os.path.join(self.path, "matrix.npy")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, "index.json")
+
+    @property
+    def version_path(self):
+        return os.path.join(self.path, "matrix.version")
+
+    def __len__(self):
+        return len(self.ids)
+
+    @contextmanager
+    def file_lock(self, exclusive):
+        """flock on index.lock, shared across processes using the same directory"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "index.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self):
+        """(matrix, meta) of the saved index, or None when missing, half-written or mismatched"""
+        if not all(os.path.exists(p) for p in (self.matrix_path, self.meta_path, self.version_path)):
+            return None
+        with open(self.version_path, encoding="utf-8") as f:
+            version = f.read().strip()
+        with open(self.meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(self.matrix_path, mmap_mode="r")
+        if matrix.shape[0] != len(meta["ids"]) or meta.get("version") != version:
+            return None
+        return matrix, meta
+
+    def _use(self, matrix, meta):
+        self.snapshot = (matrix, meta["ids"], meta["rows"])
+        self.synced_at = meta.get("synced_at")
+        self.version = meta["version"]
+
+    def load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with self.file_lock(exclusive=False):
+            saved = self._read()
+        # Nothing usable on disk: start from scratch, next refresh rebuilds it
+        if saved:
+            self._use(*saved)
+
+    def _write_tmp(self, prefix, write, binary=False):
+        """Write through a per-process temporary file in the index directory; returns its path"""
+        fd, tmp = tempfile.mkstemp(prefix=prefix, suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+                write(f)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return tmp
+
+    def save(self, matrix, ids, rows, synced_at):
+        """Persist a new version; callers hold the exclusive file lock"""
+        version = uuid.uuid4().hex
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        tmp_matrix = self._write_tmp("matrix.", lambda f: np.save(f, matrix), binary=True)
+        tmp_meta = self._write_tmp("index.", lambda f: json.dump(
+            {"ids": ids, "rows": rows, "synced_at": synced_at, "version": version}, f, ensure_ascii=False))
+        tmp_version = self._write_tmp("version.", lambda f: f.write(version))
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+        os.replace(tmp_version, self.version_path)
+        self._use(np.load(self.matrix_path, mmap_mode="r"), {"ids": ids, "rows": rows, "synced_at": synced_at, "version": version})
+
+    def update(self, upserts=(), deletes=(), synced_at=None):
+        """Apply (id, fields, vector) upserts and id deletes, then persist the index"""
+        with self.lock, self.file_lock(exclusive=True):
+            self._reload_if_changed()
+            deletes = set(deletes)
+            upserts = {rid: (fields, vector) for rid, fields, vector in upserts}
+            old_matrix, old_ids, old_rows = self.snapshot
+            keep = [i for i, rid in enumerate(old_ids) if rid not in deletes and rid not in upserts]
+
+            ids = [old_ids[i] for i in keep] + list(upserts)
+            rows = [old_rows[i] for i in keep] + [fields for fields, _ in upserts.values()]
+            parts = []
+            if keep:
+                parts.append(np.asarray(old_matrix[keep], dtype=np.float32))
+            if upserts:
+                parts.append(normalize([vector for _, vector in upserts.values()]))
+            if parts and len({p.shape[1] for p in parts}) > 1:
+                raise ValueError("Embedding dimension does not match the existing index")
+            matrix = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+            self.save(matrix, ids, rows, synced_at or self.synced_at)
+
+    def _reload_if_changed(self):
+        """Pick up a version another process saved, so its changes are not overwritten"""
+        if not os.path.exists(self.version_path):
+            return
+        with open(self.version_path, encoding="utf-8") as f:
+            if f.read().strip() == self.version:
+                return
+        saved = self._read()
+        if saved:
+            self._use(*saved)
+
+    def _mask(self, rows, keep):
+        """Boolean array of the rows passing keep(fields), or None to use every row"""
+        return None if keep is None else np.fromiter((bool(keep(r)) for r in rows), dtype=bool, count=len(rows))
+
+    def search(self, vector, top_k=5, keep=None):
+        """Return [(similarity, fields)] for the top_k closest rows, only among rows where keep(fields) holds"""
+        matrix, _, rows = self.snapshot
+        if not rows or top_k <= 0:
+            return []
+        query = normalize(vector)
+        if query.shape[-1] != matrix.shape[1]:
+            raise ValueError("Query embedding dimension does not match the index")
+        scores = matrix @ query
+        mask = self._mask(rows, keep)
+        candidates = len(rows)
+        if mask is not None:
+            scores[~mask] = -np.inf
+            candidates = int(mask.sum())
+        k = min(top_k, candidates)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), rows[i]) for i in top]
+
+    def nearest(self, vectors, keep=None):
+        """For each query row return (similarity, fields) of its closest row (among rows where
+        keep(fields) holds), or None if there is none"""
+        matrix, _, rows = self.snapshot
+        queries = normalize(np.atleast_2d(vectors))
+        mask = self._mask(rows, keep)
+        if not rows or (mask is not None and not mask.any()):
+            return [None] * len(queries)
+        scores = queries @ matrix.T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        best = scores.argmax(axis=1)
+        return [(float(scores[i, j]), rows[j]) for i, j in enumerate(best)]